@@ -0,0 +1,153 @@
+from app.instrumentation import registry
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    One streaming client: the keys it follows and its pending updates.
+
+    Pending updates are conflated per key, so a slow client holds at most one
+    update per subscribed key and only ever receives the latest state; the
+    publisher never blocks on it.
+    """
+
+    def __init__(self, keys, loop: asyncio.AbstractEventLoop):
+        self.keys = frozenset(keys)
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> latest update not yet taken
+        self._signalled = False
+
+    def offer(self, key, update):
+        """Queue an update from any thread"""
+        with self._lock:
+            self._pending[key] = update
+            if self._signalled:
+                return
+            self._signalled = True
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # The client's event loop is closed
+            pass
+
+    async def wait(self):
+        await self._ready.wait()
+
+    def take(self):
+        """Return the pending updates and reset"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._signalled = False
+            self._ready.clear()
+        return list(pending.values())
+
+
+class RiskBroadcaster:
+    """
+    In-process fan-out of risk score changes to streaming clients.
+
+    Keys are ("account", login), ("user", user_id) or ("challenge",
+    challenge_id). The cycle publishes everything it committed; only keys
+    someone subscribed to are compared with their last published state, and
+    an update is pushed only when the score or signal set changed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # key -> set of subscribers
+        self._last = {}  # key -> (risk_score, risk_signals) last pushed or snapshotted
+
+    def subscribe(self, keys, loop: asyncio.AbstractEventLoop):
+        """Register a client for `keys`"""
+        subscriber = Subscriber(keys, loop)
+        with self._lock:
+            for key in subscriber.keys:
+                self._subscribers.setdefault(key, set()).add(subscriber)
+        return subscriber
+
+    def seed(self, snapshot):
+        """
+        Record the state a new client starts from, as (key, update) pairs read
+        after subscribing, so only later changes are pushed. Keys published in
+        the meantime keep their newer state.
+        """
+        with self._lock:
+            for key, update in snapshot:
+                if key in self._subscribers:
+                    self._last.setdefault(key, self._state(update))
+
+    def unsubscribe(self, subscriber: Subscriber):
+        with self._lock:
+            for key in subscriber.keys:
+                subscribers = self._subscribers.get(key)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._subscribers[key]
+                    self._last.pop(key, None)
+
+    def subscribed(self, keys=None):
+        """The keys someone follows, among `keys` when given"""
+        with self._lock:
+            if keys is None:
+                return set(self._subscribers)
+            return {key for key in keys if key in self._subscribers}
+
+    @staticmethod
+    def _state(update):
+        return update["risk_score"], tuple(update["risk_signals"])
+
+    def publish(self, items, build):
+        """
+        Push the updates of (key, value) items whose score or signals changed.
+        build(key, value) makes the update payload and is only called for keys
+        someone subscribed to. Returns the number of deliveries.
+        """
+        deliveries = []
+        with self._lock:
+            if not self._subscribers:
+                return 0
+            for key, value in items:
+                subscribers = self._subscribers.get(key)
+                if not subscribers:
+                    continue
+                update = build(key, value)
+                state = self._state(update)
+                if self._last.get(key) == state:
+                    continue
+                self._last[key] = state
+                deliveries.extend((subscriber, key, update) for subscriber in subscribers)
+        for subscriber, key, update in deliveries:
+            subscriber.offer(key, update)
+        PUSHED_UPDATES.inc(len(deliveries))
+        return len(deliveries)
+
+    def __len__(self):
+        with self._lock:
+            return len({subscriber for subscribers in self._subscribers.values() for subscriber in subscribers})
+
+
+def risk_update(scope: str, scope_id: int, timestamp, risk_score: float, risk_signals, last_trade_at):
+    """Payload pushed to streaming clients"""
+    return {
+        "scope": scope,
+        "id": scope_id,
+        "risk_score": risk_score,
+        "risk_signals": list(risk_signals),
+        "last_trade_at": last_trade_at.isoformat() if last_trade_at else None,
+        "timestamp": timestamp.isoformat() if timestamp else None,
+    }
+
+
+risk_broadcaster = RiskBroadcaster()
+
+PUSHED_UPDATES = registry.counter(
+    "risk_stream_updates_total", "Risk updates delivered to streaming clients")
+registry.gauge("risk_stream_clients", "Connected streaming clients", function=lambda: len(risk_broadcaster))
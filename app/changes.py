@@ -0,0 +1,103 @@
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import settings
+from app.database import ReadSessionLocal
+import app.crud as crud
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeFeed:
+    """
+    Follows the risk_changes and config_settings tables, so every worker
+    process learns about the risk rows the leader committed and the settings
+    changed through any worker: caches are invalidated and streaming clients
+    notified in whichever worker they are connected to, and settings reloaded.
+
+    Each worker reads from the newest change that existed when it started,
+    every interval seconds, and skips the changes it wrote itself. A worker
+    that fell behind the retention window (CHANGE_RETENTION) treats every key
+    as changed.
+    """
+
+    def __init__(self, interval: float = None):
+        self.interval = interval or settings.CHANGE_POLL_INTERVAL
+        self.cursor = None  # id of the last change read
+        self.config_version = None  # config_settings version last loaded
+        self.worker_id = None
+        self._on_changes = None
+        self._on_config = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self, worker_id: str, on_changes, on_config):
+        """
+        Load the saved settings right away, then poll in the background.
+        on_changes(keys) gets the set of changed (scope, scope_id) keys, or
+        None when every key may have changed; on_config() runs whenever the
+        saved settings changed and reloads them.
+        """
+        if self._thread is not None:
+            return
+        self.worker_id, self._on_changes, self._on_config = worker_id, on_changes, on_config
+        self.poll()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="risk-change-feed", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.poll()
+            except SQLAlchemyError:
+                logger.exception("Failed to read risk changes")
+            except Exception:
+                logger.exception("Risk change handler failed")
+            if self._stopping.wait(self.interval):
+                return
+
+    def poll(self):
+        """Reload changed settings, then hand the changes committed since the last poll to on_changes"""
+        with ReadSessionLocal() as db:
+            config_version = crud.get_config_version(db)
+        if config_version != self.config_version:
+            self._on_config()
+            self.config_version = config_version
+
+        with ReadSessionLocal() as db:
+            first, last = crud.get_risk_change_bounds(db)
+            if self.cursor is None:
+                self.cursor = last or 0
+                return
+            if last is None or last <= self.cursor:
+                return
+            rows = crud.fetch_risk_changes(db, self.cursor)
+
+        # Changes after the cursor were pruned before this worker read them
+        everything = first > self.cursor + 1
+        keys = set()
+        for row in rows:
+            if row.worker == self.worker_id:
+                continue
+            if (row.scope, row.scope_id) == crud.ALL_CHANGED:
+                everything = True
+            else:
+                keys.add((row.scope, row.scope_id))
+        self.cursor = rows[-1].id
+        if everything:
+            self._on_changes(None)
+        elif keys:
+            self._on_changes(keys)
+
+    def stats(self):
+        return {"running": self._thread is not None, "cursor": self.cursor, "config_version": self.config_version}
+
+
+change_feed = ChangeFeed()
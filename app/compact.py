@@ -0,0 +1,50 @@
+from array import array
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+
+def to_epoch_micros(value) -> int:
+    """Convert a naive datetime, or its SQLite text form, to integer microseconds since epoch"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return (value - EPOCH) // MICROSECOND
+
+
+def from_epoch_micros(value: int) -> datetime:
+    return EPOCH + value * MICROSECOND
+
+
+class TradeWindow:
+    """
+    Column-oriented trade window holding only what the metrics read.
+
+    Values live in typed arrays instead of one ORM object per trade, and
+    timestamps are integer microseconds since epoch, so a window costs a few
+    bytes per trade and duration checks are exact integer comparisons.
+    Trades keep the order they were appended in (closed_at DESC for windows).
+    """
+
+    __slots__ = ("profit", "has_sl", "has_tp", "opened_at", "closed_at")
+
+    def __init__(self):
+        self.profit = array("d")
+        self.has_sl = array("b")
+        self.has_tp = array("b")
+        self.opened_at = array("q")
+        self.closed_at = array("q")
+
+    def append(self, profit: float, price_sl, price_tp, opened_at, closed_at):
+        self.profit.append(profit)
+        self.has_sl.append(price_sl is not None)
+        self.has_tp.append(price_tp is not None)
+        self.opened_at.append(to_epoch_micros(opened_at))
+        self.closed_at.append(to_epoch_micros(closed_at))
+
+    def __len__(self):
+        return len(self.profit)
+
+    @property
+    def last_trade_at(self) -> datetime:
+        return from_epoch_micros(max(self.closed_at)) if self.closed_at else None
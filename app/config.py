@@ -11,6 +11,58 @@ class Settings:
     INITIAL_BALANCE = 100000
     HFT_DURATION = 60  # Seconds
     WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+    WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", 4))  # Concurrent deliveries
+    WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", 10000))
+    WEBHOOK_MAX_RETRIES = int(os.getenv("WEBHOOK_MAX_RETRIES", 3))
+    WEBHOOK_BACKOFF = float(os.getenv("WEBHOOK_BACKOFF", 0.5))  # Seconds, doubled on every retry
+    WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", 5))
+    WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", 1))  # >1 sends {"alerts": [...]} payloads
+
+    # Trade window fetching
+    FETCH_MODE = os.getenv("FETCH_MODE", "bulk")  # "bulk" or "per_account"
+    FETCH_CHUNK_SIZE = int(os.getenv("FETCH_CHUNK_SIZE", 5000))  # Rows streamed per chunk
+    INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", 1000))  # Rows per executemany on ingestion
+    PERSIST_CHUNK_SIZE = int(os.getenv("PERSIST_CHUNK_SIZE", 1000))  # Risk metric rows per executemany
+    RISK_CACHE_SIZE = int(os.getenv("RISK_CACHE_SIZE", 10000))  # Risk reports kept in memory
+    RISK_CACHE_TTL = float(os.getenv("RISK_CACHE_TTL", 300))  # Seconds
+    SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", 1))  # >1 scores shards in a process pool
+    METRICS_ENGINE = os.getenv("METRICS_ENGINE", "python")  # "python", "vectorized" or "rolling"
+    EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", 5000))  # Rows per /export/risk chunk
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")  # Where /admin/profile stores reports
+
+    # Retention of risk_metrics history
+    RETENTION_RAW_HOURS = float(os.getenv("RETENTION_RAW_HOURS", 48))  # Raw rows, then hourly rollups
+    RETENTION_HOURLY_DAYS = float(os.getenv("RETENTION_HOURLY_DAYS", 30))  # Hourly rollups, then daily
+    RETENTION_DAILY_DAYS = float(os.getenv("RETENTION_DAILY_DAYS", 0))  # Daily rollups; 0 keeps them forever
+    COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", 5000))  # Rows per compaction transaction
+    COMPACTION_INTERVAL = float(os.getenv("COMPACTION_INTERVAL", 3600))  # Seconds between compaction runs
+    HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", 100))  # Default /risk/history page size
+
+    # Scheduling of risk cycles
+    SCHEDULER_DEBOUNCE = float(os.getenv("SCHEDULER_DEBOUNCE", 2))  # Seconds of quiet before an event cycle
+    SCHEDULER_PRIORITY_DEBOUNCE = float(os.getenv("SCHEDULER_PRIORITY_DEBOUNCE", 0.2))  # For high-risk accounts
+    SCHEDULER_MAX_DELAY = float(os.getenv("SCHEDULER_MAX_DELAY", 10))  # Longest wait under continuous ingestion
+    SCHEDULER_SWEEP_INTERVAL = float(os.getenv("SCHEDULER_SWEEP_INTERVAL", 300))  # Stale-account sweep
+    SCHEDULER_FULL_SWEEP_INTERVAL = float(os.getenv("SCHEDULER_FULL_SWEEP_INTERVAL", 3600))  # 0 disables
+
+    # Leader election between worker processes
+    LEADER_LEASE_TTL = float(os.getenv("LEADER_LEASE_TTL", 30))  # Seconds a dead leader keeps the lease
+    LEADER_RENEW_INTERVAL = float(os.getenv("LEADER_RENEW_INTERVAL", 10))  # Seconds between lease renewals
+    LEADER_POLL_INTERVAL = float(os.getenv("LEADER_POLL_INTERVAL", 1))  # Seconds between pending_rescores checks
+    CHANGE_POLL_INTERVAL = float(os.getenv("CHANGE_POLL_INTERVAL", 1))  # Seconds between risk_changes checks
+    CHANGE_RETENTION = float(os.getenv("CHANGE_RETENTION", 600))  # Seconds risk_changes rows are kept
+
+    # Live risk stream
+    STREAM_MAX_KEYS = int(os.getenv("STREAM_MAX_KEYS", 1000))  # Accounts, users and challenges per client
+    STREAM_HEARTBEAT = float(os.getenv("STREAM_HEARTBEAT", 15))  # Seconds between keep-alive comments
+
+    # SQLite storage
+    SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL is durable enough under WAL
+    SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 268435456))  # Bytes of the file memory-mapped
+    SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", -65536))  # Pages, or KiB when negative
+    SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # Milliseconds to wait for a lock
+    READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", 8))  # Read-only connections kept for API requests
+    READ_POOL_OVERFLOW = int(os.getenv("READ_POOL_OVERFLOW", 8))  # Extra connections opened under load
 
     # Signal thresholds
     WIN_RATIO_THRESHOLD = 0.3
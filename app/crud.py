@@ -0,0 +1,758 @@
+from itertools import groupby
+from operator import attrgetter, itemgetter
+from sqlalchemy import (select, delete, update, bindparam, func, or_, and_, case, tuple_, type_coerce, String,
+                        literal_column)
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, aliased
+import pandas as pd
+import logging
+import json
+import time
+from app.config import settings
+import app.models as models
+from app.compact import TradeWindow
+
+logger = logging.getLogger(__name__)
+
+
+# Trade columns read by the metric calculations
+TRADE_WINDOW_COLUMNS = ["trading_account_login", "profit", "price_sl", "price_tp", "opened_at", "closed_at"]
+
+# Max number of account logins bound into a single IN (...) clause
+LOGIN_BATCH_SIZE = 500
+
+
+def _login_batches(account_logins):
+    """Split account logins into IN (...) sized batches; None means every account"""
+    if account_logins is None:
+        yield None
+        return
+    logins = sorted(account_logins)
+    for start in range(0, len(logins), LOGIN_BATCH_SIZE):
+        yield logins[start:start + LOGIN_BATCH_SIZE]
+
+
+def _trade_columns():
+    return [getattr(models.Trade, name) for name in TRADE_WINDOW_COLUMNS]
+
+
+# Rowid of a trade: SQLite gives every inserted row one above all existing rowids,
+# so it orders trades by commit
+_trade_seq = literal_column("trades.rowid")
+
+
+def _compact_columns(source):
+    """
+    Metric columns of `source` for TradeWindow, with timestamps left as SQLite
+    text so they skip SQLAlchemy's per-row datetime parsing
+    """
+    return [source.profit, source.price_sl, source.price_tp,
+            type_coerce(source.opened_at, String), type_coerce(source.closed_at, String)]
+
+
+def _compact_windows(rows):
+    """Group (key, profit, price_sl, price_tp, opened_at, closed_at) rows into TradeWindows"""
+    for key, group in groupby(rows, key=itemgetter(0)):
+        window = TradeWindow()
+        for _, profit, price_sl, price_tp, opened_at, closed_at in group:
+            window.append(profit, price_sl, price_tp, opened_at, closed_at)
+        yield key, window
+
+
+def _shard_filter(column, shard):
+    """WHERE clause keeping the ids of one (index, count) shard"""
+    index, count = shard
+    return column % count == index
+
+
+def _ranked_trades(account_logins=None, shard=None, columns=None):
+    """
+    Subquery numbering each account's trades from newest to oldest. It carries
+    the whole Trade row unless only some `columns` are asked for.
+    """
+    stmt = (select(*(columns or [models.Trade]),
+                   func.row_number().over(
+                       partition_by=models.Trade.trading_account_login,
+                       order_by=models.Trade.closed_at.desc()).label("rn"))
+            .join(models.Account, models.Account.login == models.Trade.trading_account_login))
+    if account_logins is not None:
+        stmt = stmt.where(models.Trade.trading_account_login.in_(account_logins))
+    if shard is not None:
+        stmt = stmt.where(_shard_filter(models.Trade.trading_account_login, shard))
+    return stmt.subquery()
+
+
+def fetch_trade_windows(db: Session, window_size: int = None, chunk_size: int = None,
+                        account_logins=None, shard=None):
+    """
+    Yield (account_login, trades) for every account, or only for `account_logins`,
+    where trades are the last `window_size` trades ordered by closed_at DESC.
+    `shard=(index, count)` restricts the fetch to logins with login % count == index.
+
+    All windows come from a single ROW_NUMBER() query streamed in chunks, so the
+    number of round trips no longer grows with the number of accounts.
+    """
+    window_size = window_size or settings.WINDOW_SIZE
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+
+    for batch in _login_batches(account_logins):
+        ranked = _ranked_trades(batch, shard)
+        windowed_trade = aliased(models.Trade, ranked)
+
+        stmt = (select(windowed_trade)
+                .where(ranked.c.rn <= window_size)
+                .order_by(ranked.c.trading_account_login, ranked.c.rn)
+                .execution_options(yield_per=chunk_size))
+
+        trades = db.execute(stmt).scalars()
+        for login, window in groupby(trades, key=attrgetter("trading_account_login")):
+            yield login, list(window)
+
+
+def fetch_compact_windows(db: Session, window_size: int = None, chunk_size: int = None,
+                          account_logins=None, shard=None):
+    """
+    Yield (account_login, TradeWindow) like `fetch_trade_windows`, selecting only
+    the metric columns through SQLAlchemy Core instead of hydrating ORM objects.
+    """
+    window_size = window_size or settings.WINDOW_SIZE
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+
+    for batch in _login_batches(account_logins):
+        ranked = _ranked_trades(batch, shard, _trade_columns())
+        stmt = (select(ranked.c.trading_account_login, *_compact_columns(ranked.c))
+                .where(ranked.c.rn <= window_size)
+                .order_by(ranked.c.trading_account_login, ranked.c.rn))
+        yield from _compact_windows(db.execute(stmt).yield_per(chunk_size))
+
+
+def fetch_trade_window_frames(db: Session, window_size: int = None, chunk_size: int = None,
+                              account_logins=None, shard=None):
+    """
+    Yield DataFrames holding the trade windows of whole accounts, with the columns
+    the vectorized engine needs, streamed from the same ROW_NUMBER() query.
+    """
+    window_size = window_size or settings.WINDOW_SIZE
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+    columns = TRADE_WINDOW_COLUMNS
+
+    carry = []
+    for batch in _login_batches(account_logins):
+        ranked = _ranked_trades(batch, shard, _trade_columns())
+        stmt = (select(*(ranked.c[name] for name in columns))
+                .where(ranked.c.rn <= window_size)
+                .order_by(ranked.c.trading_account_login, ranked.c.rn))
+
+        for partition in db.execute(stmt).yield_per(chunk_size).partitions():
+            rows = carry + list(partition)
+            # Hold back the last account, it may continue in the next chunk
+            last_login = rows[-1][0]
+            split = len(rows)
+            while split > 0 and rows[split - 1][0] == last_login:
+                split -= 1
+            carry = rows[split:]
+            if split:
+                yield pd.DataFrame.from_records(rows[:split], columns=columns)
+    if carry:
+        yield pd.DataFrame.from_records(carry, columns=columns)
+
+
+def fetch_trade_window_rows(db: Session, window_size: int = None, chunk_size: int = None,
+                            account_logins=None, shard=None):
+    """
+    Yield (account_login, rows) like `fetch_trade_windows`, but with lightweight
+    Core rows holding only the columns the metrics read instead of ORM objects,
+    plus the identifier and rowid (seq) the rolling windows track.
+    """
+    window_size = window_size or settings.WINDOW_SIZE
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+    names = TRADE_WINDOW_COLUMNS + ["identifier", "seq"]
+
+    for batch in _login_batches(account_logins):
+        ranked = _ranked_trades(batch, shard, _trade_columns() + [models.Trade.identifier, _trade_seq.label("seq")])
+        stmt = (select(*(ranked.c[name] for name in names))
+                .where(ranked.c.rn <= window_size)
+                .order_by(ranked.c.trading_account_login, ranked.c.rn))
+
+        rows = db.execute(stmt).yield_per(chunk_size)
+        for login, window in groupby(rows, key=attrgetter("trading_account_login")):
+            yield login, list(window)
+
+
+def fetch_group_trade_windows(db: Session, group_column, group_ids, window_size: int = None,
+                              chunk_size: int = None, shard=None):
+    """
+    Yield (group_id, TradeWindow) with the last `window_size` trades across all accounts
+    of each group, where group_column is Account.user_id or Account.challenge_id.
+    group_ids=None fetches every group.
+    """
+    window_size = window_size or settings.WINDOW_SIZE
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+    for batch in _login_batches(group_ids):
+        ranked = (select(group_column.label("group_id"), *_trade_columns(),
+                         func.row_number().over(
+                             partition_by=group_column,
+                             order_by=models.Trade.closed_at.desc()).label("rn"))
+                  .join(models.Account, models.Account.login == models.Trade.trading_account_login)
+                  .where(group_column.is_not(None) if batch is None else group_column.in_(batch)))
+        if shard is not None:
+            ranked = ranked.where(_shard_filter(group_column, shard))
+        ranked = ranked.subquery()
+        stmt = (select(ranked.c.group_id, *_compact_columns(ranked.c))
+                .where(ranked.c.rn <= window_size)
+                .order_by(ranked.c.group_id, ranked.c.rn))
+        yield from _compact_windows(db.execute(stmt).yield_per(chunk_size))
+
+
+def fetch_trades_committed_after(db: Session, seq, chunk_size: int = None):
+    """
+    Stream the metric columns, identifier and rowid (seq) of every trade with a
+    rowid above `seq`, i.e. committed since that trade, in (closed_at, identifier) order
+    """
+    chunk_size = chunk_size or settings.FETCH_CHUNK_SIZE
+    stmt = (select(*_trade_columns(), models.Trade.identifier, _trade_seq.label("seq"))
+            .join(models.Account, models.Account.login == models.Trade.trading_account_login)
+            .order_by(models.Trade.closed_at, models.Trade.identifier))
+    if seq is not None:
+        stmt = stmt.where(_trade_seq > seq)
+    return db.execute(stmt).yield_per(chunk_size)
+
+
+def sample_account_logins(db: Session, size: int):
+    """Random logins of accounts that have trades"""
+    rows = db.execute(select(models.Account.login)
+                      .where(select(models.Trade.identifier)
+                             .where(models.Trade.trading_account_login == models.Account.login)
+                             .exists())
+                      .order_by(func.random())
+                      .limit(size))
+    return {login for login, in rows}
+
+
+def count_accounts(db: Session):
+    return db.execute(select(func.count()).select_from(models.Account)).scalar()
+
+
+def fetch_trade_windows_per_account(db: Session, window_size: int = None, account_logins=None, shard=None):
+    """Yield (account_login, trades) using one query per account (legacy path)"""
+    window_size = window_size or settings.WINDOW_SIZE
+    accounts = db.query(models.Account)
+    if account_logins is not None:
+        accounts = accounts.filter(models.Account.login.in_(account_logins))
+    if shard is not None:
+        accounts = accounts.filter(_shard_filter(models.Account.login, shard))
+    for account in accounts.all():
+        trades = (db.query(models.Trade)
+                  .filter(models.Trade.trading_account_login == account.login)
+                  .order_by(models.Trade.closed_at.desc())
+                  .limit(window_size)
+                  .all())
+        if trades:
+            yield account.login, trades
+
+
+def find_stale_accounts(db: Session):
+    """
+    Return the logins of accounts whose newest trade closed after the
+    last_trade_at of their latest risk metric, or that were never scored.
+    """
+    newest = (select(models.Trade.trading_account_login.label("login"),
+                     func.max(models.Trade.closed_at).label("newest_trade_at"))
+              .join(models.Account, models.Account.login == models.Trade.trading_account_login)
+              .group_by(models.Trade.trading_account_login)
+              .subquery())
+    scored = select(models.RiskLatest.account_login.label("login"),
+                    models.RiskLatest.last_trade_at).subquery()
+
+    stmt = (select(newest.c.login)
+            .outerjoin(scored, scored.c.login == newest.c.login)
+            .where(or_(scored.c.last_trade_at.is_(None),
+                       newest.c.newest_trade_at > scored.c.last_trade_at)))
+    return set(db.execute(stmt).scalars())
+
+
+def _upsert(db: Session, model, rows, chunk_size: int = None):
+    """
+    Insert rows, updating every column of rows whose primary key already exists.
+    Rows are sent with executemany in chunks; the caller owns the transaction.
+    """
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+    stmt = _upsert_statement(model)
+    for start in range(0, len(rows), chunk_size):
+        db.execute(stmt, rows[start:start + chunk_size])
+
+
+def _nullable_int(value):
+    """Enum columns arrive as ints, numpy floats from CSVs, or None for a missing value"""
+    return int(value) if value is not None else None
+
+
+def upsert_accounts(db: Session, accounts, chunk_size: int = None):
+    """
+    Insert or update accounts keyed by login, the last of duplicate logins
+    winning; return the number of rows written
+    """
+    rows = list({a["login"]: {**a, "phase": _nullable_int(a["phase"])} for a in accounts}.values())
+    _upsert(db, models.Account, rows, chunk_size)
+    return len(rows)
+
+
+def upsert_trades(db: Session, trades, chunk_size: int = None):
+    """
+    Insert or replace trades keyed by identifier.
+
+    Duplicate identifiers within the batch are collapsed, the last one wins.
+    A resent trade replaces the stored row, which gives it a new rowid, so the
+    rolling windows notice it like any newly committed trade.
+    Returns (rows written, set of account logins that received trades).
+    """
+    chunk_size = chunk_size or settings.INGEST_CHUNK_SIZE
+    rows = list({t["identifier"]: {**t, "action": _nullable_int(t["action"])} for t in trades}.values())
+    stmt = insert(models.Trade.__table__).prefix_with("OR REPLACE")
+    for start in range(0, len(rows), chunk_size):
+        db.execute(stmt, rows[start:start + chunk_size])
+    return len(rows), {t["trading_account_login"] for t in rows}
+
+
+def _upsert_statement(model):
+    """INSERT ... ON CONFLICT DO UPDATE of every non primary key column"""
+    table = model.__table__
+    stmt = insert(table)
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in table.primary_key],
+        set_={c.name: stmt.excluded[c.name] for c in table.columns if not c.primary_key})
+
+
+def _write_chunks(db: Session, statements, rows, chunk_size: int, label: str):
+    """
+    Execute every statement with each chunk of rows (one executemany each) inside
+    a savepoint of the caller's transaction. A failing chunk is rolled back on its
+    own and the others are kept. Returns the rows of failed chunks.
+    """
+    failed = []
+    started = time.perf_counter()
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        try:
+            with db.begin_nested():
+                for stmt in statements:
+                    db.execute(stmt, chunk)
+        except SQLAlchemyError:
+            logger.exception("Failed to persist %s chunk of %d rows", label, len(chunk))
+            failed.extend(chunk)
+
+    elapsed = time.perf_counter() - started
+    written = len(rows) - len(failed)
+    logger.info("Persisted %d %s in %.3fs (%.0f rows/sec), %d failed",
+                written, label, elapsed, written / elapsed if elapsed > 0 else 0, len(failed))
+    return failed
+
+
+def persist_risk_metrics(db: Session, rows, chunk_size: int = None):
+    """
+    Append risk metric rows to risk_metrics and upsert them into risk_latest, in
+    savepointed chunks. Returns the set of account logins whose chunk failed.
+    """
+    statements = [insert(models.RiskMetric.__table__), _upsert_statement(models.RiskLatest)]
+    failed = _write_chunks(db, statements, rows, chunk_size or settings.PERSIST_CHUNK_SIZE, "risk metrics")
+    return {row["account_login"] for row in failed}
+
+
+def persist_risk_aggregates(db: Session, rows, chunk_size: int = None):
+    """Upsert user and challenge aggregate rows in savepointed chunks"""
+    _write_chunks(db, [_upsert_statement(models.RiskAggregate)], rows,
+                  chunk_size or settings.PERSIST_CHUNK_SIZE, "risk aggregates")
+
+
+def get_group_ids(db: Session, group_column, account_logins):
+    """Return the distinct user or challenge ids owning the given accounts"""
+    group_ids = set()
+    for batch in _login_batches(account_logins):
+        stmt = select(group_column).where(models.Account.login.in_(batch)).distinct()
+        group_ids.update(db.execute(stmt).scalars())
+    group_ids.discard(None)
+    return group_ids
+
+
+def get_risk_aggregates(db: Session, scope: str, scope_ids):
+    """Return {scope_id: RiskAggregate} for many users or challenges"""
+    found = {}
+    for batch in _login_batches(set(scope_ids)):
+        stmt = (select(models.RiskAggregate)
+                .where(models.RiskAggregate.scope == scope, models.RiskAggregate.scope_id.in_(batch)))
+        found.update((a.scope_id, a) for a in db.execute(stmt).scalars())
+    return found
+
+
+def get_latest_risk_metrics(db: Session, account_logins):
+    """
+    Return {account_login: latest risk metric} for many accounts with one query
+    per IN (...) batch, with the same risk_metrics fallback as get_latest_risk_metric.
+    """
+    found = {}
+    for batch in _login_batches(set(account_logins)):
+        stmt = select(models.RiskLatest).where(models.RiskLatest.account_login.in_(batch))
+        found.update((m.account_login, m) for m in db.execute(stmt).scalars())
+
+        missing = [login for login in batch if login not in found]
+        if missing:
+            newest = (select(models.RiskMetric.account_login,
+                             func.max(models.RiskMetric.timestamp).label("timestamp"))
+                      .where(models.RiskMetric.account_login.in_(missing))
+                      .group_by(models.RiskMetric.account_login)
+                      .subquery())
+            stmt = (select(models.RiskMetric)
+                    .join(newest, (newest.c.account_login == models.RiskMetric.account_login)
+                          & (newest.c.timestamp == models.RiskMetric.timestamp)))
+            found.update((m.account_login, m) for m in db.execute(stmt).scalars())
+    return found
+
+
+def get_high_risk_logins(db: Session, threshold: float):
+    """Logins whose latest risk score is above `threshold`"""
+    return set(db.execute(select(models.RiskLatest.account_login)
+                          .where(models.RiskLatest.risk_score > threshold)).scalars())
+
+
+# Stored columns the risk signals and alert eligibility are derived from
+SIGNAL_COLUMNS = ["timestamp", "win_ratio", "max_drawdown", "hft_count", "stop_loss_used", "take_profit_used",
+                  "risk_score", "risk_signals", "last_trade_at"]
+
+
+def fetch_risk_signal_frame(db: Session, model, key_columns):
+    """Frame of the key columns and SIGNAL_COLUMNS of every risk_latest or risk_aggregates row"""
+    columns = list(key_columns) + SIGNAL_COLUMNS
+    rows = db.execute(select(*(getattr(model, name) for name in columns))).all()
+    return pd.DataFrame.from_records(rows, columns=columns)
+
+
+def update_risk_signals(db: Session, model, key_columns, rows):
+    """
+    Set risk_signals on risk_latest or risk_aggregates rows, given dicts with the
+    key columns, timestamp and risk_signals. Rows rescored since they were read
+    (a different timestamp) are left alone. Returns the number of rows updated.
+    """
+    if not rows:
+        return 0
+    table = model.__table__
+    stmt = (update(table)
+            .where(*(table.c[name] == bindparam(f"b_{name}") for name in list(key_columns) + ["timestamp"]))
+            .values(risk_signals=bindparam("b_risk_signals")))
+    params = [{f"b_{name}": value for name, value in row.items()} for row in rows]
+    return db.connection().execute(stmt, params).rowcount
+
+
+def get_latest_risk_metric(db: Session, account_login: int):
+    """
+    Return the latest risk metric of an account from risk_latest, falling back to
+    risk_metrics for accounts not scored since risk_latest was introduced.
+    """
+    latest = db.get(models.RiskLatest, account_login)
+    if latest is not None:
+        return latest
+    return (db.query(models.RiskMetric)
+            .filter(models.RiskMetric.account_login == account_login)
+            .order_by(models.RiskMetric.timestamp.desc())
+            .first())
+
+
+# Rollup columns averaged over a bucket's samples, and those keeping their maximum
+ROLLUP_AVERAGED = ["win_ratio", "profit_factor", "stop_loss_used", "take_profit_used", "risk_score"]
+ROLLUP_MAXIMUM = ["max_drawdown", "hft_count", "max_layering", "risk_score_max", "last_timestamp",
+                  "last_trade_at"]
+
+
+def fetch_expired_risk_metrics(db: Session, cutoff, limit: int):
+    """Oldest risk_metrics rows with a timestamp before `cutoff`"""
+    return (db.execute(select(models.RiskMetric)
+                       .where(models.RiskMetric.timestamp < cutoff)
+                       .order_by(models.RiskMetric.timestamp, models.RiskMetric.id)
+                       .limit(limit))
+            .scalars().all())
+
+
+def fetch_expired_rollups(db: Session, resolution: str, cutoff, limit: int):
+    """Oldest rollups of one resolution with a bucket starting before `cutoff`"""
+    table = models.RiskMetricRollup
+    return (db.execute(select(table)
+                       .where(table.resolution == resolution, table.bucket_start < cutoff)
+                       .order_by(table.bucket_start, table.account_login)
+                       .limit(limit))
+            .scalars().all())
+
+
+def upsert_risk_rollups(db: Session, rows):
+    """
+    Insert rollup rows, merging them into existing rows of the same bucket:
+    averages are weighted by sample count, maxima and minima combined and the
+    signals of the latest sample kept
+    """
+    if not rows:
+        return
+    table = models.RiskMetricRollup.__table__
+    stmt = insert(table)
+    new, old = stmt.excluded, table.c
+    total = old.samples + new.samples
+    set_ = {"samples": total,
+            "risk_score_min": func.min(old.risk_score_min, new.risk_score_min),
+            "risk_signals": case((new.last_timestamp >= old.last_timestamp, new.risk_signals),
+                                 else_=old.risk_signals)}
+    set_.update({name: (old[name] * old.samples + new[name] * new.samples) / total for name in ROLLUP_AVERAGED})
+    set_.update({name: func.max(old[name], new[name]) for name in ROLLUP_MAXIMUM})
+    db.execute(stmt.on_conflict_do_update(index_elements=["account_login", "resolution", "bucket_start"],
+                                          set_=set_), rows)
+
+
+def delete_risk_metrics(db: Session, ids):
+    db.execute(delete(models.RiskMetric).where(models.RiskMetric.id.in_(ids)))
+
+
+def delete_rollups(db: Session, resolution: str, keys):
+    """Delete rollups of one resolution by (account_login, bucket_start)"""
+    table = models.RiskMetricRollup
+    db.execute(delete(table).where(table.resolution == resolution,
+                                   tuple_(table.account_login, table.bucket_start).in_(keys)))
+
+
+# Sort rank of each history source at equal timestamps, newest data first
+HISTORY_RANKS = {"raw": 2, "hour": 1, "day": 0}
+
+
+def _history_before(timestamp_column, id_column, rank: int, cursor):
+    """Rows of a history source sorting after `cursor` = (timestamp, rank, id), newest first"""
+    timestamp, cursor_rank, cursor_id = cursor
+    if rank < cursor_rank:
+        return timestamp_column <= timestamp
+    if rank > cursor_rank or id_column is None:
+        return timestamp_column < timestamp
+    return or_(timestamp_column < timestamp, and_(timestamp_column == timestamp, id_column < cursor_id))
+
+
+def get_risk_history(db: Session, account_login: int, resolutions, start=None, end=None, cursor=None,
+                     limit: int = 100):
+    """
+    Return up to `limit` (rank, id, row) history entries of an account, newest
+    first, from raw risk_metrics rows and hourly/daily rollups. `resolutions`
+    selects the sources; start/end bound the timestamp (bucket start for
+    rollups, inclusive start, exclusive end), and `cursor` is the
+    (timestamp, rank, id) of the last entry of the previous page.
+    """
+    entries = []
+    for resolution in resolutions:
+        rank = HISTORY_RANKS[resolution]
+        if resolution == "raw":
+            table = models.RiskMetric
+            timestamp, id_column = table.timestamp, table.id
+            stmt = select(table).where(table.account_login == account_login)
+        else:
+            table = models.RiskMetricRollup
+            timestamp, id_column = table.bucket_start, None
+            stmt = select(table).where(table.account_login == account_login, table.resolution == resolution)
+        if start is not None:
+            stmt = stmt.where(timestamp >= start)
+        if end is not None:
+            stmt = stmt.where(timestamp < end)
+        if cursor is not None:
+            stmt = stmt.where(_history_before(timestamp, id_column, rank, cursor))
+        order = [timestamp.desc()] + ([id_column.desc()] if id_column is not None else [])
+        for row in db.execute(stmt.order_by(*order).limit(limit)).scalars():
+            entries.append((rank, row.id if resolution == "raw" else 0, row))
+
+    def sort_key(entry):
+        rank, id_, row = entry
+        return (row.timestamp if rank == HISTORY_RANKS["raw"] else row.bucket_start, rank, id_)
+
+    entries.sort(key=sort_key, reverse=True)
+    return entries[:limit]
+
+
+def acquire_lease(db: Session, name: str, holder: str, now, expires_at):
+    """
+    Take the `name` lease if it is free or expired, or renew it if `holder`
+    already has it, in one statement. Returns whether `holder` now holds it.
+    """
+    table = models.LeaderLease.__table__
+    stmt = insert(table).values(name=name, holder=holder, acquired_at=now, expires_at=expires_at)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"holder": stmt.excluded.holder,
+              "expires_at": stmt.excluded.expires_at,
+              "acquired_at": case((table.c.holder == stmt.excluded.holder, table.c.acquired_at),
+                                  else_=stmt.excluded.acquired_at)},
+        where=or_(table.c.holder == holder, table.c.expires_at < now))
+    return db.execute(stmt).rowcount == 1
+
+
+def release_lease(db: Session, name: str, holder: str, now):
+    """Expire the `name` lease if `holder` has it, so another worker can take it right away"""
+    table = models.LeaderLease.__table__
+    db.execute(update(table).where(table.c.name == name, table.c.holder == holder).values(expires_at=now))
+
+
+def confirm_lease(db: Session, name: str, holder: str, now):
+    """
+    Whether `holder` still holds an unexpired `name` lease. Run it first in a
+    write transaction: the no-op update takes the database write lock, so the
+    lease cannot change hands before that transaction ends.
+    """
+    table = models.LeaderLease.__table__
+    stmt = (update(table)
+            .where(table.c.name == name, table.c.holder == holder, table.c.expires_at > now)
+            .values(name=table.c.name))
+    return db.execute(stmt).rowcount == 1
+
+
+def get_lease(db: Session, name: str):
+    return db.get(models.LeaderLease, name)
+
+
+def add_pending_rescores(db: Session, account_logins, now):
+    """Record accounts for the leader to re-score"""
+    rows = [{"account_login": login, "marked_at": now} for login in account_logins]
+    if rows:
+        db.execute(insert(models.PendingRescore.__table__).on_conflict_do_nothing(), rows)
+
+
+def has_pending_rescores(db: Session):
+    return db.execute(select(models.PendingRescore.account_login).limit(1)).first() is not None
+
+
+def take_pending_rescores(db: Session):
+    """Remove and return every account marked in pending_rescores"""
+    table = models.PendingRescore.__table__
+    return set(db.execute(delete(table).returning(table.c.account_login)).scalars())
+
+
+# risk_changes key standing for every account, user and challenge
+ALL_CHANGED = ("all", None)
+
+
+def record_risk_changes(db: Session, keys, worker: str, now):
+    """Append (scope, scope_id) keys to risk_changes, in the transaction writing them"""
+    rows = [{"scope": scope, "scope_id": scope_id, "worker": worker, "changed_at": now} for scope, scope_id in keys]
+    if rows:
+        db.execute(insert(models.RiskChange.__table__), rows)
+
+
+def get_risk_change_bounds(db: Session):
+    """(lowest, highest) id in risk_changes, or (None, None) when it is empty"""
+    table = models.RiskChange.__table__
+    return tuple(db.execute(select(func.min(table.c.id), func.max(table.c.id))).one())
+
+
+def fetch_risk_changes(db: Session, after_id: int):
+    """risk_changes rows with an id above `after_id`, in commit order"""
+    table = models.RiskChange.__table__
+    stmt = (select(table.c.id, table.c.scope, table.c.scope_id, table.c.worker)
+            .where(table.c.id > after_id).order_by(table.c.id))
+    return db.execute(stmt).all()
+
+
+def prune_risk_changes(db: Session, before):
+    """
+    Delete risk_changes rows older than `before`, except the newest one, which
+    keeps ids increasing and gives workers starting up a position to read from
+    """
+    table = models.RiskChange.__table__
+    newest = select(func.max(table.c.id)).scalar_subquery()
+    return db.execute(delete(table).where(table.c.changed_at < before, table.c.id < newest)).rowcount
+
+
+def save_config_settings(db: Session, overrides, now):
+    """
+    Upsert setting overrides (name -> value), each with a version above every
+    existing one. The version is computed inside the insert, so the transaction
+    starts with its write. Returns the highest version.
+    """
+    table = models.ConfigSetting.__table__
+    next_version = select(func.coalesce(func.max(table.c.version), 0) + 1).scalar_subquery()
+    stmt = insert(table).values(name=bindparam("b_name"), value=bindparam("b_value"), version=next_version,
+                                updated_at=now)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["name"],
+        set_={"value": stmt.excluded.value, "version": stmt.excluded.version, "updated_at": stmt.excluded.updated_at})
+    db.execute(stmt, [{"b_name": name, "b_value": json.dumps(value)} for name, value in overrides.items()])
+    return get_config_version(db)
+
+
+def get_config_version(db: Session):
+    """Highest version in config_settings, or None when no setting was overridden"""
+    return db.execute(select(func.max(models.ConfigSetting.version))).scalar()
+
+
+def load_config_settings(db: Session):
+    """(version, {name: value}) of every saved setting override"""
+    rows = db.execute(select(models.ConfigSetting.name, models.ConfigSetting.value,
+                             models.ConfigSetting.version)).all()
+    return max((row.version for row in rows), default=None), {row.name: json.loads(row.value) for row in rows}
+
+
+# Account and latest risk metric columns of an export row
+EXPORT_COLUMNS = ["account_login", "user_id", "challenge_id", "phase", "timestamp", "win_ratio", "profit_factor",
+                  "max_drawdown", "stop_loss_used", "take_profit_used", "hft_count", "max_layering", "risk_score",
+                  "risk_signals", "last_trade_at"]
+
+
+def stream_risk_export(db: Session, challenge_id: int = None, phase: int = None, min_risk_score: float = None,
+                       chunk_size: int = None):
+    """
+    Yield lists of up to chunk_size rows (EXPORT_COLUMNS) of the latest risk
+    metric of every account, in login order, from one server-side cursor with
+    the filters applied in SQL
+    """
+    latest, account = models.RiskLatest, models.Account
+    columns = [latest.account_login, account.user_id, account.challenge_id, account.phase]
+    columns += [getattr(latest, name) for name in EXPORT_COLUMNS[4:]]
+    stmt = select(*columns).join(account, account.login == latest.account_login)
+    if challenge_id is not None:
+        stmt = stmt.where(account.challenge_id == challenge_id)
+    if phase is not None:
+        stmt = stmt.where(account.phase == phase)
+    if min_risk_score is not None:
+        stmt = stmt.where(latest.risk_score >= min_risk_score)
+    chunk_size = chunk_size or settings.EXPORT_CHUNK_SIZE
+    result = db.execute(stmt.order_by(latest.account_login),
+                        execution_options={"stream_results": True, "yield_per": chunk_size})
+    for partition in result.partitions(chunk_size):
+        yield partition
+
+
+def get_trade_counts(db: Session, end=None):
+    """(account_login, trades) of every account with trades closed before `end`, in login order"""
+    login = models.Trade.trading_account_login
+    stmt = (select(login, func.count())
+            .join(models.Account, models.Account.login == login)
+            .group_by(login)
+            .order_by(login))
+    if end is not None:
+        stmt = stmt.where(models.Trade.closed_at < end)
+    return db.execute(stmt).all()
+
+
+def fetch_account_histories(db: Session, first_login: int, last_login: int, end=None, chunk_size: int = None):
+    """
+    Yield (account_login, trades) for the accounts with logins in
+    [first_login, last_login], where trades lazily iterates the account's full
+    history (closed before `end`) in closed_at order. Everything comes from one
+    query streamed in chunks, so memory does not grow with the history.
+    """
+    login = models.Trade.trading_account_login
+    stmt = (select(*_trade_columns())
+            .join(models.Account, models.Account.login == login)
+            .where(login.between(first_login, last_login))
+            .order_by(login, models.Trade.closed_at))
+    if end is not None:
+        stmt = stmt.where(models.Trade.closed_at < end)
+    rows = db.execute(stmt).yield_per(chunk_size or settings.FETCH_CHUNK_SIZE)
+    yield from groupby(rows, key=itemgetter(0))
+
+
+def delete_replay_run(db: Session, run_id: str):
+    db.execute(delete(models.RiskReplay).where(models.RiskReplay.run_id == run_id))
+
+
+def insert_replay_rows(db: Session, rows):
+    if rows:
+        db.execute(insert(models.RiskReplay.__table__), rows)
@@ -1,28 +1,121 @@
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import QueuePool
+from app.config import settings
+from app.instrumentation import instrument_engine
 
 # SQLite database configuration
 SQLALCHEMY_DATABASE_URL = "sqlite:///./risk_signal.db"
+# Same file opened read-only, for API requests
+SQLALCHEMY_READ_DATABASE_URL = "sqlite:///file:./risk_signal.db?mode=ro&uri=true"
 
+# Writer: a single connection shared by the risk cycle and ingestion, since
+# SQLite allows one writer at a time anyway
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False}
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=1,
+    max_overflow=0
 )
 
-# Session factory for database sessions
+# Lease renewals get a connection of their own, so a cycle or an upload
+# holding the writer connection never delays them into a lost lease
+lease_engine = create_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=1,
+    max_overflow=0
+)
+
+# Readers: under WAL they read the last committed snapshot without waiting
+# for the writer, so request latency does not depend on a running cycle
+read_engine = create_engine(
+    SQLALCHEMY_READ_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    pool_size=settings.READ_POOL_SIZE,
+    max_overflow=settings.READ_POOL_OVERFLOW
+)
+
+
+def _set_pragmas(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}")
+    cursor.execute(f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}")
+    cursor.close()
+
+
+@event.listens_for(lease_engine, "connect")
+@event.listens_for(engine, "connect")
+def _configure_writer(dbapi_connection, connection_record):
+    # pysqlite starts transactions lazily and breaks SAVEPOINT; let SQLAlchemy
+    # emit BEGIN itself so nested transactions work
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    # WAL is stored in the database file, so it also applies to the readers
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+    cursor.close()
+    _set_pragmas(dbapi_connection)
+
+
+@event.listens_for(lease_engine, "begin")
+@event.listens_for(engine, "begin")
+def _emit_begin(conn):
+    conn.exec_driver_sql("BEGIN")
+
+
+@event.listens_for(read_engine, "connect")
+def _configure_reader(dbapi_connection, connection_record):
+    _set_pragmas(dbapi_connection)
+
+
+instrument_engine(engine, "writer")
+instrument_engine(read_engine, "reader")
+instrument_engine(lease_engine, "lease")
+
+# Session factory for database sessions that write
 SessionLocal = sessionmaker(
     autocommit=False,
     autoflush=False,
     bind=engine
 )
 
+# Session factory for leader lease renewals
+LeaseSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=lease_engine
+)
+
+# Session factory for read-only sessions
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=read_engine
+)
+
 Base = declarative_base()
 
 
 def get_db():
     """
-    Dependency function to provide a database session
+    Dependency function to provide a read-only database session
+    """
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def get_write_db():
+    """
+    Dependency function to provide a database session on the writer connection
     """
     db = SessionLocal()
     try:
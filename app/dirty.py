@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class DirtyTracker:
+    """
+    Thread-safe record of accounts that need to be re-scored.
+
+    Accounts are marked by the API (new trades, config changes) and drained by
+    the risk calculation cycle. A full recompute is requested on startup and
+    whenever a config change affects every account.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # account_login -> monotonic time it was first marked
+        self._full = True
+
+    def mark(self, account_logins):
+        """Mark accounts as needing a re-score"""
+        now = time.monotonic()
+        with self._lock:
+            for login in account_logins:
+                self._pending.setdefault(login, now)
+
+    def mark_all(self):
+        """Request a re-score of every account on the next cycle"""
+        with self._lock:
+            self._full = True
+
+    def drain(self):
+        """Return (full, account_logins) and reset the tracker"""
+        with self._lock:
+            full, pending = self._full, set(self._pending)
+            self._full = False
+            self._pending = {}
+        return full, pending
+
+    def restore(self, full, account_logins):
+        """Put back marks taken by a cycle that failed"""
+        self.mark(account_logins)
+        if full:
+            self.mark_all()
+
+    def lag(self):
+        """Seconds since the oldest pending account was marked, None when nothing is pending"""
+        with self._lock:
+            if not self._pending:
+                return None
+            return time.monotonic() - min(self._pending.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+
+dirty_tracker = DirtyTracker()
@@ -0,0 +1,99 @@
+from app.crud import EXPORT_COLUMNS
+import csv
+import importlib.util
+import io
+import json
+import math
+
+# Parquet output needs pyarrow, which is optional
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+def _record(row):
+    record = dict(zip(EXPORT_COLUMNS, row))
+    for name in ("timestamp", "last_trade_at"):
+        if record[name] is not None:
+            record[name] = record[name].isoformat()
+    # No losing trades gives an infinite profit factor, which JSON cannot encode
+    if record["profit_factor"] is not None and not math.isfinite(record["profit_factor"]):
+        record["profit_factor"] = None
+    record["risk_signals"] = record["risk_signals"].split(",") if record["risk_signals"] else []
+    return record
+
+
+def ndjson_chunks(chunks):
+    for rows in chunks:
+        yield "".join(json.dumps(_record(row)) + "\n" for row in rows)
+
+
+def csv_chunks(chunks):
+    """CSV with a header row; signals stay comma-separated in one quoted field"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _Sink(io.RawIOBase):
+    """Write-only file whose contents are taken after every row group"""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def take(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def parquet_chunks(chunks):
+    """One Parquet row group per chunk, each sent as soon as it is written"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("account_login", pa.int64()), ("user_id", pa.int64()), ("challenge_id", pa.int64()), ("phase", pa.int64()),
+        ("timestamp", pa.timestamp("us")), ("win_ratio", pa.float64()), ("profit_factor", pa.float64()),
+        ("max_drawdown", pa.float64()), ("stop_loss_used", pa.float64()), ("take_profit_used", pa.float64()),
+        ("hft_count", pa.int64()), ("max_layering", pa.int64()), ("risk_score", pa.float64()),
+        ("risk_signals", pa.string()), ("last_trade_at", pa.timestamp("us")),
+    ])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+    for rows in chunks:
+        columns = list(zip(*rows))
+        writer.write_table(pa.Table.from_arrays([pa.array(column, type=field.type)
+                                                 for column, field in zip(columns, schema)], schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+FORMATS = {
+    "ndjson": ndjson_chunks,
+    "csv": csv_chunks,
+    "parquet": parquet_chunks,
+}
@@ -0,0 +1,272 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from sqlalchemy import event
+import threading
+import time
+
+# Default histogram buckets in seconds, from sub-millisecond queries to long cycles
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    """Base of the metric types: a name, help text and optional label names"""
+
+    type = None
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(labels[name] for name in self.labelnames)
+
+    def _samples(self):
+        """Yield (suffix, label names, label values, value)"""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield "", self.labelnames, key, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, names, values, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(names, values)} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """A value that goes up and down; `function` computes it at scrape time instead"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def _samples(self):
+        if self.function is not None:
+            yield "", (), (), self.function()
+            return
+        yield from super()._samples()
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # counts per bucket (the last one is +Inf), sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def _samples(self):
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        names = self.labelnames + ("le",)
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield "_bucket", names, key + (_format_value(bound),), cumulative
+            yield "_sum", self.labelnames, key, total
+            yield "_count", self.labelnames, key, cumulative
+
+
+class Registry:
+    """Metrics exposed by /metrics, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric: Metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+CYCLE_SECONDS = registry.histogram(
+    "risk_cycle_duration_seconds", "Duration of risk calculation cycles", ["outcome"])
+STAGE_SECONDS = registry.histogram(
+    "risk_cycle_stage_seconds", "Time spent per cycle in each stage (fetch, compute, persist, webhook)", ["stage"])
+ACCOUNTS_SCORED = registry.counter(
+    "risk_accounts_scored_total", "Accounts scored by risk calculation cycles")
+ACCOUNTS_SKIPPED = registry.counter(
+    "risk_accounts_skipped_total", "Accounts left out of incremental cycles because nothing changed")
+ACCOUNTS_FAILED = registry.counter(
+    "risk_accounts_failed_total", "Accounts whose risk metrics could not be persisted")
+ACCOUNTS_ALERTED = registry.counter(
+    "risk_accounts_alerted_total", "High-risk alerts queued for webhook delivery")
+AGGREGATES_SCORED = registry.counter(
+    "risk_aggregates_scored_total", "User and challenge aggregates scored by cycles")
+LAST_SUCCESS = registry.gauge(
+    "risk_last_successful_cycle_timestamp_seconds", "Unix time the last cycle completed successfully")
+LAST_CYCLE_ACCOUNTS = registry.gauge(
+    "risk_last_cycle_accounts", "Accounts scored by the last completed cycle")
+HTTP_SECONDS = registry.histogram(
+    "risk_http_request_duration_seconds", "API request latency", ["method", "route", "status"])
+DB_SECONDS = registry.histogram(
+    "risk_db_query_duration_seconds", "Database statement execution time", ["engine"])
+WEBHOOK_SECONDS = registry.histogram(
+    "risk_webhook_post_duration_seconds", "Webhook POST latency, including failed attempts", ["outcome"])
+
+
+class _Stages(threading.local):
+    def __init__(self):
+        self.totals = None  # stage -> seconds of the cycle running in this thread
+        self.active = None  # [stage, started] of the innermost running stage
+
+
+_stages = _Stages()
+
+
+def _enter(totals, name: str):
+    """Pause the running stage and start `name`; return the paused stage"""
+    now = time.perf_counter()
+    outer = _stages.active
+    if outer is not None:
+        totals[outer[0]] = totals.get(outer[0], 0.0) + now - outer[1]
+    _stages.active = [name, now]
+    return outer
+
+
+def _exit(totals, outer):
+    """Credit the innermost stage and resume `outer`"""
+    now = time.perf_counter()
+    name, started = _stages.active
+    totals[name] = totals.get(name, 0.0) + now - started
+    _stages.active = outer
+    if outer is not None:
+        outer[1] = now
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Attribute the enclosed time to a stage of the cycle running in this thread.
+
+    Stages are exclusive: a nested stage pauses the enclosing one, so fetching
+    inside a scoring loop is counted as fetch, not compute. Outside a cycle
+    this only costs an attribute lookup.
+    """
+    totals = _stages.totals
+    if totals is None:
+        yield
+        return
+    outer = _enter(totals, name)
+    try:
+        yield
+    finally:
+        _exit(totals, outer)
+
+
+def timed_iter(iterable, name: str = "fetch"):
+    """Yield from iterable, attributing the time spent producing items to a stage"""
+    totals = _stages.totals
+    if totals is None:
+        yield from iterable
+        return
+    iterator = iter(iterable)
+    while True:
+        outer = _enter(totals, name)
+        try:
+            item = next(iterator, _DONE)
+        finally:
+            _exit(totals, outer)
+        if item is _DONE:
+            return
+        yield item
+
+
+_DONE = object()
+
+
+@contextmanager
+def cycle():
+    """Time one risk calculation cycle and the stages run inside it"""
+    _stages.totals = {}
+    _stages.active = None
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        totals, _stages.totals = _stages.totals, None
+        CYCLE_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+        for name, seconds in totals.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        if outcome == "success":
+            LAST_SUCCESS.set(time.time())
+
+
+def instrument_engine(engine, label: str):
+    """Observe the execution time of every statement run through `engine`"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["query_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        DB_SECONDS.observe(time.perf_counter() - conn.info["query_started"], engine=label)
@@ -0,0 +1,135 @@
+from datetime import datetime, timedelta
+from sqlalchemy.exc import SQLAlchemyError
+from app.config import settings
+from app.database import LeaseSessionLocal, ReadSessionLocal
+from app.instrumentation import registry
+import app.crud as crud
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """A worker tried to persist or alert without holding the lease"""
+
+
+class LeaderElection:
+    """
+    Elects the one worker process that runs the risk cycles, through a lease
+    row in the database instead of an outside coordination service.
+
+    Every worker tries to take, or renew, the lease every renew_interval; the
+    holder extends it by ttl each time. When the leader dies its lease expires
+    and another worker takes over within ttl + renew_interval. A leader that
+    cannot renew steps down before its lease can expire. on_elected and
+    on_demoted run on the election thread whenever leadership changes.
+    Renewals use their own connection, never waiting for the shared writer,
+    and writes only the leader may make call confirm() in their transaction.
+    """
+
+    def __init__(self, name: str = "risk-cycle", ttl: float = None, renew_interval: float = None):
+        self.name = name
+        self.ttl = ttl or settings.LEADER_LEASE_TTL
+        self.renew_interval = renew_interval or settings.LEADER_RENEW_INTERVAL
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self.campaigning = False
+
+        self._valid_until = 0.0  # monotonic time our lease is certain to last until
+        self._on_elected = None
+        self._on_demoted = None
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self, on_elected, on_demoted):
+        """Try to take the lease right away, then keep renewing or retrying it in the background"""
+        if self._thread is not None:
+            return
+        self._on_elected, self._on_demoted = on_elected, on_demoted
+        self.campaigning = True
+        self._stopping.clear()
+        self._step()
+        self._thread = threading.Thread(target=self._run, name="leader-election", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop campaigning and release the lease if this worker holds it"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.is_leader:
+            self._change(False)
+            try:
+                with LeaseSessionLocal() as db:
+                    crud.release_lease(db, self.name, self.worker_id, datetime.now())
+                    db.commit()
+            except SQLAlchemyError:
+                logger.exception("Failed to release the %s lease", self.name)
+        self.campaigning = False
+
+    def confirm(self, db):
+        """
+        Raise LeaseLost unless this worker still leads, checked in `db`'s write
+        transaction before anything else is written so the lease is held until
+        it commits. Processes not taking part in the election (scripts,
+        benchmarks) always pass.
+        """
+        if not self.campaigning:
+            return
+        if not self.is_leader or not crud.confirm_lease(db, self.name, self.worker_id, datetime.now()):
+            raise LeaseLost(f"Worker {self.worker_id} no longer holds the {self.name} lease")
+
+    def _run(self):
+        while not self._stopping.wait(self.renew_interval):
+            self._step()
+
+    def _step(self):
+        now = datetime.now()
+        started = time.monotonic()
+        try:
+            with LeaseSessionLocal() as db:
+                held = crud.acquire_lease(db, self.name, self.worker_id, now, now + timedelta(seconds=self.ttl))
+                db.commit()
+            if held:
+                self._valid_until = started + self.ttl
+        except SQLAlchemyError:
+            logger.exception("Failed to renew the %s lease", self.name)
+            # Keep leading only while the lease cannot have expired before the next attempt
+            held = self.is_leader and time.monotonic() + self.renew_interval < self._valid_until
+        if held != self.is_leader:
+            self._change(held)
+
+    def _change(self, leader: bool):
+        self.is_leader = leader
+        logger.info("Worker %s %s the %s lease", self.worker_id, "took" if leader else "lost", self.name)
+        try:
+            (self._on_elected if leader else self._on_demoted)()
+        except Exception:
+            logger.exception("Leadership change handler failed")
+
+    def stats(self):
+        try:
+            with ReadSessionLocal() as db:
+                lease = crud.get_lease(db, self.name)
+        except SQLAlchemyError:
+            lease = None
+        active = lease is not None and lease.expires_at > datetime.now()
+        return {
+            "worker": self.worker_id,
+            "is_leader": self.is_leader,
+            "leader": lease.holder if active else None,
+            "leader_since": lease.acquired_at.isoformat() if active else None,
+            "lease_expires_at": lease.expires_at.isoformat() if active else None,
+        }
+
+
+leader_election = LeaderElection()
+
+registry.gauge("risk_worker_is_leader", "1 when this worker process runs the risk cycles",
+               function=lambda: int(leader_election.is_leader))
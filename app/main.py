@@ -1,22 +1,49 @@
 from app.models import Base, Account, Trade, RiskMetric
-from fastapi import FastAPI, Depends, HTTPException, Query, Path
-from fastapi.responses import RedirectResponse
+from app.enums import Phase
+from fastapi import FastAPI, Depends, HTTPException, Query, Path, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import RedirectResponse, StreamingResponse, PlainTextResponse
 from contextlib import asynccontextmanager
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_write_db, SessionLocal, ReadSessionLocal
 import app.schemas as schemas
 import app.utils as utils
+import app.crud as crud
+import app.scoring as scoring
+import app.parallel as parallel
 from app.config import settings
+from app.dirty import dirty_tracker
+from app.scheduler import risk_scheduler
+from app.leader import leader_election, LeaseLost
+from app.webhooks import webhook_dispatcher
+from app.cache import risk_report_cache
+from app.changes import change_feed
+from app.window import WindowStore, window_store
+from app.broadcast import risk_broadcaster, risk_update
+from app.instrumentation import stage
+import app.instrumentation as instrumentation
+import app.profiling as profiling
+import app.retention as retention
+import app.reevaluation as reevaluation
+import app.export as export
 import app.models as models
-from datetime import datetime
-import requests
+from pydantic import ValidationError
+from datetime import datetime, timedelta
+from typing import List, Optional
 import logging
 import traceback
+import json
+import base64
+import math
 import asyncio
+import threading
+import time
 
 
-# Global task reference
-background_task = None
+profile_lock = threading.Lock()
+# Saving and loading shared settings, so a reload never sees them half applied
+config_lock = threading.Lock()
 
 # Setup logging
 logging.basicConfig(filename='risk_service.log', level=logging.INFO,
@@ -30,14 +57,15 @@ async def lifespan(app: FastAPI):
     try:
         logger.info("Starting application lifespan - ensuring DB schema ...")
         from app.database import engine
-        # from app.models import Base
-        Base.metadata.create_all(bind=engine)
-        logger.info("DB schema ready - launching background task")
+        from app.migrations import run_migrations
+        run_migrations(engine)
+        logger.info("DB schema ready - starting the leader election")
 
-        # Startup
-        global background_task
-
-        background_task = asyncio.create_task(calculate_risk_metrics_periodically())
+        # Startup: only the worker holding the leader lease runs the risk scheduler;
+        # every worker follows the risk rows it commits
+        webhook_dispatcher.start()
+        change_feed.start(leader_election.worker_id, apply_risk_changes, reload_settings)
+        leader_election.start(start_cycles, stop_cycles)
 
         yield
     except Exception:
@@ -45,99 +73,278 @@ async def lifespan(app: FastAPI):
         raise
     # Shutdown
     finally:
-        logger.info("Shutting down - cancelling background task")
-        if background_task and not background_task.done():
-            background_task.cancel()
-            try:
-                await background_task
-            except asyncio.CancelledError:
-                logger.info("Background task cancelled cleanly.")
+        logger.info("Shutting down - stopping the risk scheduler")
+        leader_election.stop()
+        risk_scheduler.shutdown()
+        change_feed.stop()
+        await asyncio.to_thread(webhook_dispatcher.stop)
+        parallel.shutdown_pool()
 
 app = FastAPI(lifespan=lifespan)
 
 
-async def calculate_risk_metrics_periodically():
-    """Run risk calculation every 5 minutes"""
-    # from time import sleep
-    loop = asyncio.get_running_loop()
-    while True:
+def start_cycles():
+    """Run the risk scheduler in this worker, now that it is the leader"""
+    with ReadSessionLocal() as db:
+        high_risk = crud.get_high_risk_logins(db, settings.RISK_THRESHOLD)
+    risk_scheduler.start(calculate_risk_metrics, high_risk)
+    risk_scheduler.add_maintenance_job(retention.compact, settings.COMPACTION_INTERVAL, "risk-retention")
+    risk_scheduler.add_maintenance_job(poll_pending_rescores, settings.LEADER_POLL_INTERVAL, "pending-rescores")
+    risk_scheduler.add_maintenance_job(prune_risk_changes, settings.CHANGE_RETENTION, "risk-changes-prune")
+
+
+def stop_cycles():
+    """Stop the risk scheduler and hand the accounts still marked here over to the next leader"""
+    # Wait for a running cycle: it cannot persist or alert any more, and gives its accounts back
+    risk_scheduler.shutdown(wait=True)
+    _, marked = dirty_tracker.drain()
+    if marked:
+        with SessionLocal() as writer:
+            crud.add_pending_rescores(writer, marked, datetime.now())
+            writer.commit()
+
+
+def poll_pending_rescores():
+    """Pick up the accounts other workers marked for re-scoring"""
+    with ReadSessionLocal() as db:
+        if not crud.has_pending_rescores(db):
+            return
+    with SessionLocal() as writer:
+        logins = crud.take_pending_rescores(writer)
+        writer.commit()
+    dirty_tracker.mark(logins)
+    risk_scheduler.notify(logins)
+
+
+def prune_risk_changes():
+    """Drop risk_changes rows every worker has had CHANGE_RETENTION seconds to read"""
+    with SessionLocal() as writer:
+        pruned = crud.prune_risk_changes(writer, datetime.now() - timedelta(seconds=settings.CHANGE_RETENTION))
+        writer.commit()
+    logger.debug("Pruned %d risk changes", pruned)
+
+
+def apply_risk_changes(keys):
+    """
+    Catch up with risk rows another worker committed (keys None: possibly
+    all of them): drop their cached reports and push their stored state to
+    the streaming clients following them
+    """
+    if keys is None:
+        risk_report_cache.clear()
+    else:
+        risk_report_cache.invalidate(scope_id for scope, scope_id in keys if scope == "account")
+    followed = risk_broadcaster.subscribed(keys)
+    if followed:
+        risk_broadcaster.publish(stream_snapshot(followed), lambda key, update: update)
+
+
+def request_rescore(account_logins):
+    """Re-score accounts in this worker when it is the leader, otherwise hand them to the leader"""
+    if not account_logins:
+        return
+    if leader_election.is_leader:
+        dirty_tracker.mark(account_logins)
+        risk_scheduler.notify(account_logins)
+        return
+    with SessionLocal() as writer:
+        crud.add_pending_rescores(writer, account_logins, datetime.now())
+        writer.commit()
+
+# Scrape-time gauges of the in-process queues
+instrumentation.registry.gauge("risk_webhook_queue_depth", "Alerts waiting for webhook delivery",
+                               function=lambda: webhook_dispatcher.queue.qsize())
+instrumentation.registry.gauge("risk_dirty_accounts", "Accounts marked for re-scoring on the next cycle",
+                               function=lambda: len(dirty_tracker))
+
+
+@app.middleware("http")
+async def observe_request_duration(request: Request, call_next):
+    started = time.perf_counter()
+
+    def observe(status: int):
+        # The route template, not the path, keeps label cardinality bounded
+        route = request.scope.get("route")
+        instrumentation.HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method,
+                                             route=route.path if route else "unmatched", status=status)
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        observe(500)
+        raise
+
+    body = response.body_iterator
+
+    async def observed_body():
+        # Streaming routes send most of their body after call_next returns; time it to the last chunk
         try:
-            # run the sync, CPU-bound job in a default thread-pool
-            await loop.run_in_executor(None, calculate_risk_metrics)
-            logger.info("Cycle completed ")
+            async for chunk in body:
+                yield chunk
+        finally:
+            observe(response.status_code)
 
-            # await asyncio.sleep(300)          # pause 5 min
-        except Exception as e:
-            logger.error(f"Error in periodic calculation: {str(e)}")
-        await asyncio.sleep(300)  # pause 5 minutes
+    response.body_iterator = observed_body()
+    return response
 
 
-def calculate_risk_metrics():
-    """Main risk calculation function"""
+def calculate_risk_metrics(sweep: bool = True):
+    """
+    Main risk calculation function, run by the risk scheduler. Event cycles
+    (sweep=False) score only the accounts marked by ingestion; sweeps also
+    look for accounts with trades newer than their latest metric.
+    """
     logger.info("Starting risk metrics calculation")
-    db = next(get_db())
+    # Scoring reads on a read-only session; only persisting takes the writer
+    db = ReadSessionLocal()
+    full, marked = dirty_tracker.drain()
     try:
-        accounts = db.query(models.Account).all()
-        for account in accounts:
-            # Get last N trades for rolling window
-            trades = (db.query(models.Trade)
-                     .filter(models.Trade.trading_account_login == account.login)
-                     .order_by(models.Trade.closed_at.desc())
-                     .limit(settings.WINDOW_SIZE)
-                     .all())
-
-            if not trades:
-                logger.debug("Account %s - no trades, skipping", account.login)
-                continue
-
-            # Calculate metrics
-            metrics = utils.calculate_metrics(trades)
-            risk_score = utils.calculate_risk_score(metrics)
-            risk_signals = utils.generate_risk_signals(metrics)
-
-            # Save to database
-            risk_metric = models.RiskMetric(
-                account_login=account.login,
-                timestamp=datetime.now(),
-                win_ratio=metrics['win_ratio'],
-                profit_factor=metrics['profit_factor'],
-                max_drawdown=metrics['max_drawdown'],
-                stop_loss_used=metrics['stop_loss_used'],
-                take_profit_used=metrics['take_profit_used'],
-                hft_count=metrics['hft_count'],
-                max_layering=metrics['max_layering'],
-                risk_score=risk_score,
-                risk_signals=",".join(risk_signals),
-                last_trade_at=metrics['last_trade_at']
-            )
-            db.add(risk_metric)
-            db.commit()
-
-            # Send webhook if risk score exceeds threshold
-            if risk_score > settings.RISK_THRESHOLD:
-                send_webhook(account.login, risk_score, risk_signals, metrics["last_trade_at"])
-
-        logger.info("Completed risk metrics calculation")
+        with instrumentation.cycle():
+            with stage("fetch"):
+                if settings.METRICS_ENGINE == "rolling":
+                    scoring.sync_rolling_windows(db)
+
+                # Only re-score accounts with trades newer than their latest metric,
+                # unless a full recompute was requested (startup or config change)
+                if full:
+                    account_logins = None
+                elif sweep:
+                    account_logins = crud.find_stale_accounts(db) | marked
+                else:
+                    account_logins = marked
+                total_accounts = crud.count_accounts(db)
+            if account_logins is not None and not account_logins:
+                instrumentation.ACCOUNTS_SKIPPED.inc(total_accounts)
+                logger.info("No accounts received new trades - nothing to recalculate")
+                return
+
+            # Accounts that were above the threshold are scored and alerted first
+            priority = risk_scheduler.priority(account_logins) if account_logins else set()
+            batches = [priority, account_logins - priority] if priority else [account_logins]
+            results, failed, alerted = [], set(), 0
+            for batch in batches:
+                if batch is not None and not batch:
+                    continue
+                batch_results, batch_failed, batch_alerted = score_and_persist(db, batch)
+                results += batch_results
+                failed |= batch_failed
+                alerted += batch_alerted
+            # Users and challenges once per cycle, over the accounts of every batch
+            aggregates = score_and_persist_aggregates(db, None if full else [r[0] for r in results])
+            risk_scheduler.record(results)
+
+            instrumentation.ACCOUNTS_SCORED.inc(len(results) - len(failed))
+            instrumentation.ACCOUNTS_FAILED.inc(len(failed))
+            instrumentation.ACCOUNTS_SKIPPED.inc(max(total_accounts - len(results), 0))
+            instrumentation.ACCOUNTS_ALERTED.inc(alerted)
+            instrumentation.AGGREGATES_SCORED.inc(len(aggregates))
+            instrumentation.LAST_CYCLE_ACCOUNTS.set(len(results))
+            logger.info("Completed risk metrics calculation - %d accounts and %d users/challenges scored",
+                        len(results), len(aggregates))
+    except LeaseLost as e:
+        # Demoted mid-cycle: stop_cycles hands the restored accounts to the next leader
+        dirty_tracker.restore(full, marked)
+        logger.warning("Risk calculation abandoned: %s", e)
     except Exception:
+        dirty_tracker.restore(full, marked)
         logger.error("Exception during risk calculation:\n%s", traceback.format_exc())
     finally:
         db.close()
         logger.debug("DB session closed")
 
 
+def score_and_persist(db: Session, account_logins, persist: bool = True, use_workers: bool = True,
+                      store: WindowStore = None):
+    """
+    Score `account_logins` (None: every account), then save the results and
+    queue alerts unless persist is False. The rolling engine scores from
+    `store`, by default the shared window store.
+    Return (results, failed logins, alerts queued).
+    """
+    # Get last N trades for rolling window of every account and score them.
+    # Rolling windows live in this process, so that engine always scores serially
+    with stage("compute"):
+        if use_workers and settings.SCORING_WORKERS > 1 and settings.METRICS_ENGINE != "rolling":
+            results = parallel.score_accounts(account_logins)
+        else:
+            results = list(scoring.score_accounts(db, account_logins, store=store))
+    if not persist:
+        return results, set(), 0
+
+    # Save to database in one transaction
+    with stage("persist"):
+        timestamp = datetime.now()
+        rows = [{"account_login": account_login, **scoring.metric_row(timestamp, *result)}
+                for account_login, *result in results]
+        with SessionLocal() as writer:
+            leader_election.confirm(writer)
+            failed = crud.persist_risk_metrics(writer, rows, settings.PERSIST_CHUNK_SIZE)
+            # Tell the other workers; a full pass is one row for every account
+            crud.record_risk_changes(writer, [crud.ALL_CHANGED] if account_logins is None else
+                                     [("account", row["account_login"]) for row in rows
+                                      if row["account_login"] not in failed],
+                                     leader_election.worker_id, timestamp)
+            writer.commit()
+    risk_report_cache.invalidate(row["account_login"] for row in rows)
+    # Push changed scores to streaming clients
+    publish_results(timestamp, ((("account", account_login), result)
+                                for account_login, *result in results if account_login not in failed))
+    if failed:
+        # Retry the accounts of failed chunks on the next cycle
+        dirty_tracker.mark(failed)
+
+    alerted = 0
+    with stage("webhook"):
+        for account_login, metrics, risk_score, risk_signals in results:
+            # Send webhook if risk score exceeds threshold
+            if risk_score > settings.RISK_THRESHOLD and account_login not in failed:
+                alerted += send_webhook(account_login, risk_score, risk_signals, metrics["last_trade_at"])
+        # Accounts back under the threshold are alerted again if they cross it with the same score
+        webhook_dispatcher.clear(account_login for account_login, _, risk_score, _ in results
+                                 if risk_score <= settings.RISK_THRESHOLD and account_login not in failed)
+    return results, failed, alerted
+
+
+def score_and_persist_aggregates(db: Session, account_logins, persist: bool = True, use_workers: bool = True):
+    """
+    Score the users and challenges owning `account_logins` (None: all of them)
+    and save the results unless persist is False. Return the aggregates.
+    """
+    with stage("compute"):
+        if use_workers and settings.SCORING_WORKERS > 1 and settings.METRICS_ENGINE != "rolling":
+            aggregates = parallel.score_aggregates(db, account_logins)
+        else:
+            aggregates = list(scoring.score_aggregates(db, account_logins))
+    if not persist:
+        return aggregates
+
+    with stage("persist"):
+        timestamp = datetime.now()
+        with SessionLocal() as writer:
+            leader_election.confirm(writer)
+            crud.persist_risk_aggregates(writer, [{"scope": scope, "scope_id": scope_id,
+                                                   **scoring.metric_row(timestamp, *result)}
+                                                  for scope, scope_id, *result in aggregates])
+            crud.record_risk_changes(writer, [crud.ALL_CHANGED] if account_logins is None else
+                                     [(scope, scope_id) for scope, scope_id, *_ in aggregates],
+                                     leader_election.worker_id, timestamp)
+            writer.commit()
+    publish_results(timestamp, (((scope, scope_id), result) for scope, scope_id, *result in aggregates))
+    return aggregates
+
+
+def publish_results(timestamp: datetime, keyed_results):
+    """
+    Push committed ((scope, id), (metrics, risk_score, risk_signals)) results to
+    streaming clients; payloads are only built for subscribed keys
+    """
+    risk_broadcaster.publish(keyed_results, lambda key, result: risk_update(
+        *key, timestamp, result[1], result[2], result[0]["last_trade_at"]))
+
+
 def send_webhook(account_login: int, score: float, signals: list[str], last_trade: datetime):
-    payload = {
-        "trading_account_login": account_login,
-        "risk_signals": signals,
-        "risk_score": score,
-        "last_trade_at": last_trade.isoformat() if last_trade else None,
-    }
-    try:
-        response = requests.post(settings.WEBHOOK_URL, json=payload, timeout=5)
-        response.raise_for_status()
-        logger.info("Webhook sent - account %s (HTTP %s)", account_login, response.status_code)
-    except Exception as e:
-        logger.error(f"Webhook FAILED - account{e}")
+    """Queue a high-risk alert on the background dispatcher; return whether it was queued"""
+    return webhook_dispatcher.submit(account_login, score, signals, last_trade)
 
 
 # API Endpoints
@@ -146,61 +353,448 @@ def read_root():
     return RedirectResponse(url="/docs")
 
 
+def risk_report_response(account_login: int, risk_metric):
+    """Build a RiskReport response from a stored risk metric"""
+    return {
+        "trading_account_login": account_login,
+        "risk_signals": risk_metric.risk_signals.split(",") if risk_metric.risk_signals else [],
+        "risk_score": risk_metric.risk_score,
+        "last_trade_at": risk_metric.last_trade_at
+    }
+
+
+def account_report_items(db: Session, account_logins: List[int]):
+    """Yield batch lookup items for account logins, in request order"""
+    for start in range(0, len(account_logins), crud.LOGIN_BATCH_SIZE):
+        batch = account_logins[start:start + crud.LOGIN_BATCH_SIZE]
+        found = crud.get_latest_risk_metrics(db, batch)
+        for login in batch:
+            risk_metric = found.get(login)
+            yield {"id": login, "found": risk_metric is not None,
+                   "report": risk_report_response(login, risk_metric) if risk_metric else None}
+
+
+def group_report_items(db: Session, scope: str, group_ids: List[int]):
+    """
+    Yield batch lookup items for user or challenge ids, in request order, from the
+    precomputed aggregates; groups not aggregated yet are computed on the spot
+    """
+    for start in range(0, len(group_ids), crud.LOGIN_BATCH_SIZE):
+        batch = group_ids[start:start + crud.LOGIN_BATCH_SIZE]
+        reports = {group_id: risk_report_response(group_id, aggregate)
+                   for group_id, aggregate in crud.get_risk_aggregates(db, scope, batch).items()}
+
+        missing = set(batch) - set(reports)
+        if missing:
+            for group_id, metrics, risk_score, risk_signals in scoring.score_groups(
+                    db, scoring.AGGREGATE_SCOPES[scope], missing):
+                reports[group_id] = {
+                    "trading_account_login": group_id,
+                    "risk_signals": risk_signals,
+                    "risk_score": risk_score,
+                    "last_trade_at": metrics['last_trade_at']
+                }
+        for group_id in batch:
+            report = reports.get(group_id)
+            yield {"id": group_id, "found": report is not None, "report": report}
+
+
+def batch_lookup_response(db: Session, ids: List[int], stream: bool, items):
+    """Return all batch items at once, or stream them as NDJSON with a dedicated session"""
+    if not stream:
+        return list(items(db, ids))
+
+    def lines():
+        stream_db = ReadSessionLocal()
+        try:
+            for item in items(stream_db, ids):
+                yield schemas.RiskReportBatchItem(**item).model_dump_json() + "\n"
+        finally:
+            stream_db.close()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+@app.post("/risk-report/batch", response_model=List[schemas.RiskReportBatchItem])
+def get_risk_report_batch(lookup: schemas.BatchLookup,
+                          stream: bool = Query(False, description="Stream results as NDJSON"),
+                          db: Session = Depends(get_db)):
+    logger.info(f"POST /risk-report/batch - {len(lookup.ids)} accounts")
+    return batch_lookup_response(db, lookup.ids, stream, account_report_items)
+
+
+@app.post("/risk/user/batch", response_model=List[schemas.RiskReportBatchItem])
+def get_user_risk_report_batch(lookup: schemas.BatchLookup,
+                               stream: bool = Query(False, description="Stream results as NDJSON"),
+                               db: Session = Depends(get_db)):
+    logger.info(f"POST /risk/user/batch - {len(lookup.ids)} users")
+    return batch_lookup_response(
+        db, lookup.ids, stream,
+        lambda session, ids: group_report_items(session, "user", ids))
+
+
+@app.post("/risk/challenge/batch", response_model=List[schemas.RiskReportBatchItem])
+def get_challenge_risk_report_batch(lookup: schemas.BatchLookup,
+                                    stream: bool = Query(False, description="Stream results as NDJSON"),
+                                    db: Session = Depends(get_db)):
+    logger.info(f"POST /risk/challenge/batch - {len(lookup.ids)} challenges")
+    return batch_lookup_response(
+        db, lookup.ids, stream,
+        lambda session, ids: group_report_items(session, "challenge", ids))
+
+
 @app.get("/risk-report/{account_login}", response_model=schemas.RiskReport)
 def get_risk_report(account_login: int, db: Session = Depends(get_db)):
+    cached = risk_report_cache.get(account_login)
+    if cached is not None:
+        return cached
+
     # Get latest risk metric for account
-    risk_metric = (db.query(models.RiskMetric)
-                 .filter(models.RiskMetric.account_login == account_login)
-                 .order_by(models.RiskMetric.timestamp.desc())
-                 .first())
+    risk_metric = crud.get_latest_risk_metric(db, account_login)
 
     if not risk_metric:
         logger.warning(f"Account not found: {account_login}")
         raise HTTPException(status_code=404, detail="Account not found")
 
-    response = {
-        "trading_account_login": account_login,
-        "risk_signals": risk_metric.risk_signals.split(",") if risk_metric.risk_signals else [],
-        "risk_score": risk_metric.risk_score,
-        "last_trade_at": risk_metric.last_trade_at
-    }
+    response = risk_report_response(account_login, risk_metric)
 
+    risk_report_cache.set(account_login, response)
     logger.info(f"GET /risk-report/{account_login} - {response}")
     return response
 
 
+def _require_admin(admin_token: str):
+    if admin_token != "secure_admin_token":
+        logger.warning(f"User Unauthorized : Wrong token! {admin_token}")
+        raise HTTPException(status_code=403, detail="Unauthorized")
+
+
+# ConfigUpdate fields and the settings they override
+CONFIG_SETTINGS = {**reevaluation.THRESHOLD_SETTINGS, **reevaluation.METRIC_SETTINGS}
+
+
 @app.post("/admin/update-config")
 def update_config(new_config: schemas.ConfigUpdate,
             admin_token: str = Query(..., description="Admin token")):
 
-    if admin_token != "secure_admin_token":
-        logger.warning(f"User Unauthorized : Wrong token! {admin_token}")
-        raise HTTPException(status_code=403, detail="Unauthorized")
+    _require_admin(admin_token)
+    updates = new_config.model_dump(exclude_none=True)
+    overrides = {CONFIG_SETTINGS[field]: value for field, value in updates.items()}
 
-    # Update configuration
-    if new_config.window_size is not None:
-        settings.WINDOW_SIZE = new_config.window_size
-    if new_config.win_ratio_threshold is not None:
-        settings.WIN_RATIO_THRESHOLD = new_config.win_ratio_threshold
-    if new_config.drawdown_threshold is not None:
-        settings.DRAWDOWN_THRESHOLD = new_config.drawdown_threshold
-    if new_config.stop_loss_threshold is not None:
-        settings.STOP_LOSS_THRESHOLD = new_config.stop_loss_threshold
-    if new_config.take_profit_threshold is not None:
-        settings.TAKE_PROFIT_THRESHOLD = new_config.take_profit_threshold
-    if new_config.risk_threshold is not None:
-        settings.RISK_THRESHOLD = new_config.risk_threshold
-    if new_config.initial_balance is not None:
-        settings.INITIAL_BALANCE = new_config.initial_balance
-    if new_config.hft_duration is not None:
-        settings.HFT_DURATION = new_config.hft_duration
+    # Saved for every worker, which reloads it from the change feed
+    with config_lock:
+        previous_risk_threshold = settings.RISK_THRESHOLD
+        if overrides:
+            with SessionLocal() as writer:
+                crud.save_config_settings(writer, overrides, datetime.now())
+                writer.commit()
+        for name, value in overrides.items():
+            setattr(settings, name, value)
 
     logger.info(f"Configuration updated: {new_config.model_dump()}")
-    return {"message": f"Configuration updated {new_config}"}
+    response = {"message": f"Configuration updated {new_config}"}
+    if not overrides:
+        return response
+    if not leader_election.is_leader:
+        # Only the leader rewrites signals and sends alerts; it reloads the settings within CHANGE_POLL_INTERVAL
+        response["message"] += "; the leader worker applies it"
+        return response
+
+    reevaluation_result = apply_config_effects(overrides, previous_risk_threshold)
+    if reevaluation_result is not None:
+        response["reevaluation"] = reevaluation_result
+    return response
+
+
+def reload_settings():
+    """
+    Apply the settings saved by /admin/update-config in any worker; on the
+    leader, changed settings also re-derive signals or recompute every account
+    """
+    with config_lock:
+        with ReadSessionLocal() as db:
+            _, overrides = crud.load_config_settings(db)
+        previous = {name: getattr(settings, name) for name in overrides}
+        for name, value in overrides.items():
+            setattr(settings, name, value)
+    changed = [name for name, value in overrides.items() if previous[name] != value]
+    if not changed:
+        return
+    logger.info("Reloaded settings: %s", {name: overrides[name] for name in changed})
+    if leader_election.is_leader:
+        apply_config_effects(changed, previous.get("RISK_THRESHOLD", settings.RISK_THRESHOLD))
+
+
+def apply_config_effects(names, previous_risk_threshold: float):
+    """
+    On the leader, after the `names` settings changed: only thresholds re-derive
+    the stored signals and alerts (returning the result), anything else
+    recomputes every account
+    """
+    if not set(names) & set(reevaluation.METRIC_SETTINGS.values()):
+        # Only thresholds changed: re-derive signals and alerts from the stored metrics
+        try:
+            return apply_reevaluation(previous_risk_threshold)
+        except LeaseLost as e:
+            logger.warning("Threshold re-evaluation abandoned: %s", e)
+            return None
+        except SQLAlchemyError:
+            logger.exception("Threshold re-evaluation failed, recomputing every account")
+
+    # Every account's score may change under the new configuration
+    dirty_tracker.mark_all()
+    risk_scheduler.notify()
+    return None
+
+
+def apply_reevaluation(previous_risk_threshold: float):
+    """Write re-derived signals, then alert the accounts the new risk threshold made eligible"""
+    result = reevaluation.reevaluate(apply=True, previous_risk_threshold=previous_risk_threshold)
+    high_risk = result.pop("high_risk")
+    risk_scheduler.set_high_risk(high_risk)
+    webhook_dispatcher.retain(high_risk)
+    risk_report_cache.clear()
+    # Streaming clients following a key whose signals changed get the new signal set
+    risk_broadcaster.publish((((row[0], row[1]), row) for row in result.pop("changed")),
+                             lambda key, row: risk_update(*row))
+    for account_login, risk_score, risk_signals, last_trade_at in result.pop("alerts"):
+        send_webhook(account_login, risk_score, risk_signals, last_trade_at)
+    return schemas.ReevaluationResult(**result)
+
+
+@app.post("/admin/what-if", response_model=schemas.ReevaluationResult)
+def what_if(proposed: schemas.ConfigUpdate,
+            admin_token: str = Query(..., description="Admin token")):
+    """How many signals and alerts would flip under proposed thresholds, without applying them"""
+    _require_admin(admin_token)
+
+    updates = proposed.model_dump(exclude_none=True)
+    metric_fields = sorted(set(updates) & set(reevaluation.METRIC_SETTINGS))
+    if metric_fields:
+        raise HTTPException(status_code=400,
+                            detail=f"Not evaluable from stored metrics, needs a full recompute: {', '.join(metric_fields)}")
+
+    thresholds = {reevaluation.THRESHOLD_SETTINGS[field]: value for field, value in updates.items()}
+    logger.info(f"POST /admin/what-if - {thresholds}")
+    return reevaluation.reevaluate(thresholds)
+
+
+def profile_cycle(sample: Optional[int], persist: bool):
+    """
+    One scoring pass for profiling. It leaves the dirty tracker alone, so the
+    scheduled cycle still picks up everything pending, and scores in this
+    thread so the profiler sees the work. The rolling engine advances a copy
+    of the window store: moving the live one would hide the trades it
+    consumed from the next scheduled cycle
+    """
+    db = ReadSessionLocal()
+    try:
+        store = None
+        if settings.METRICS_ENGINE == "rolling":
+            store = window_store.copy() if window_store.ready else WindowStore()
+            scoring.sync_rolling_windows(db, store)
+        account_logins = crud.sample_account_logins(db, sample) if sample else None
+        results, failed, alerted = score_and_persist(db, account_logins, persist, use_workers=False, store=store)
+        aggregates = score_and_persist_aggregates(db, None if account_logins is None else [r[0] for r in results],
+                                                  persist, use_workers=False)
+        return {"accounts": len(results), "aggregates": len(aggregates), "persisted": persist,
+                "failed": len(failed), "alerted": alerted}
+    finally:
+        db.close()
+
+
+@app.post("/admin/profile")
+def profile_risk_cycle(admin_token: str = Query(..., description="Admin token"),
+                       sample: Optional[int] = Query(None, ge=1, description="Score this many random accounts instead of all"),
+                       persist: bool = Query(False, description="Save the scores and send alerts like a normal cycle"),
+                       top: int = Query(30, ge=1, le=500, description="Functions to return, by cumulative time"),
+                       interval: float = Query(0.005, gt=0, le=1, description="Stack sampling interval in seconds"),
+                       store: bool = Query(False, description="Also write the reports to PROFILE_DIR")):
+    """Run one scoring pass under cProfile and a stack sampler"""
+    _require_admin(admin_token)
+    if persist and leader_election.campaigning and not leader_election.is_leader:
+        raise HTTPException(status_code=409, detail="Only the leader worker persists scores; profile without persist")
+
+    # One profiler at a time; the scheduled cycle is not affected
+    if not profile_lock.acquire(blocking=False):
+        raise HTTPException(status_code=409, detail="A profiling run is already in progress")
+    try:
+        summary, report = profiling.profile_call(profile_cycle, sample, persist, top=top, interval=interval,
+                                                 store_dir=settings.PROFILE_DIR if store else None)
+    finally:
+        profile_lock.release()
+
+    logger.info(f"POST /admin/profile - {summary} in {report['seconds']}s")
+    return {**summary, **report}
+
+
+def history_item(rank: int, row):
+    """Build a RiskHistoryItem from a raw risk metric or a rollup"""
+    rollup = rank != crud.HISTORY_RANKS["raw"]
+    item = {
+        "timestamp": row.bucket_start if rollup else row.timestamp,
+        "resolution": row.resolution if rollup else "raw",
+        "samples": row.samples if rollup else 1,
+        "risk_score_min": row.risk_score_min if rollup else row.risk_score,
+        "risk_score_max": row.risk_score_max if rollup else row.risk_score,
+        "risk_signals": row.risk_signals.split(",") if row.risk_signals else [],
+        "last_trade_at": row.last_trade_at,
+    }
+    for name in ("risk_score", "win_ratio", "profit_factor", "max_drawdown", "stop_loss_used",
+                 "take_profit_used", "hft_count", "max_layering"):
+        item[name] = getattr(row, name)
+    # Infinite profit factors (no losing trades) are not valid JSON
+    if item["profit_factor"] is not None and not math.isfinite(item["profit_factor"]):
+        item["profit_factor"] = None
+    return item
+
+
+def encode_history_cursor(timestamp: datetime, rank: int, id_: int):
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{rank}|{id_}".encode()).decode()
+
+
+def decode_history_cursor(cursor: str):
+    try:
+        timestamp, rank, id_ = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(rank), int(id_)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@app.get("/export/risk")
+def export_risk(format: str = Query("ndjson", pattern="^(ndjson|csv|parquet)$", description="ndjson, csv or parquet"),
+                challenge_id: Optional[int] = Query(None, description="Only accounts of this challenge"),
+                phase: Optional[Phase] = Query(None, description="Only accounts in this phase"),
+                min_risk_score: Optional[float] = Query(None, description="Only accounts scoring at least this"),
+                chunk_size: Optional[int] = Query(None, ge=1, le=100000, description="Rows per chunk")):
+    """
+    Stream the latest risk metrics of every account matching the filters, read
+    through one server-side cursor in chunks so memory stays flat
+    """
+    if format == "parquet" and not export.PARQUET_AVAILABLE:
+        raise HTTPException(status_code=400, detail="Parquet export needs pyarrow: pip install pyarrow")
+    logger.info(f"GET /export/risk - format={format} challenge_id={challenge_id} phase={phase} "
+                f"min_risk_score={min_risk_score}")
+
+    def chunks():
+        export_db = ReadSessionLocal()
+        try:
+            yield from crud.stream_risk_export(export_db, challenge_id, phase, min_risk_score, chunk_size)
+        finally:
+            export_db.close()
+
+    filename = f"risk-export-{datetime.now():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(export.FORMATS[format](chunks()), media_type=export.MEDIA_TYPES[format],
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+def stream_snapshot(keys):
+    """Stored state of the streamed accounts, users and challenges, as (key, update) pairs"""
+    db = ReadSessionLocal()
+    try:
+        snapshot = []
+        logins = [scope_id for scope, scope_id in keys if scope == "account"]
+        for login, metric in crud.get_latest_risk_metrics(db, logins).items():
+            signals = metric.risk_signals.split(",") if metric.risk_signals else []
+            snapshot.append((("account", login), risk_update("account", login, metric.timestamp, metric.risk_score,
+                                                             signals, metric.last_trade_at)))
+        for scope in scoring.AGGREGATE_SCOPES:
+            scope_ids = [scope_id for key_scope, scope_id in keys if key_scope == scope]
+            for scope_id, aggregate in crud.get_risk_aggregates(db, scope, scope_ids).items():
+                signals = aggregate.risk_signals.split(",") if aggregate.risk_signals else []
+                snapshot.append(((scope, scope_id), risk_update(scope, scope_id, aggregate.timestamp,
+                                                                aggregate.risk_score, signals,
+                                                                aggregate.last_trade_at)))
+        return snapshot
+    finally:
+        db.close()
+
+
+def sse_event(update):
+    return f"event: risk\ndata: {json.dumps(update)}\n\n"
+
+
+@app.get("/stream/risk")
+async def stream_risk(accounts: List[int] = Query([], description="Account logins to follow"),
+                      users: List[int] = Query([], description="User ids to follow"),
+                      challenges: List[int] = Query([], description="Challenge ids to follow")):
+    """
+    Server-Sent Events stream of risk updates. Clients first get the stored
+    state of every followed key, then an event whenever a cycle or a
+    threshold re-evaluation commits a changed score or signal set for one of
+    them.
+    """
+    keys = ({("account", login) for login in accounts} | {("user", user_id) for user_id in users}
+            | {("challenge", challenge_id) for challenge_id in challenges})
+    if not keys:
+        raise HTTPException(status_code=400, detail="Follow at least one account, user or challenge")
+    if len(keys) > settings.STREAM_MAX_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {settings.STREAM_MAX_KEYS} keys per stream")
+    logger.info(f"GET /stream/risk - {len(keys)} keys")
+
+    async def events():
+        # Subscribe before reading the snapshot so no committed change is missed
+        subscriber = risk_broadcaster.subscribe(keys, asyncio.get_running_loop())
+        try:
+            snapshot = await run_in_threadpool(stream_snapshot, keys)
+            risk_broadcaster.seed(snapshot)
+            for _, update in snapshot:
+                yield sse_event(update)
+            while True:
+                try:
+                    await asyncio.wait_for(subscriber.wait(), settings.STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                for update in subscriber.take():
+                    yield sse_event(update)
+        finally:
+            risk_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@app.get("/risk/history/{account_login}", response_model=schemas.RiskHistoryPage)
+def get_risk_history(account_login: int = Path(...),
+                     start: Optional[datetime] = Query(None, description="Only entries at or after this time"),
+                     end: Optional[datetime] = Query(None, description="Only entries before this time"),
+                     resolution: str = Query("all", pattern="^(all|raw|hour|day)$",
+                                             description="raw metrics, hourly or daily rollups, or all of them"),
+                     limit: int = Query(None, ge=1, le=1000, description="Page size"),
+                     cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+                     db: Session = Depends(get_db)):
+    """Risk history of an account, newest first, with keyset pagination"""
+    limit = limit or settings.HISTORY_PAGE_SIZE
+    resolutions = list(crud.HISTORY_RANKS) if resolution == "all" else [resolution]
+    position = decode_history_cursor(cursor) if cursor else None
+
+    entries = crud.get_risk_history(db, account_login, resolutions, start, end, position, limit)
+    if not entries and cursor is None and db.get(models.Account, account_login) is None:
+        logger.warning(f"Account not found: {account_login}")
+        raise HTTPException(status_code=404, detail="Account not found")
+
+    items = [history_item(rank, row) for rank, _, row in entries]
+    next_cursor = None
+    if len(entries) == limit:
+        rank, id_, _ = entries[-1]
+        next_cursor = encode_history_cursor(items[-1]["timestamp"], rank, id_)
+
+    logger.info(f"GET /risk/history/{account_login} - {len(items)} entries")
+    return {"account_login": account_login, "items": items, "next_cursor": next_cursor}
 
 
 @app.get("/risk/user/{user_id}", response_model=schemas.RiskReport)
-def get_user_risk_report(user_id: int = Path(...), db: Session = Depends(get_db)):
+def get_user_risk_report(user_id: int = Path(...),
+                        fresh: bool = Query(False, description="Recompute instead of using the last cycle's score"),
+                        db: Session = Depends(get_db)):
+    if not fresh:
+        aggregate = crud.get_risk_aggregates(db, "user", [user_id]).get(user_id)
+        if aggregate is not None:
+            response = risk_report_response(user_id, aggregate)
+            logger.info(f"GET /risk/user/{user_id} - {response}")
+            return response
+
     accounts = db.query(models.Account).filter_by(user_id=user_id).all()
     if not accounts:
         logger.warning(f"User ID not found {user_id}.")
@@ -233,7 +827,16 @@ def get_user_risk_report(user_id: int = Path(...), db: Session = Depends(get_db)
 
 
 @app.get("/risk/challenge/{challenge_id}", response_model=schemas.RiskReport)
-def get_challenge_risk_report(challenge_id: int = Path(...), db: Session = Depends(get_db)):
+def get_challenge_risk_report(challenge_id: int = Path(...),
+                             fresh: bool = Query(False, description="Recompute instead of using the last cycle's score"),
+                             db: Session = Depends(get_db)):
+    if not fresh:
+        aggregate = crud.get_risk_aggregates(db, "challenge", [challenge_id]).get(challenge_id)
+        if aggregate is not None:
+            response = risk_report_response(challenge_id, aggregate)
+            logger.info(f"GET /risk/challenge/{challenge_id} - {response}")
+            return response
+
     accounts = db.query(models.Account).filter_by(challenge_id=challenge_id).all()
     if not accounts:
         logger.warning(f"Challenge ID not found {challenge_id}.")
@@ -265,12 +868,91 @@ def get_challenge_risk_report(challenge_id: int = Path(...), db: Session = Depen
     return response
 
 
+@app.post("/accounts/batch", response_model=schemas.IngestResult)
+def ingest_accounts(accounts: List[schemas.AccountCreate], db: Session = Depends(get_write_db)):
+    rows = crud.upsert_accounts(db, [a.model_dump() for a in accounts])
+    db.commit()
+
+    logger.info(f"POST /accounts/batch - {rows} accounts upserted")
+    return {"rows": rows}
+
+
+@app.post("/trades/batch", response_model=schemas.IngestResult)
+def ingest_trades(trades: List[schemas.TradeCreate], db: Session = Depends(get_write_db)):
+    # Resent trades within the batch are collapsed, so rows can be fewer than trades
+    rows, logins = crud.upsert_trades(db, [t.model_dump() for t in trades])
+    db.commit()
+
+    # Re-score the affected accounts on the next cycle
+    request_rescore(logins)
+
+    logger.info(f"POST /trades/batch - {rows} of {len(trades)} trades upserted, {len(logins)} accounts marked")
+    return {"rows": rows, "accounts_marked": len(logins)}
+
+
+def write_trades(trades):
+    """Upsert a validated upload in one writer transaction; return (rows written, account logins)"""
+    with SessionLocal() as writer:
+        written, logins = crud.upsert_trades(writer, trades)
+        writer.commit()
+    return written, logins
+
+
+@app.post("/trades/stream", response_model=schemas.IngestResult)
+async def ingest_trades_stream(request: Request):
+    """
+    Upsert an NDJSON body of trades, one TradeCreate object per line, in one
+    transaction. Every line is validated while the body arrives; the writer
+    connection is only taken once the whole body is read and valid, so it is
+    never held while a client is sending, and a bad line writes nothing.
+    """
+    trades, line_no = [], 0
+    buffer = b""
+
+    def parse(line: bytes):
+        try:
+            trades.append(schemas.TradeCreate.model_validate_json(line).model_dump())
+        except ValidationError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid trade on line {line_no}: {e}")
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            if line.strip():
+                parse(line)
+    if buffer.strip():
+        line_no += 1
+        parse(buffer)
+
+    # Resent identifiers are collapsed across the whole upload, so rows can be fewer than lines
+    rows, logins = await run_in_threadpool(write_trades, trades) if trades else (0, set())
+    await run_in_threadpool(request_rescore, logins)
+
+    logger.info(f"POST /trades/stream - {rows} of {len(trades)} trades upserted, {len(logins)} accounts marked")
+    return {"rows": rows, "accounts_marked": len(logins)}
+
+
 @app.get("/health")
 def health_check():
     response = {
         "status": "ok",
-        "background_task": "running" if background_task and not background_task.done() else "inactive"
+        "background_task": "running" if risk_scheduler.running else (
+            "standby" if not leader_election.is_leader else "inactive"),
+        "leader": leader_election.stats(),
+        "scheduler": risk_scheduler.stats(),
+        "webhook": webhook_dispatcher.stats(),
+        "risk_report_cache": risk_report_cache.stats(),
+        "change_feed": change_feed.stats()
     }
 
     logger.info(f"GET /health/  - {response}")
     return response
+
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text exposition of the cycle, API, database and webhook metrics"""
+    return PlainTextResponse(instrumentation.registry.render(),
+                             media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,32 @@
+from sqlalchemy import inspect, text
+from app.database import Base
+import app.models  # noqa: F401 - registers the tables on Base.metadata
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def run_migrations(engine):
+    """
+    Bring an existing database up to the current schema.
+
+    create_all only creates missing tables (with their indexes), so indexes
+    declared later on existing tables are added here. Statistics are refreshed
+    afterwards so the query planner picks the new indexes up.
+    """
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    created = []
+    for table in Base.metadata.sorted_tables:
+        existing = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                logger.info("Creating index %s on %s", index.name, table.name)
+                index.create(bind=engine)
+                created.append(index.name)
+
+    if created:
+        with engine.begin() as conn:
+            conn.execute(text("ANALYZE"))
+    return created
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, Float, String, DateTime, ForeignKey, Index
 from .database import Base
 
 
@@ -11,6 +11,12 @@ class Account(Base):
     user_id = Column(Integer)
     challenge_id = Column(Integer)
 
+    __table_args__ = (
+        # User and challenge aggregates and lookups
+        Index('ix_accounts_user_id', 'user_id'),
+        Index('ix_accounts_challenge_id', 'challenge_id'),
+    )
+
 
 class Trade(Base):
     __tablename__ = 'trades'
@@ -34,6 +40,13 @@ class Trade(Base):
     platform = Column(Integer)
     trading_account_login = Column(Integer, ForeignKey('accounts.login'))
 
+    __table_args__ = (
+        # Last-N window per account and newest trade per account
+        Index('ix_trades_login_closed_at', 'trading_account_login', 'closed_at'),
+        # Trades closed since the last cycle
+        Index('ix_trades_closed_at', 'closed_at'),
+    )
+
 
 class RiskMetric(Base):
     __tablename__ = 'risk_metrics'
@@ -50,3 +63,154 @@ class RiskMetric(Base):
     risk_score = Column(Float)
     risk_signals = Column(String)
     last_trade_at = Column(DateTime)
+
+    __table_args__ = (
+        # Latest and historical metrics of an account
+        Index('ix_risk_metrics_login_timestamp', 'account_login', 'timestamp'),
+        # Rows past the raw retention period, oldest first
+        Index('ix_risk_metrics_timestamp', 'timestamp'),
+    )
+
+
+class RiskLatest(Base):
+    """Most recent risk metric of each account, upserted by every cycle"""
+    __tablename__ = 'risk_latest'
+    account_login = Column(Integer, ForeignKey('accounts.login'), primary_key=True)
+    timestamp = Column(DateTime)
+    win_ratio = Column(Float)
+    profit_factor = Column(Float)
+    max_drawdown = Column(Float)
+    stop_loss_used = Column(Float)
+    take_profit_used = Column(Float)
+    hft_count = Column(Integer)
+    max_layering = Column(Integer)
+    risk_score = Column(Float)
+    risk_signals = Column(String)
+    last_trade_at = Column(DateTime)
+
+
+class RiskAggregate(Base):
+    """Latest risk score of a user or challenge, across all of its accounts"""
+    __tablename__ = 'risk_aggregates'
+    scope = Column(String, primary_key=True)  # "user" or "challenge"
+    scope_id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime)
+    win_ratio = Column(Float)
+    profit_factor = Column(Float)
+    max_drawdown = Column(Float)
+    stop_loss_used = Column(Float)
+    take_profit_used = Column(Float)
+    hft_count = Column(Integer)
+    max_layering = Column(Integer)
+    risk_score = Column(Float)
+    risk_signals = Column(String)
+    last_trade_at = Column(DateTime)
+
+
+class RiskMetricRollup(Base):
+    """
+    Risk metrics of an account downsampled to one row per hour or day, written
+    by the retention job. Ratios and the risk score are averaged over the
+    bucket's samples, drawdown, HFT count and layering keep their maximum, and
+    the risk signals are those of the latest sample.
+    """
+    __tablename__ = 'risk_metric_rollups'
+    account_login = Column(Integer, ForeignKey('accounts.login'), primary_key=True)
+    resolution = Column(String, primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    samples = Column(Integer)
+    last_timestamp = Column(DateTime)  # timestamp of the latest sample
+    win_ratio = Column(Float)
+    profit_factor = Column(Float)
+    max_drawdown = Column(Float)
+    stop_loss_used = Column(Float)
+    take_profit_used = Column(Float)
+    hft_count = Column(Integer)
+    max_layering = Column(Integer)
+    risk_score = Column(Float)
+    risk_score_min = Column(Float)
+    risk_score_max = Column(Float)
+    risk_signals = Column(String)
+    last_trade_at = Column(DateTime)
+
+    __table_args__ = (
+        # Rollups past their retention period, oldest first
+        Index('ix_risk_metric_rollups_resolution_bucket', 'resolution', 'bucket_start'),
+    )
+
+
+class RiskReplay(Base):
+    """Risk metric series computed by app.replay over the full trade history, one run per run_id"""
+    __tablename__ = 'risk_replays'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    run_id = Column(String)
+    account_login = Column(Integer)
+    as_of = Column(DateTime)  # closed_at of the replayed trade, or end of the interval
+    last_trade_at = Column(DateTime)
+    win_ratio = Column(Float)
+    profit_factor = Column(Float)
+    max_drawdown = Column(Float)
+    stop_loss_used = Column(Float)
+    take_profit_used = Column(Float)
+    hft_count = Column(Integer)
+    max_layering = Column(Integer)
+    risk_score = Column(Float)
+    risk_signals = Column(String)
+
+    __table_args__ = (
+        # Series of one account within a run
+        Index('ix_risk_replays_run_login_as_of', 'run_id', 'account_login', 'as_of'),
+    )
+
+
+class LeaderLease(Base):
+    """Lease on a role only one worker process may hold, renewed by its holder until it stops or dies"""
+    __tablename__ = 'leader_leases'
+    name = Column(String, primary_key=True)
+    holder = Column(String)  # worker id of the current holder
+    acquired_at = Column(DateTime)
+    expires_at = Column(DateTime)
+
+
+class PendingRescore(Base):
+    """Accounts marked for re-scoring by a worker that does not run the risk cycles"""
+    __tablename__ = 'pending_rescores'
+    account_login = Column(Integer, primary_key=True)
+    marked_at = Column(DateTime)
+
+
+class RiskChange(Base):
+    """
+    Risk rows committed by the leader, one row per changed key, read by every
+    worker to invalidate its caches and notify its streaming clients. Scope
+    "all" stands for every account, user and challenge.
+    """
+    __tablename__ = 'risk_changes'
+    id = Column(Integer, primary_key=True)  # commit order
+    scope = Column(String)  # account, user, challenge or all
+    scope_id = Column(Integer)
+    worker = Column(String)  # worker id of the writer, which already applied the change itself
+    changed_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('ix_risk_changes_changed_at', 'changed_at'),
+        {'sqlite_autoincrement': True},
+    )
+
+
+class ConfigSetting(Base):
+    """Setting overridden through /admin/update-config, reloaded by every worker when the version grows"""
+    __tablename__ = 'config_settings'
+    name = Column(String, primary_key=True)  # Settings attribute, e.g. RISK_THRESHOLD
+    value = Column(String)  # JSON
+    version = Column(Integer)
+    updated_at = Column(DateTime)
+
+
+class LoadProgress(Base):
+    """Rows of a CSV file already loaded by initial_data_load.py, for resuming"""
+    __tablename__ = 'load_progress'
+    source = Column(String, primary_key=True)  # absolute file path
+    signature = Column(String)  # size and mtime of the file when loading started
+    rows_done = Column(Integer)
+    updated_at = Column(DateTime)
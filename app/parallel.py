@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import threading
+from sqlalchemy.orm import Session
+from app.config import settings
+import app.crud as crud
+import app.scoring as scoring
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the shared scoring process pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs threads and an event loop is unsafe
+            _pool = ProcessPoolExecutor(max_workers=settings.SCORING_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(cancel_futures=True)
+            _pool = None
+
+
+def config_snapshot():
+    """Current settings, sent to workers so admin config updates apply there too"""
+    return {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+
+
+def _shard_tasks(ids, shards: int):
+    """
+    Split work into (ids, shard) tasks: explicit ids are partitioned by id % shards,
+    otherwise each worker filters its (index, count) shard in SQL
+    """
+    if ids is None:
+        return [(None, (index, shards)) for index in range(shards)]
+    buckets = [[] for _ in range(shards)]
+    for id_ in ids:
+        buckets[id_ % shards].append(id_)
+    return [(bucket, None) for bucket in buckets if bucket]
+
+
+def _score_shard(scope, ids, shard, config):
+    """Worker entry point: score one shard of accounts ("account") or groups"""
+    from app.database import ReadSessionLocal
+
+    for name, value in config.items():
+        setattr(settings, name, value)
+    db = ReadSessionLocal()
+    try:
+        if scope == "account":
+            return list(scoring.score_accounts(db, ids, shard))
+        return [(scope, *result)
+                for result in scoring.score_groups(db, scoring.AGGREGATE_SCOPES[scope], ids, shard)]
+    finally:
+        db.close()
+
+
+def _gather(tasks):
+    pool = get_pool()
+    config = config_snapshot()
+    futures = [pool.submit(_score_shard, scope, ids, shard, config) for scope, ids, shard in tasks]
+    results = []
+    for future in futures:
+        results.extend(future.result())
+    return results
+
+
+def score_accounts(account_logins=None):
+    """Parallel equivalent of list(scoring.score_accounts(db, account_logins))"""
+    return _gather([("account", ids, shard)
+                    for ids, shard in _shard_tasks(account_logins, settings.SCORING_WORKERS)])
+
+
+def score_aggregates(db: Session, account_logins=None):
+    """Parallel equivalent of list(scoring.score_aggregates(db, account_logins))"""
+    tasks = []
+    for scope, group_column in scoring.AGGREGATE_SCOPES.items():
+        group_ids = None if account_logins is None else crud.get_group_ids(db, group_column, account_logins)
+        if group_ids is not None and not group_ids:
+            continue
+        tasks.extend((scope, ids, shard) for ids, shard in _shard_tasks(group_ids, settings.SCORING_WORKERS))
+    return _gather(tasks)
@@ -0,0 +1,105 @@
+from collections import Counter
+from datetime import datetime
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval and counts collapsed
+    stacks ("outer;...;inner count" lines, the input format of flame graph tools)
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005, root=None):
+        self.thread_id = thread_id
+        self.root = root  # code object where stacks are cut, leaving out the callers
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    @staticmethod
+    def _frame_name(frame):
+        code = frame.f_code
+        return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+    def _run(self):
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame.f_code is not self.root:
+                stack.append(self._frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stopping.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def top_functions(profile: cProfile.Profile, limit: int):
+    """The `limit` functions with the highest cumulative time"""
+    stats = pstats.Stats(profile)
+    rows = []
+    for (filename, line, name), (calls, ncalls, tottime, cumtime, _) in stats.stats.items():
+        rows.append({
+            "function": f"{name} ({filename}:{line})",
+            "ncalls": ncalls,
+            "primitive_calls": calls,
+            "tottime": round(tottime, 6),
+            "cumtime": round(cumtime, 6),
+        })
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:limit]
+
+
+def profile_call(fn, *args, top: int = 30, interval: float = 0.005, store_dir: str = None, **kwargs):
+    """
+    Run fn(*args, **kwargs) under cProfile and a stack sampler.
+
+    Returns the result of fn with a report of the top functions by cumulative
+    time and the collapsed stacks. With store_dir, the pstats dump, the text
+    report and the collapsed stacks are also written there and their paths
+    added to the report.
+    """
+    profile = cProfile.Profile()
+    started = time.perf_counter()
+    with StackSampler(threading.get_ident(), interval, profile_call.__code__) as sampler:
+        profile.enable()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            profile.disable()
+    report = {
+        "seconds": round(time.perf_counter() - started, 3),
+        "samples": sum(sampler.stacks.values()),
+        "sample_interval": interval,
+        "top": top_functions(profile, top),
+        "collapsed": sampler.collapsed(),
+    }
+
+    if store_dir:
+        os.makedirs(store_dir, exist_ok=True)
+        prefix = os.path.join(store_dir, f"cycle-{datetime.now():%Y%m%d-%H%M%S}")
+        profile.dump_stats(f"{prefix}.pstats")
+        text = io.StringIO()
+        pstats.Stats(profile, stream=text).sort_stats("cumulative").print_stats(top)
+        with open(f"{prefix}.txt", "w") as f:
+            f.write(text.getvalue())
+        with open(f"{prefix}.collapsed", "w") as f:
+            f.write(report["collapsed"])
+        report["files"] = [f"{prefix}.pstats", f"{prefix}.txt", f"{prefix}.collapsed"]
+    return result, report
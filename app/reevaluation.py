@@ -0,0 +1,177 @@
+from app.config import settings
+from datetime import datetime
+from app.database import SessionLocal, ReadSessionLocal
+from app.leader import leader_election
+import app.crud as crud
+import app.models as models
+import app.vectorized as vectorized
+import numpy as np
+import pandas as pd
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# ConfigUpdate fields that only change how stored metrics are judged, and their settings
+THRESHOLD_SETTINGS = {
+    "win_ratio_threshold": "WIN_RATIO_THRESHOLD",
+    "drawdown_threshold": "DRAWDOWN_THRESHOLD",
+    "stop_loss_threshold": "STOP_LOSS_THRESHOLD",
+    "take_profit_threshold": "TAKE_PROFIT_THRESHOLD",
+    "risk_threshold": "RISK_THRESHOLD",
+}
+
+# ConfigUpdate fields that change the metrics themselves and need a full recompute
+METRIC_SETTINGS = {
+    "window_size": "WINDOW_SIZE",
+    "initial_balance": "INITIAL_BALANCE",
+    "hft_duration": "HFT_DURATION",
+}
+
+# risk_latest and risk_aggregates, with their key columns
+TABLES = {
+    "accounts": (models.RiskLatest, ["account_login"]),
+    "aggregates": (models.RiskAggregate, ["scope", "scope_id"]),
+}
+
+
+def _signal_masks(names, signals: pd.Series):
+    """Bitmask (bit i: names[i]) of each stored comma-separated signal string"""
+    bits = {name: 1 << i for i, name in enumerate(names)}
+    # Only a handful of distinct signal combinations exist, so parse each once
+    codes, uniques = pd.factorize(signals.fillna(""), sort=False)
+    parsed = np.array([sum(bits.get(name, 0) for name in value.split(",") if name) for value in uniques],
+                      dtype=np.int64)
+    return parsed[codes] if len(uniques) else np.zeros(len(signals), dtype=np.int64)
+
+
+def evaluate(frame: pd.DataFrame, thresholds, previous_risk_threshold: float):
+    """
+    Re-derive signals and alert eligibility of stored metric rows under
+    `thresholds` (setting name -> value). Returns a dict of numpy arrays:
+    the stored and new signal bitmasks, the new signal strings and the
+    alert eligibility under the previous and the new risk threshold.
+    """
+    names, flags = vectorized.signal_flags(frame, thresholds)
+    weights = 1 << np.arange(len(names), dtype=np.int64)
+    new_masks = flags.astype(np.int64) @ weights if len(frame) else np.zeros(0, dtype=np.int64)
+    # Signal strings in the order the engines generate them, one per combination
+    strings = np.array([",".join(name for i, name in enumerate(names) if mask >> i & 1)
+                        for mask in range(1 << len(names))], dtype=object)
+    scores = frame["risk_score"].to_numpy(dtype=np.float64)
+    return {
+        "names": names,
+        "old_masks": _signal_masks(names, frame["risk_signals"]),
+        "new_masks": new_masks,
+        "new_signals": strings[new_masks],
+        "old_alert": scores > previous_risk_threshold,
+        "new_alert": scores > thresholds["RISK_THRESHOLD"],
+    }
+
+
+def _summary(evaluation):
+    names, old_masks, new_masks = evaluation["names"], evaluation["old_masks"], evaluation["new_masks"]
+    old_alert, new_alert = evaluation["old_alert"], evaluation["new_alert"]
+    return {
+        "rows": len(new_masks),
+        "signals_changed": int(np.count_nonzero(old_masks != new_masks)),
+        "signal_counts": {name: {"before": int(np.count_nonzero(old_masks >> i & 1)),
+                                 "after": int(np.count_nonzero(new_masks >> i & 1))}
+                          for i, name in enumerate(names)},
+        "alerting_before": int(np.count_nonzero(old_alert)),
+        "alerting_after": int(np.count_nonzero(new_alert)),
+        "newly_alerting": int(np.count_nonzero(new_alert & ~old_alert)),
+        "no_longer_alerting": int(np.count_nonzero(old_alert & ~new_alert)),
+    }
+
+
+def _changed_rows(frame, key_columns, evaluation):
+    changed = np.flatnonzero(evaluation["old_masks"] != evaluation["new_masks"])
+    rows = frame.iloc[changed]
+    keys = [rows[name].tolist() for name in key_columns]
+    return [{**dict(zip(key_columns, key)), "timestamp": timestamp.to_pydatetime(), "risk_signals": signals}
+            for *key, timestamp, signals in zip(*keys, rows["timestamp"], evaluation["new_signals"][changed])]
+
+
+def _published_rows(label, frame, key_columns, evaluation, current=None):
+    """
+    (scope, scope_id, timestamp, risk_score, risk_signals, last_trade_at) of the
+    rows whose signals changed, for streaming clients. Given `current`, the
+    table read back after the update, rows rescored since `frame` was read are
+    left out: the cycle that rescored them published their new state
+    """
+    changed = np.flatnonzero(evaluation["old_masks"] != evaluation["new_masks"])
+    rows = frame.iloc[changed]
+    prefix = ("account",) if label == "accounts" else ()
+    stored = None
+    if current is not None:
+        stored = dict(zip(zip(*(current[name].tolist() for name in key_columns)), current["timestamp"]))
+    published = []
+    for key, timestamp, risk_score, signals, last_trade_at in zip(
+            zip(*(rows[name].tolist() for name in key_columns)), rows["timestamp"], rows["risk_score"].tolist(),
+            evaluation["new_signals"][changed], rows["last_trade_at"]):
+        if stored is not None and stored.get(key) != timestamp:
+            continue
+        published.append((*prefix, *key, timestamp.to_pydatetime(), risk_score,
+                          signals.split(",") if signals else [],
+                          None if pd.isna(last_trade_at) else last_trade_at.to_pydatetime()))
+    return published
+
+
+def reevaluate(thresholds=None, apply: bool = False, previous_risk_threshold: float = None):
+    """
+    Re-derive risk signals and alert eligibility of every account, user and
+    challenge from their latest stored metrics, without fetching trades.
+
+    `thresholds` maps setting names to proposed values; missing ones keep their
+    current value. With apply, changed signals are written back (call it after
+    updating settings) and the result includes "high_risk", the logins above
+    RISK_THRESHOLD, "alerts", (login, score, signals, last_trade_at) of the
+    accounts that became eligible for an alert, and "changed", (scope,
+    scope_id, timestamp, score, signals, last_trade_at) of the rows written. Otherwise nothing is written,
+    which makes it a dry run of the proposed thresholds. Alert flips are
+    counted against previous_risk_threshold, by default the current setting.
+    """
+    started = time.perf_counter()
+    thresholds = {name: (thresholds or {}).get(name, getattr(settings, name))
+                  for name in THRESHOLD_SETTINGS.values()}
+    if previous_risk_threshold is None:
+        previous_risk_threshold = settings.RISK_THRESHOLD
+
+    with ReadSessionLocal() as db:
+        frames = {label: crud.fetch_risk_signal_frame(db, model, key_columns)
+                  for label, (model, key_columns) in TABLES.items()}
+    evaluations = {label: evaluate(frame, thresholds, previous_risk_threshold) for label, frame in frames.items()}
+    result = {label: _summary(evaluation) for label, evaluation in evaluations.items()}
+    result["thresholds"] = thresholds
+    result["applied"] = apply
+
+    if apply:
+        result["changed"] = []
+        with SessionLocal() as writer:
+            leader_election.confirm(writer)
+            for label, (model, key_columns) in TABLES.items():
+                rows = _changed_rows(frames[label], key_columns, evaluations[label])
+                updated = crud.update_risk_signals(writer, model, key_columns, rows)
+                result[label]["rows_updated"] = updated
+                # A cycle committed between the read and this write: find the rows it left alone
+                current = crud.fetch_risk_signal_frame(writer, model, key_columns) if updated != len(rows) else None
+                result["changed"] += _published_rows(label, frames[label], key_columns, evaluations[label], current)
+            if result["changed"]:
+                crud.record_risk_changes(writer, [crud.ALL_CHANGED], leader_election.worker_id, datetime.now())
+            writer.commit()
+
+        accounts, evaluation = frames["accounts"], evaluations["accounts"]
+        logins = accounts["account_login"].to_numpy()
+        result["high_risk"] = set(logins[evaluation["new_alert"]].tolist())
+        newly = np.flatnonzero(evaluation["new_alert"] & ~evaluation["old_alert"])
+        result["alerts"] = [
+            (login, score, signals.split(",") if signals else [], last_trade_at.to_pydatetime())
+            for login, score, signals, last_trade_at in zip(
+                logins[newly].tolist(), accounts["risk_score"].iloc[newly].tolist(),
+                evaluation["new_signals"][newly], accounts["last_trade_at"].iloc[newly])]
+
+    result["seconds"] = round(time.perf_counter() - started, 3)
+    logger.info("Re-evaluated signals of %d accounts and %d aggregates in %.3fs (applied: %s)",
+                result["accounts"]["rows"], result["aggregates"]["rows"], result["seconds"], apply)
+    return result
@@ -0,0 +1,297 @@
+"""
+Replay the full trade history of every account through the rolling window and
+write the risk metric series, to backtest thresholds and weights:
+
+    python -m app.replay --output replay.csv --interval 60 --set WIN_RATIO_THRESHOLD=0.4
+
+Each account's trades are streamed once in closed_at order; metrics are taken
+after every trade, or at the end of every --interval minutes with trades.
+Accounts are split into login ranges of similar trade counts, replayed by a
+pool of processes, and written to part files merged at the end or straight to
+the risk_replays table (--table).
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from app.compact import from_epoch_micros, to_epoch_micros
+from app.config import settings
+from app.window import RollingWindow
+from pydantic import TypeAdapter, ValidationError
+import app.crud as crud
+import app.schemas as schemas
+import app.utils as utils
+import multiprocessing
+import argparse
+import shutil
+import tempfile
+import json
+import math
+import time
+import csv
+import os
+
+OUTPUT_COLUMNS = ["account_login", "as_of", "last_trade_at", "win_ratio", "profit_factor", "max_drawdown",
+                  "stop_loss_used", "take_profit_used", "hft_count", "max_layering", "risk_score", "risk_signals"]
+
+# Shards per worker, so that one slow range does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+
+def plan_shards(trade_counts, shards: int):
+    """Split (login, trades) pairs in login order into up to `shards` (first, last) login ranges of similar size"""
+    total = sum(count for _, count in trade_counts)
+    ranges, first, done = [], None, 0
+    for login, count in trade_counts:
+        if first is None:
+            first = login
+        done += count
+        if done >= total * (len(ranges) + 1) / shards:
+            ranges.append((first, login))
+            first = None
+    if first is not None:
+        ranges.append((first, trade_counts[-1][0]))
+    return ranges
+
+
+def _row(account_login: int, as_of: datetime, metrics):
+    risk_score = utils.calculate_risk_score(metrics)
+    return [account_login, as_of, metrics['last_trade_at'], metrics['win_ratio'], metrics['profit_factor'],
+            metrics['max_drawdown'], metrics['stop_loss_used'], metrics['take_profit_used'], metrics['hft_count'],
+            metrics['max_layering'], risk_score, ",".join(utils.generate_risk_signals(metrics))]
+
+
+def replay_account(account_login: int, trades, window_size: int, interval: timedelta = None):
+    """
+    Yield output rows for one account's trades in closed_at order: after every
+    trade, or with an interval, the state at the end of every interval that
+    had trades. Metrics are only computed for the rows emitted.
+    """
+    window = RollingWindow(window_size)
+    step = interval // timedelta(microseconds=1) if interval else None
+    pending = None  # end of the interval the window's state belongs to
+    for trade in trades:
+        if step is None:
+            window.push(trade)
+            yield _row(account_login, trade.closed_at, window.metrics())
+            continue
+        bucket_end = from_epoch_micros((to_epoch_micros(trade.closed_at) // step + 1) * step)
+        if pending is not None and bucket_end != pending:
+            yield _row(account_login, pending, window.metrics())
+        pending = bucket_end
+        window.push(trade)
+    if pending is not None:
+        yield _row(account_login, pending, window.metrics())
+
+
+def _json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+class _FileSink:
+    """Rows written to a CSV (no header) or NDJSON part file"""
+
+    def __init__(self, path: str, fmt: str):
+        self.file = open(path, "w", newline="")
+        self.csv = csv.writer(self.file) if fmt == "csv" else None
+
+    def write(self, rows):
+        if self.csv is not None:
+            self.csv.writerows(rows)
+        else:
+            self.file.writelines(json.dumps({name: _json_value(value) for name, value in zip(OUTPUT_COLUMNS, row)})
+                                 + "\n" for row in rows)
+
+    def close(self):
+        self.file.close()
+
+
+class _TableSink:
+    """Rows inserted into risk_replays, one short transaction per chunk"""
+
+    def __init__(self, run_id: str):
+        from app.database import SessionLocal
+        self.run_id = run_id
+        self.session = SessionLocal
+
+    def write(self, rows):
+        with self.session() as db:
+            crud.insert_replay_rows(db, [{"run_id": self.run_id, **dict(zip(OUTPUT_COLUMNS, row))} for row in rows])
+            db.commit()
+
+    def close(self):
+        pass
+
+
+def _replay_shard(first_login: int, last_login: int, options, config, weights):
+    """Worker entry point: replay one login range; returns the number of rows written"""
+    from app.database import ReadSessionLocal
+
+    for name, value in config.items():
+        setattr(settings, name, value)
+    utils.RISK_WEIGHTS.update(weights)
+
+    if options["table"]:
+        sink = _TableSink(options["run_id"])
+    else:
+        sink = _FileSink(os.path.join(options["parts"], f"{first_login:012d}.part"), options["format"])
+    chunk_size, start, written = options["chunk_size"], options["start"], 0
+    buffer = []
+    try:
+        with ReadSessionLocal() as db:
+            for account_login, trades in crud.fetch_account_histories(db, first_login, last_login,
+                                                                      options["end"], chunk_size):
+                for row in replay_account(account_login, trades, options["window_size"], options["interval"]):
+                    if start is not None and row[1] < start:
+                        continue
+                    buffer.append(row)
+                    if len(buffer) >= chunk_size:
+                        sink.write(buffer)
+                        written += len(buffer)
+                        buffer = []
+        sink.write(buffer)
+        written += len(buffer)
+    finally:
+        sink.close()
+    return written
+
+
+def _merge_parts(parts_dir: str, output: str, fmt: str):
+    """Concatenate the part files, in login order, into `output`"""
+    with open(output, "w", newline="") as out:
+        if fmt == "csv":
+            csv.writer(out).writerow(OUTPUT_COLUMNS)
+        for name in sorted(os.listdir(parts_dir)):
+            with open(os.path.join(parts_dir, name), newline="") as part:
+                shutil.copyfileobj(part, out)
+
+
+def replay(output: str = None, table: bool = False, run_id: str = None, workers: int = None,
+           interval: timedelta = None, window_size: int = None, start: datetime = None, end: datetime = None,
+           overrides=None, weights=None, chunk_size: int = None):
+    """
+    Replay every account's history and write the series to `output` (.csv or
+    .ndjson) or, with table, to risk_replays under run_id. `overrides` and
+    `weights` change settings and risk weights for the replay only. Returns
+    the number of rows written.
+    """
+    from app.database import engine, ReadSessionLocal, SessionLocal
+    from app.migrations import run_migrations
+
+    if not output and not table:
+        raise ValueError("Give an output file or write to the risk_replays table")
+    fmt = "ndjson" if output and output.endswith((".ndjson", ".jsonl")) else "csv"
+    workers = workers or os.cpu_count()
+    run_id = run_id or f"replay-{datetime.now():%Y%m%d-%H%M%S}"
+    config = {name: getattr(settings, name) for name in dir(settings) if name.isupper()}
+    config.update(overrides or {})
+    options = {
+        "table": table,
+        "run_id": run_id,
+        "format": fmt,
+        "interval": interval,
+        "window_size": window_size or config["WINDOW_SIZE"],
+        "start": start,
+        "end": end,
+        "chunk_size": chunk_size or settings.FETCH_CHUNK_SIZE,
+    }
+
+    run_migrations(engine)
+    if table:
+        with SessionLocal() as db:
+            crud.delete_replay_run(db, run_id)
+            db.commit()
+    with ReadSessionLocal() as db:
+        trade_counts = crud.get_trade_counts(db, end)
+    shards = plan_shards(trade_counts, workers * SHARDS_PER_WORKER)
+    print(f"Replaying {sum(count for _, count in trade_counts)} trades of {len(trade_counts)} accounts "
+          f"in {len(shards)} shards on {workers} workers")
+
+    parts_dir = None if table else tempfile.mkdtemp(prefix=".replay-", dir=os.path.dirname(os.path.abspath(output)))
+    options["parts"] = parts_dir
+    started, rows, done = time.perf_counter(), 0, 0
+    try:
+        # spawn, like the scoring pool: workers start from a clean interpreter
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(_replay_shard, first, last, options, config, weights or {})
+                       for first, last in shards]
+            for future in as_completed(futures):
+                rows += future.result()
+                done += 1
+                print(f"  {done}/{len(shards)} shards, {rows} rows, {time.perf_counter() - started:.1f}s")
+        if output:
+            _merge_parts(parts_dir, output, fmt)
+    finally:
+        if parts_dir is not None:
+            shutil.rmtree(parts_dir, ignore_errors=True)
+
+    print(f"Wrote {rows} rows to {output or f'risk_replays (run_id {run_id})'} "
+          f"in {time.perf_counter() - started:.1f}s")
+    return rows
+
+
+def _assignment(text: str):
+    name, sep, value = text.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"Expected NAME=VALUE, got {text}")
+    return name.strip(), value.strip()
+
+
+def _setting_value(name: str, value: str):
+    """
+    Parse an override with the type /admin/update-config gives the setting, so
+    RISK_THRESHOLD=82.5 is accepted although the default is an int, or else
+    the type of its default (str when the default is None)
+    """
+    field = schemas.ConfigUpdate.model_fields.get(name.lower())
+    default = getattr(settings, name)
+    annotation = field.annotation if field else str if default is None else type(default)
+    return TypeAdapter(annotation).validate_python(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay every account's trade history through the rolling window and write the risk "
+                    "metric series to a file or the risk_replays table.")
+    parser.add_argument("--output", default=None, help="Output file, .csv or .ndjson")
+    parser.add_argument("--table", action="store_true", help="Write to the risk_replays table instead")
+    parser.add_argument("--run-id", default=None, help="Run id in risk_replays; an existing run is replaced")
+    parser.add_argument("--interval", type=float, default=None,
+                        help="Minutes between points of the series (default: a point after every trade)")
+    parser.add_argument("--window-size", type=int, default=None, help="Trades per window (default: WINDOW_SIZE)")
+    parser.add_argument("--start", type=datetime.fromisoformat, default=None,
+                        help="Only write points from this time; earlier trades still fill the windows")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="Ignore trades closed from this time")
+    parser.add_argument("--workers", type=int, default=None, help="Processes (default: one per core)")
+    parser.add_argument("--chunk-size", type=int, default=None, help="Rows fetched and written per chunk")
+    parser.add_argument("--set", type=_assignment, action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a setting, e.g. WIN_RATIO_THRESHOLD=0.4 or HFT_DURATION=30")
+    parser.add_argument("--weight", type=_assignment, action="append", default=[], metavar="NAME=VALUE",
+                        help="Override a risk score weight, e.g. max_drawdown=0.3")
+    args = parser.parse_args()
+
+    if bool(args.output) == args.table:
+        parser.error("give exactly one of --output and --table")
+    overrides = {}
+    for name, value in args.set:
+        if not name.isupper() or not hasattr(settings, name):
+            parser.error(f"unknown setting {name}")
+        try:
+            overrides[name] = _setting_value(name, value)
+        except ValidationError:
+            parser.error(f"invalid value for {name}: {value}")
+    weights = {}
+    for name, value in args.weight:
+        if name not in utils.RISK_WEIGHTS:
+            parser.error(f"unknown weight {name}; one of {', '.join(utils.RISK_WEIGHTS)}")
+        weights[name] = float(value)
+
+    replay(args.output, args.table, args.run_id, args.workers,
+           timedelta(minutes=args.interval) if args.interval else None, args.window_size, args.start, args.end,
+           overrides, weights, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
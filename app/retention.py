@@ -0,0 +1,119 @@
+from datetime import datetime, timedelta
+from app.config import settings
+from app.database import SessionLocal
+from app.instrumentation import registry
+import app.crud as crud
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+COMPACTED_ROWS = registry.counter(
+    "risk_compaction_rows_total", "Rows rolled up (or expired) by the retention job, by source", ["source"])
+
+
+def bucket_start(timestamp: datetime, resolution: str) -> datetime:
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _sample(row):
+    """Rollup-shaped view of a raw risk metric (one sample) or of a finer rollup"""
+    if hasattr(row, "samples"):
+        return row, row.samples, row.last_timestamp, row.risk_score_min, row.risk_score_max
+    return row, 1, row.timestamp, row.risk_score, row.risk_score
+
+
+def rollup_rows(rows, resolution: str):
+    """Combine raw risk metrics, or hourly rollups, into rollup rows of `resolution`"""
+    buckets = {}
+    for row, samples, last_timestamp, score_min, score_max in map(_sample, rows):
+        start = bucket_start(row.bucket_start if hasattr(row, "bucket_start") else row.timestamp, resolution)
+        key = (row.account_login, start)
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = {
+                "account_login": row.account_login, "resolution": resolution, "bucket_start": start,
+                "samples": 0, "last_timestamp": last_timestamp, "risk_score_min": score_min,
+                "risk_score_max": score_max, "risk_signals": row.risk_signals, "last_trade_at": row.last_trade_at,
+                **{name: 0.0 for name in crud.ROLLUP_AVERAGED},
+                **{name: getattr(row, name) for name in ("max_drawdown", "hft_count", "max_layering")},
+            }
+        bucket["samples"] += samples
+        # Weighted sums for now, divided by the sample count below
+        for name in crud.ROLLUP_AVERAGED:
+            bucket[name] += getattr(row, name) * samples
+        for name in ("max_drawdown", "hft_count", "max_layering"):
+            bucket[name] = max(bucket[name], getattr(row, name))
+        bucket["risk_score_min"] = min(bucket["risk_score_min"], score_min)
+        bucket["risk_score_max"] = max(bucket["risk_score_max"], score_max)
+        if last_timestamp >= bucket["last_timestamp"]:
+            bucket["last_timestamp"] = last_timestamp
+            bucket["risk_signals"] = row.risk_signals
+        if row.last_trade_at is not None and (bucket["last_trade_at"] is None
+                                              or row.last_trade_at > bucket["last_trade_at"]):
+            bucket["last_trade_at"] = row.last_trade_at
+
+    for bucket in buckets.values():
+        for name in crud.ROLLUP_AVERAGED:
+            bucket[name] /= bucket["samples"]
+    return list(buckets.values())
+
+
+def _compact(source: str, fetch, remove, resolution: str, batch_size: int, pause: float):
+    """
+    Roll expired rows into `resolution` rollups and delete them, one short
+    transaction per batch so the writer is never held for long
+    """
+    total = 0
+    while True:
+        with SessionLocal() as db:
+            rows = fetch(db, batch_size)
+            if not rows:
+                return total
+            if resolution:
+                crud.upsert_risk_rollups(db, rollup_rows(rows, resolution))
+            remove(db, rows)
+            db.commit()
+        total += len(rows)
+        COMPACTED_ROWS.inc(len(rows), source=source)
+        if len(rows) < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def compact(now: datetime = None, batch_size: int = None, pause: float = 0.05):
+    """
+    Apply the retention policy: raw risk_metrics rows older than
+    RETENTION_RAW_HOURS become hourly rollups, hourly rollups older than
+    RETENTION_HOURLY_DAYS become daily rollups, and daily rollups older than
+    RETENTION_DAILY_DAYS (when set) are deleted. Cutoffs are aligned to bucket
+    boundaries, so a bucket is never rolled up while it can still get rows.
+    Returns the number of rows processed per source.
+    """
+    now = now or datetime.now()
+    batch_size = batch_size or settings.COMPACTION_BATCH_SIZE
+    started = time.perf_counter()
+
+    raw_cutoff = bucket_start(now - timedelta(hours=settings.RETENTION_RAW_HOURS), "hour")
+    hourly_cutoff = bucket_start(now - timedelta(days=settings.RETENTION_HOURLY_DAYS), "day")
+    done = {
+        "raw": _compact(
+            "raw", lambda db, limit: crud.fetch_expired_risk_metrics(db, raw_cutoff, limit),
+            lambda db, rows: crud.delete_risk_metrics(db, [row.id for row in rows]),
+            "hour", batch_size, pause),
+        "hour": _compact(
+            "hour", lambda db, limit: crud.fetch_expired_rollups(db, "hour", hourly_cutoff, limit),
+            lambda db, rows: crud.delete_rollups(db, "hour", [(r.account_login, r.bucket_start) for r in rows]),
+            "day", batch_size, pause),
+    }
+    if settings.RETENTION_DAILY_DAYS:
+        daily_cutoff = bucket_start(now - timedelta(days=settings.RETENTION_DAILY_DAYS), "day")
+        done["day"] = _compact(
+            "day", lambda db, limit: crud.fetch_expired_rollups(db, "day", daily_cutoff, limit),
+            lambda db, rows: crud.delete_rollups(db, "day", [(r.account_login, r.bucket_start) for r in rows]),
+            None, batch_size, pause)
+
+    logger.info("Retention compaction done in %.1fs - %s", time.perf_counter() - started, done)
+    return done
@@ -0,0 +1,171 @@
+from apscheduler.executors.pool import ThreadPoolExecutor
+from apscheduler.schedulers.background import BackgroundScheduler
+from datetime import datetime, timedelta
+from app.config import settings
+from app.dirty import dirty_tracker
+from app.instrumentation import registry
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEDULER_RUNS = registry.counter(
+    "risk_scheduler_runs_total", "Risk cycles started, by trigger", ["trigger"])
+SCHEDULING_LAG = registry.histogram(
+    "risk_scheduling_lag_seconds", "Time from an account being marked to the cycle that scores it starting")
+
+
+class RiskScheduler:
+    """
+    Runs risk cycles when trades arrive instead of on a fixed sleep.
+
+    Ingestion calls notify() with the accounts it touched. A cycle for the
+    marked accounts is scheduled after a debounce period, which restarts on
+    every notification so bursts are batched into one cycle, but never waits
+    longer than max_delay after the first pending mark. Accounts that scored
+    above RISK_THRESHOLD last time are debounced for priority_debounce only,
+    and are scored (and alerted) first within the cycle.
+
+    A sweep runs every sweep_interval to catch trades written outside the API,
+    such as by the initial data loader, and a full recompute of every account
+    runs every full_sweep_interval (0 disables it). Cycles run one at a time
+    on a single worker thread.
+    """
+
+    def __init__(self, debounce: float = None, priority_debounce: float = None, max_delay: float = None,
+                 sweep_interval: float = None, full_sweep_interval: float = None):
+        self.debounce = debounce if debounce is not None else settings.SCHEDULER_DEBOUNCE
+        self.priority_debounce = (priority_debounce if priority_debounce is not None
+                                  else settings.SCHEDULER_PRIORITY_DEBOUNCE)
+        self.max_delay = max_delay if max_delay is not None else settings.SCHEDULER_MAX_DELAY
+        self.sweep_interval = sweep_interval or settings.SCHEDULER_SWEEP_INTERVAL
+        self.full_sweep_interval = (full_sweep_interval if full_sweep_interval is not None
+                                    else settings.SCHEDULER_FULL_SWEEP_INTERVAL)
+
+        self._lock = threading.Lock()
+        self._scheduler = None
+        self._cycle = None
+        self._high_risk = set()  # logins that scored above RISK_THRESHOLD in their last cycle
+        self._first_pending = None  # monotonic time of the first notification not yet picked up
+        self._due = None  # datetime the event cycle is scheduled for
+        self._due_priority = False
+        self._last_run = None
+
+    @property
+    def running(self):
+        return self._scheduler is not None and self._scheduler.running
+
+    def start(self, cycle, high_risk=()):
+        """
+        Start scheduling `cycle(sweep: bool)`, seeded with the logins currently
+        above the threshold. A first sweep runs immediately.
+        """
+        with self._lock:
+            if self.running:
+                return
+            self._cycle = cycle
+            self._high_risk = set(high_risk)
+            # Maintenance jobs get their own threads so they never delay a cycle,
+            # and a long compaction never delays a short polling job
+            self._scheduler = BackgroundScheduler(
+                executors={"default": ThreadPoolExecutor(max_workers=1),
+                           "maintenance": ThreadPoolExecutor(max_workers=2)},
+                job_defaults={"coalesce": True, "max_instances": 1, "misfire_grace_time": None})
+            now = datetime.now()
+            self._scheduler.add_job(self._run, "interval", seconds=self.sweep_interval, args=["sweep"],
+                                    id="risk-sweep", next_run_time=now)
+            if self.full_sweep_interval:
+                self._scheduler.add_job(self._run, "interval", seconds=self.full_sweep_interval, args=["full"],
+                                        id="risk-full-sweep",
+                                        next_run_time=now + timedelta(seconds=self.full_sweep_interval))
+            self._scheduler.start()
+
+    def add_maintenance_job(self, func, interval: float, job_id: str):
+        """Run func every `interval` seconds, alongside the risk cycles"""
+        with self._lock:
+            if self.running:
+                self._scheduler.add_job(func, "interval", seconds=interval, id=job_id, executor="maintenance",
+                                        replace_existing=True)
+
+    def shutdown(self, wait: bool = False):
+        with self._lock:
+            scheduler, self._scheduler = self._scheduler, None
+        if scheduler is not None and scheduler.running:
+            scheduler.shutdown(wait=wait)
+
+    def notify(self, account_logins=()):
+        """
+        Schedule a cycle for accounts that were just marked dirty (or for a full
+        recompute already requested with dirty_tracker.mark_all)
+        """
+        account_logins = set(account_logins)
+        with self._lock:
+            if not self.running:
+                return
+            now = time.monotonic()
+            if self._first_pending is None:
+                self._first_pending = now
+            priority = bool(account_logins & self._high_risk)
+            # Restart the debounce, capped at max_delay after the first pending mark
+            debounce = self.priority_debounce if priority else self.debounce
+            delay = max(min(debounce, self._first_pending + self.max_delay - now), 0)
+            due = datetime.now() + timedelta(seconds=delay)
+            if self._due is not None and self._due_priority and self._due <= due:
+                # A priority cycle is already due sooner; it picks these accounts up too
+                return
+            self._due, self._due_priority = due, priority
+            # Up to 3 instances: a cycle due while another runs waits for the worker thread
+            self._scheduler.add_job(self._run, "date", run_date=due, args=["event"],
+                                    id="risk-event", replace_existing=True, max_instances=3)
+
+    def priority(self, account_logins):
+        """The subset of account_logins that scored above the threshold last time"""
+        with self._lock:
+            return set(account_logins) & self._high_risk
+
+    def record(self, results):
+        """Update the high-risk set from (account_login, metrics, risk_score, risk_signals) results"""
+        with self._lock:
+            for account_login, _, risk_score, _ in results:
+                if risk_score > settings.RISK_THRESHOLD:
+                    self._high_risk.add(account_login)
+                else:
+                    self._high_risk.discard(account_login)
+
+    def set_high_risk(self, account_logins):
+        """Replace the high-risk set, after RISK_THRESHOLD changed"""
+        with self._lock:
+            self._high_risk = set(account_logins)
+
+    def _run(self, trigger: str):
+        with self._lock:
+            # Every cycle drains all pending marks
+            self._first_pending = None
+            if trigger == "event":
+                self._due, self._due_priority = None, False
+        SCHEDULER_RUNS.inc(trigger=trigger)
+        lag = dirty_tracker.lag()
+        if lag is not None:
+            SCHEDULING_LAG.observe(lag)
+        if trigger == "full":
+            dirty_tracker.mark_all()
+        self._last_run = datetime.now()
+        self._cycle(sweep=trigger != "event")
+
+    def stats(self):
+        with self._lock:
+            due = self._due
+            sweep = self._scheduler.get_job("risk-sweep") if self.running else None
+            return {
+                "running": self.running,
+                "pending_accounts": len(dirty_tracker),
+                "oldest_pending_seconds": dirty_tracker.lag(),
+                "high_risk_accounts": len(self._high_risk),
+                "next_event_cycle": due.isoformat() if due else None,
+                "next_sweep": sweep.next_run_time.isoformat() if sweep and sweep.next_run_time else None,
+                "last_run": self._last_run.isoformat() if self._last_run else None,
+            }
+
+
+risk_scheduler = RiskScheduler()
@@ -1,6 +1,6 @@
 from pydantic import BaseModel
 from datetime import datetime
-from typing import List, Optional
+from typing import Dict, List, Optional
 from .enums import Phase, Action
 
 
@@ -15,6 +15,18 @@ class RiskReport(BaseModel):
         from_attributes = True
 
 
+# Batch risk lookup request: account logins, user ids or challenge ids
+class BatchLookup(BaseModel):
+    ids: List[int]
+
+
+# One result of a batch lookup, in request order
+class RiskReportBatchItem(BaseModel):
+    id: int
+    found: bool
+    report: Optional[RiskReport] = None
+
+
 # Webhook notification schema
 class WebhookNotification(BaseModel):
     trading_account_login: int
@@ -35,6 +47,33 @@ class ConfigUpdate(BaseModel):
     hft_duration: Optional[int] = None
 
 
+# Stored and re-derived counts of one risk signal
+class SignalCount(BaseModel):
+    before: int
+    after: int
+
+
+# Effect of thresholds on the latest metrics of accounts, or of users and challenges
+class ReevaluationSummary(BaseModel):
+    rows: int
+    signals_changed: int
+    signal_counts: Dict[str, SignalCount]
+    alerting_before: int
+    alerting_after: int
+    newly_alerting: int
+    no_longer_alerting: int
+    rows_updated: Optional[int] = None  # set when the thresholds were applied
+
+
+# Threshold re-evaluation result, applied or dry run
+class ReevaluationResult(BaseModel):
+    thresholds: Dict[str, float]
+    applied: bool
+    accounts: ReevaluationSummary
+    aggregates: ReevaluationSummary
+    seconds: float
+
+
 # Trade data schema
 class TradeCreate(BaseModel):
     identifier: str
@@ -68,6 +107,12 @@ class AccountCreate(BaseModel):
     challenge_id: int
 
 
+# Bulk ingestion response
+class IngestResult(BaseModel):
+    rows: int
+    accounts_marked: int = 0
+
+
 # Risk metric schema
 class RiskMetric(BaseModel):
     account_login: int
@@ -87,6 +132,32 @@ class RiskMetric(BaseModel):
         from_attributes = True
 
 
+# One entry of an account's risk history: a raw risk metric or an hourly/daily rollup
+class RiskHistoryItem(BaseModel):
+    timestamp: datetime  # metric timestamp, or bucket start for rollups
+    resolution: str  # "raw", "hour" or "day"
+    samples: int
+    risk_score: float  # average over the bucket for rollups
+    risk_score_min: float
+    risk_score_max: float
+    win_ratio: float
+    profit_factor: Optional[float] = None  # None when there were no losing trades
+    max_drawdown: float
+    stop_loss_used: float
+    take_profit_used: float
+    hft_count: int
+    max_layering: int
+    risk_signals: List[str]
+    last_trade_at: Optional[datetime] = None
+
+
+# A page of risk history; pass next_cursor back to get the following page
+class RiskHistoryPage(BaseModel):
+    account_login: int
+    items: List[RiskHistoryItem]
+    next_cursor: Optional[str] = None
+
+
 # Health check response
 class HealthCheck(BaseModel):
     status: str
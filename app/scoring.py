@@ -0,0 +1,106 @@
+from datetime import datetime
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.window import WindowStore, window_store
+from app.instrumentation import stage, timed_iter
+import app.crud as crud
+import app.models as models
+import app.utils as utils
+import app.vectorized as vectorized
+
+
+def metric_row(timestamp: datetime, metrics, risk_score: float, risk_signals: list[str]):
+    """Columns shared by risk_metrics, risk_latest and risk_aggregates rows"""
+    return {
+        "timestamp": timestamp,
+        "win_ratio": metrics['win_ratio'],
+        "profit_factor": metrics['profit_factor'],
+        "max_drawdown": metrics['max_drawdown'],
+        "stop_loss_used": metrics['stop_loss_used'],
+        "take_profit_used": metrics['take_profit_used'],
+        "hft_count": metrics['hft_count'],
+        "max_layering": metrics['max_layering'],
+        "risk_score": risk_score,
+        "risk_signals": ",".join(risk_signals),
+        "last_trade_at": metrics['last_trade_at']
+    }
+
+
+# Aggregate scopes and the account column that groups them
+AGGREGATE_SCOPES = {
+    "user": models.Account.user_id,
+    "challenge": models.Account.challenge_id,
+}
+
+
+def score_groups(db: Session, group_column, group_ids=None, shard=None):
+    """
+    Yield (group_id, metrics, risk_score, risk_signals) over the last N trades
+    across all accounts of each user or challenge
+    """
+    windows = crud.fetch_group_trade_windows(db, group_column, group_ids, settings.WINDOW_SIZE,
+                                             settings.FETCH_CHUNK_SIZE, shard)
+    for group_id, trades in timed_iter(windows):
+        metrics = utils.calculate_metrics(trades)
+        yield group_id, metrics, utils.calculate_risk_score(metrics), utils.generate_risk_signals(metrics)
+
+
+def score_aggregates(db: Session, account_logins=None):
+    """
+    Yield (scope, scope_id, metrics, risk_score, risk_signals) for every user and
+    challenge, or only for those owning `account_logins`
+    """
+    for scope, group_column in AGGREGATE_SCOPES.items():
+        with stage("fetch"):
+            group_ids = None if account_logins is None else crud.get_group_ids(db, group_column, account_logins)
+        if group_ids is not None and not group_ids:
+            continue
+        for group_id, *result in score_groups(db, group_column, group_ids):
+            yield (scope, group_id, *result)
+
+
+def sync_rolling_windows(db: Session, store: WindowStore = None):
+    """
+    Bring the in-memory rolling windows (the shared window_store unless
+    `store` is given) up to date with the trades table. Only accounts that
+    received out-of-order or resent trades are reloaded
+    """
+    store = window_store if store is None else store
+    if not store.ready:
+        # First cycle after startup
+        store.rebuild(db, settings.WINDOW_SIZE)
+        return
+    if store.size != settings.WINDOW_SIZE:
+        store.resize(db, settings.WINDOW_SIZE)
+    store.advance(db)
+
+
+def score_accounts(db: Session, account_logins=None, shard=None, store: WindowStore = None):
+    """
+    Yield (account_login, metrics, risk_score, risk_signals) using the configured
+    engine, for every account or only for `account_logins`, optionally restricted
+    to one (index, count) shard of logins. The rolling engine scores from
+    `store`, by default the shared window_store
+    """
+    if settings.METRICS_ENGINE == "rolling":
+        yield from (window_store if store is None else store).score(account_logins)
+        return
+
+    if settings.METRICS_ENGINE == "vectorized":
+        frames = crud.fetch_trade_window_frames(db, settings.WINDOW_SIZE, settings.FETCH_CHUNK_SIZE,
+                                                account_logins, shard)
+        for frame in timed_iter(frames):
+            yield from vectorized.score_frame(frame)
+        return
+
+    if settings.FETCH_MODE == "per_account":
+        windows = crud.fetch_trade_windows_per_account(db, settings.WINDOW_SIZE, account_logins, shard)
+    else:
+        windows = crud.fetch_compact_windows(db, settings.WINDOW_SIZE, settings.FETCH_CHUNK_SIZE,
+                                             account_logins, shard)
+
+    for account_login, trades in timed_iter(windows):
+        metrics = utils.calculate_metrics(trades)
+        risk_score = utils.calculate_risk_score(metrics)
+        risk_signals = utils.generate_risk_signals(metrics)
+        yield account_login, metrics, risk_score, risk_signals
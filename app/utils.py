@@ -1,10 +1,24 @@
 from app.config import settings
+from app.compact import TradeWindow
+
+# Weights of the normalized metrics in the risk score
+RISK_WEIGHTS = {
+    'win_ratio': 0.15,
+    'profit_factor': 0.15,
+    'max_drawdown': 0.20,
+    'stop_loss_used': 0.15,
+    'take_profit_used': 0.15,
+    'hft_count': 0.15,
+    'max_layering': 0.20
+}
 
 
 def calculate_metrics(trades):
     """Calculate risk metrics for a set of trades"""
     if not trades:
         return {}
+    if isinstance(trades, TradeWindow):
+        return calculate_window_metrics(trades)
 
     # 1. Win Ratio
     winning_trades = [t for t in trades if t.profit > 0]
@@ -16,16 +30,7 @@ def calculate_metrics(trades):
     profit_factor = total_profit / total_loss if total_loss > 0 else float('inf')
 
     # 3. Max Drawdown
-    balance = settings.INITIAL_BALANCE
-    peak = balance
-    max_drawdown = 0
-    for trade in sorted(trades, key=lambda t: t.closed_at):
-        balance += trade.profit
-        if balance > peak:
-            peak = balance
-        drawdown = (peak - balance) / peak
-        if drawdown > max_drawdown:
-            max_drawdown = drawdown
+    max_drawdown = calculate_max_drawdown(trades)
 
     # 4. Stop Loss Used
     stop_loss_used = len([t for t in trades if t.price_sl is not None]) / len(trades)
@@ -41,18 +46,7 @@ def calculate_metrics(trades):
             hft_count += 1
 
     # 7. Layering Detection
-    events = []
-    for trade in trades:
-        events.append((trade.opened_at, 1))   # Trade open
-        events.append((trade.closed_at, -1))  # Trade close
-
-    events.sort(key=lambda x: x[0])
-    current_open = 0
-    max_open = 0
-    for _, change in events:
-        current_open += change
-        if current_open > max_open:
-            max_open = current_open
+    max_open = calculate_max_layering(trades)
 
     last_trade = max(t.closed_at for t in trades) if trades else None
 
@@ -68,18 +62,99 @@ def calculate_metrics(trades):
     }
 
 
+def calculate_window_metrics(window: TradeWindow):
+    """calculate_metrics over a compact TradeWindow, reading its arrays directly"""
+    n = len(window)
+    profits = window.profit
+    opened = window.opened_at
+    closed = window.closed_at
+
+    # 1. Win Ratio / 2. Profit Factor
+    wins = 0
+    total_profit = 0
+    total_loss = 0
+    for p in profits:
+        if p > 0:
+            wins += 1
+            total_profit += p
+        elif p < 0:
+            total_loss += p
+    total_loss = abs(total_loss)
+    profit_factor = total_profit / total_loss if total_loss > 0 else float('inf')
+
+    # 3. Max Drawdown, replayed in closed_at order (stable, like sorted())
+    balance = settings.INITIAL_BALANCE
+    peak = balance
+    max_drawdown = 0
+    for i in sorted(range(n), key=closed.__getitem__):
+        balance += profits[i]
+        if balance > peak:
+            peak = balance
+        drawdown = (peak - balance) / peak
+        if drawdown > max_drawdown:
+            max_drawdown = drawdown
+
+    # 6. HFT Detection
+    hft_limit = settings.HFT_DURATION * 1_000_000
+    hft_count = sum(1 for o, c in zip(opened, closed) if c - o < hft_limit)
+
+    # 7. Layering Detection: even positions open a trade, odd ones close it
+    times = [t for pair in zip(opened, closed) for t in pair]
+    current_open = 0
+    max_open = 0
+    for k in sorted(range(2 * n), key=times.__getitem__):
+        current_open += -1 if k & 1 else 1
+        if current_open > max_open:
+            max_open = current_open
+
+    return {
+        'win_ratio': wins / n,
+        'profit_factor': profit_factor,
+        'max_drawdown': max_drawdown,
+        'stop_loss_used': sum(window.has_sl) / n,
+        'take_profit_used': sum(window.has_tp) / n,
+        'hft_count': hft_count,
+        'max_layering': max_open,
+        'last_trade_at': window.last_trade_at
+    }
+
+
+def calculate_max_drawdown(trades):
+    """Largest relative peak-to-valley loss, replaying trades in closed_at order"""
+    balance = settings.INITIAL_BALANCE
+    peak = balance
+    max_drawdown = 0
+    for trade in sorted(trades, key=lambda t: t.closed_at):
+        balance += trade.profit
+        if balance > peak:
+            peak = balance
+        drawdown = (peak - balance) / peak
+        if drawdown > max_drawdown:
+            max_drawdown = drawdown
+    return max_drawdown
+
+
+def calculate_max_layering(trades):
+    """Max number of concurrently open trades"""
+    events = []
+    for trade in trades:
+        events.append((trade.opened_at, 1))   # Trade open
+        events.append((trade.closed_at, -1))  # Trade close
+
+    events.sort(key=lambda x: x[0])
+    current_open = 0
+    max_open = 0
+    for _, change in events:
+        current_open += change
+        if current_open > max_open:
+            max_open = current_open
+    return max_open
+
+
 def calculate_risk_score(metrics):
     """Calculate risk score from metrics"""
     # Simple weighted average
-    weights = {
-        'win_ratio': 0.15,
-        'profit_factor': 0.15,
-        'max_drawdown': 0.20,
-        'stop_loss_used': 0.15,
-        'take_profit_used': 0.15,
-        'hft_count': 0.15,
-        'max_layering': 0.20
-    }
+    weights = RISK_WEIGHTS
 
     # Normalize metrics to 0-100 scale
     normalized = {
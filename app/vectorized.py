@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+from app.config import settings
+from app.utils import RISK_WEIGHTS
+
+# Columns the vectorized engine reads from a trade frame
+TRADE_COLUMNS = ['profit', 'price_sl', 'price_tp', 'opened_at', 'closed_at']
+
+
+def _to_micros(values):
+    """Convert a datetime column to int64 microseconds since epoch"""
+    return pd.to_datetime(values).to_numpy(dtype='datetime64[us]').astype(np.int64)
+
+
+def calculate_metrics_frame(trades: pd.DataFrame, group_key: str = 'trading_account_login') -> pd.DataFrame:
+    """
+    Calculate risk metrics for every group of a columnar trade frame in one pass.
+
+    Row order inside a group must be the window order (closed_at DESC), the same
+    order `utils.calculate_metrics` receives, so that ties in layering resolve
+    identically. Returns one row per group, indexed by the group key, with the
+    same keys as `utils.calculate_metrics`.
+    """
+    columns = ['win_ratio', 'profit_factor', 'max_drawdown', 'stop_loss_used',
+               'take_profit_used', 'hft_count', 'max_layering', 'last_trade_at']
+    if trades.empty:
+        return pd.DataFrame(columns=columns, index=pd.Index([], name=group_key))
+
+    codes, keys = pd.factorize(trades[group_key], sort=False)
+    n_groups = len(keys)
+    profit = trades['profit'].to_numpy(dtype=np.float64)
+    opened = _to_micros(trades['opened_at'])
+    closed = _to_micros(trades['closed_at'])
+    counts = np.bincount(codes, minlength=n_groups)
+
+    # 1. Win Ratio
+    win_ratio = np.bincount(codes, weights=profit > 0, minlength=n_groups) / counts
+
+    # 2. Profit Factor
+    total_profit = np.bincount(codes, weights=np.where(profit > 0, profit, 0.0), minlength=n_groups)
+    total_loss = np.abs(np.bincount(codes, weights=np.where(profit < 0, profit, 0.0), minlength=n_groups))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        profit_factor = np.where(total_loss > 0, total_profit / total_loss, np.inf)
+
+    # 3. Max Drawdown via per-group cumulative sums in closed_at order
+    order = np.lexsort((closed, codes))
+    sorted_codes = codes[order]
+    sorted_profit = profit[order]
+    first = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+    balance = pd.Series(sorted_profit + np.where(first, settings.INITIAL_BALANCE, 0.0))
+    balance = balance.groupby(sorted_codes).cumsum()
+    peak = np.maximum(balance.groupby(sorted_codes).cummax().to_numpy(), settings.INITIAL_BALANCE)
+    drawdown = (peak - balance.to_numpy()) / peak
+    max_drawdown = np.zeros(n_groups)
+    np.maximum.at(max_drawdown, sorted_codes, drawdown)
+
+    # 4. Stop Loss Used / 5. Take Profit Used
+    stop_loss_used = np.bincount(codes, weights=trades['price_sl'].notna().to_numpy(), minlength=n_groups) / counts
+    take_profit_used = np.bincount(codes, weights=trades['price_tp'].notna().to_numpy(), minlength=n_groups) / counts
+
+    # 6. HFT Detection
+    is_hft = (closed - opened) < settings.HFT_DURATION * 1_000_000
+    hft_count = np.bincount(codes, weights=is_hft, minlength=n_groups).astype(np.int64)
+
+    # 7. Layering Detection: opens and closes sorted by time, ties keep the
+    # open-before-close order of the input rows
+    n_trades = len(profit)
+    event_codes = np.repeat(codes, 2)
+    event_times = np.column_stack((opened, closed)).ravel()
+    event_changes = np.tile(np.array([1, -1], dtype=np.int64), n_trades)
+    event_order = np.lexsort((np.arange(2 * n_trades), event_times, event_codes))
+    # Every group opens and closes the same number of trades, so a global
+    # running sum restarts at zero on each group boundary
+    open_count = np.cumsum(event_changes[event_order])
+    max_layering = np.zeros(n_groups, dtype=np.int64)
+    np.maximum.at(max_layering, event_codes[event_order], open_count)
+
+    last_trade_at = pd.Series(pd.to_datetime(trades['closed_at']).to_numpy()).groupby(codes).max()
+
+    return pd.DataFrame({
+        'win_ratio': win_ratio,
+        'profit_factor': profit_factor,
+        'max_drawdown': max_drawdown,
+        'stop_loss_used': stop_loss_used,
+        'take_profit_used': take_profit_used,
+        'hft_count': hft_count,
+        'max_layering': max_layering,
+        'last_trade_at': last_trade_at.to_numpy(),
+    }, index=pd.Index(keys, name=group_key))
+
+
+def calculate_risk_score_frame(metrics: pd.DataFrame) -> pd.Series:
+    """Calculate risk scores for every row of a metrics frame"""
+    normalized = {
+        'win_ratio': np.minimum(metrics['win_ratio'].to_numpy(dtype=np.float64) * 100, 100),
+        'profit_factor': np.minimum(metrics['profit_factor'].to_numpy(dtype=np.float64) * 10, 100),
+        'max_drawdown': metrics['max_drawdown'].to_numpy(dtype=np.float64) * 100,
+        'stop_loss_used': metrics['stop_loss_used'].to_numpy(dtype=np.float64) * 100,
+        'take_profit_used': metrics['take_profit_used'].to_numpy(dtype=np.float64) * 100,
+        'hft_count': np.minimum(metrics['hft_count'].to_numpy(dtype=np.float64) * 10, 100),
+        'max_layering': np.minimum(metrics['max_layering'].to_numpy(dtype=np.float64) * 20, 100)
+    }
+
+    # Accumulate in the same order as utils.calculate_risk_score
+    score = np.zeros(len(metrics))
+    for k in RISK_WEIGHTS:
+        score = score + normalized[k] * RISK_WEIGHTS[k]
+    return pd.Series(np.minimum(score, 100), index=metrics.index)
+
+
+def signal_flags(metrics: pd.DataFrame, thresholds=None):
+    """
+    Return (signal names, boolean matrix with a row per metrics row and a column
+    per signal). `thresholds` overrides settings by name, e.g. {"WIN_RATIO_THRESHOLD": 0.4}
+    """
+    thresholds = thresholds or {}
+
+    def threshold(name):
+        return thresholds.get(name, getattr(settings, name))
+
+    masks = [
+        ("low_win_ratio", metrics['win_ratio'].to_numpy() < threshold('WIN_RATIO_THRESHOLD')),
+        ("high_drawdown", metrics['max_drawdown'].to_numpy() > threshold('DRAWDOWN_THRESHOLD')),
+        ("hft_signal", metrics['hft_count'].to_numpy() > 0),
+        ("low_stop_loss_usage", metrics['stop_loss_used'].to_numpy() < threshold('STOP_LOSS_THRESHOLD')),
+        ("low_take_profit_usage", metrics['take_profit_used'].to_numpy() < threshold('TAKE_PROFIT_THRESHOLD')),
+    ]
+    flags = np.column_stack([mask for _, mask in masks]) if len(metrics) else np.zeros((0, len(masks)), bool)
+    return [name for name, _ in masks], flags
+
+
+def generate_risk_signals_frame(metrics: pd.DataFrame, thresholds=None) -> pd.Series:
+    """Generate risk signals for every row of a metrics frame"""
+    names, flags = signal_flags(metrics, thresholds)
+    signals = [[name for name, flag in zip(names, row) if flag] for row in flags.tolist()]
+    return pd.Series(signals, index=metrics.index, dtype=object)
+
+
+def score_frame(trades: pd.DataFrame, group_key: str = 'trading_account_login'):
+    """
+    Score every group of a trade frame.
+
+    Returns a list of (group_key, metrics, risk_score, risk_signals) tuples in the
+    same shape the per-account python engine produces.
+    """
+    metrics = calculate_metrics_frame(trades, group_key)
+    scores = calculate_risk_score_frame(metrics)
+    signals = generate_risk_signals_frame(metrics)
+
+    results = []
+    for key, row, score, row_signals in zip(metrics.index.tolist(), metrics.to_dict('records'),
+                                            scores.tolist(), signals.tolist()):
+        row['hft_count'] = int(row['hft_count'])
+        row['max_layering'] = int(row['max_layering'])
+        row['last_trade_at'] = pd.Timestamp(row['last_trade_at']).to_pydatetime()
+        results.append((key, row, score, row_signals))
+    return results
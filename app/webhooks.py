@@ -0,0 +1,206 @@
+from datetime import datetime
+from requests.adapters import HTTPAdapter
+from app.config import settings
+from app.instrumentation import WEBHOOK_SECONDS
+import requests
+import logging
+import threading
+import queue
+import time
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying; other 4xx responses will not succeed on retry
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class WebhookDispatcher:
+    """
+    Background webhook delivery.
+
+    Alerts are put on a bounded queue and posted by a fixed number of worker
+    threads sharing one keep-alive connection pool, so the scoring cycle never
+    waits on the receiver. Failed posts are retried with exponential backoff.
+    With batch_size > 1, up to batch_size queued alerts are sent in one
+    {"alerts": [...]} payload. Alerts whose score and signals did not change
+    since the last alert for the account are suppressed.
+    """
+
+    def __init__(self, url: str = None, workers: int = None, queue_size: int = None,
+                 max_retries: int = None, backoff: float = None, timeout: float = None,
+                 batch_size: int = None):
+        self.url = url if url is not None else settings.WEBHOOK_URL
+        self.workers = workers or settings.WEBHOOK_WORKERS
+        self.max_retries = max_retries if max_retries is not None else settings.WEBHOOK_MAX_RETRIES
+        self.backoff = backoff if backoff is not None else settings.WEBHOOK_BACKOFF
+        self.timeout = timeout or settings.WEBHOOK_TIMEOUT
+        self.batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+        self.queue = queue.Queue(maxsize=queue_size or settings.WEBHOOK_QUEUE_SIZE)
+
+        self._lock = threading.Lock()
+        self._threads = []
+        self._stopping = threading.Event()
+        self._session = None
+        # account_login -> (score, signals) of the last alert, forgotten once the account scores
+        # at or below the threshold. Per process: a new leader starts empty and alerts again
+        self._last_alert = {}
+        self._stats = {"enqueued": 0, "sent": 0, "failed": 0, "retried": 0,
+                       "dropped": 0, "suppressed": 0}
+        self._latency_count = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+    def start(self):
+        """Start the worker threads; calling it again is a no-op"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"webhook-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5):
+        """Stop the workers, giving queued alerts up to `timeout` seconds to drain"""
+        deadline = time.monotonic() + timeout
+        while not self.queue.empty() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stopping.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(max(deadline - time.monotonic(), 0.1))
+        if self._session is not None:
+            self._session.close()
+
+    def submit(self, account_login: int, score: float, signals: list[str], last_trade: datetime):
+        """Queue an alert without blocking; return False if it was suppressed or dropped"""
+        if not self.url:
+            logger.debug("Webhook URL not configured - alert for account %s not sent", account_login)
+            return False
+
+        fingerprint = (score, tuple(signals))
+        with self._lock:
+            if self._last_alert.get(account_login) == fingerprint:
+                self._stats["suppressed"] += 1
+                return False
+            self._last_alert[account_login] = fingerprint
+
+        self.start()
+        payload = {
+            "trading_account_login": account_login,
+            "risk_signals": signals,
+            "risk_score": score,
+            "last_trade_at": last_trade.isoformat() if last_trade else None,
+        }
+        try:
+            self.queue.put_nowait(payload)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+                self._last_alert.pop(account_login, None)
+            logger.error("Webhook queue full - alert for account %s dropped", account_login)
+            return False
+
+        with self._lock:
+            self._stats["enqueued"] += 1
+        return True
+
+    def clear(self, account_logins):
+        """Forget the last alert of accounts back under the threshold, so their next alert is sent"""
+        with self._lock:
+            for login in account_logins:
+                self._last_alert.pop(login, None)
+
+    def retain(self, account_logins):
+        """Forget the last alert of every account not in `account_logins`"""
+        keep = set(account_logins)
+        with self._lock:
+            self._last_alert = {login: fingerprint for login, fingerprint in self._last_alert.items()
+                                if login in keep}
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        while not self._stopping.is_set():
+            batch = self._next_batch()
+            if not batch:
+                continue
+            try:
+                payload = batch[0] if self.batch_size == 1 else {"alerts": batch}
+                self._deliver(payload, [p["trading_account_login"] for p in batch])
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    def _deliver(self, payload, account_logins):
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self._session.post(self.url, json=payload, timeout=self.timeout)
+                retry = response.status_code in RETRY_STATUSES
+                response.raise_for_status()
+                self._record_latency(time.perf_counter() - started)
+                WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome="sent")
+                with self._lock:
+                    self._stats["sent"] += len(account_logins)
+                logger.info("Webhook sent - accounts %s (HTTP %s)", account_logins, response.status_code)
+                return
+            except requests.HTTPError as e:
+                error = e
+            except requests.RequestException as e:
+                error, retry = e, True
+            WEBHOOK_SECONDS.observe(time.perf_counter() - started, outcome="error")
+
+            if not retry or attempt == self.max_retries or self._stopping.is_set():
+                break
+            with self._lock:
+                self._stats["retried"] += 1
+            time.sleep(self.backoff * 2 ** attempt)
+
+        with self._lock:
+            self._stats["failed"] += len(account_logins)
+            # Let the next cycle alert again for these accounts
+            for login in account_logins:
+                self._last_alert.pop(login, None)
+        logger.error(f"Webhook FAILED - accounts {account_logins}: {error}")
+
+    def _record_latency(self, seconds: float):
+        with self._lock:
+            self._latency_count += 1
+            self._latency_total += seconds
+            self._latency_max = max(self._latency_max, seconds)
+            self._latency_last = seconds
+
+    def stats(self):
+        """Delivery counters, queue depth and post latency in milliseconds"""
+        with self._lock:
+            avg = self._latency_total / self._latency_count if self._latency_count else 0.0
+            return {
+                **self._stats,
+                "queue_depth": self.queue.qsize(),
+                "latency_ms": {
+                    "avg": round(avg * 1000, 3),
+                    "max": round(self._latency_max * 1000, 3),
+                    "last": round(self._latency_last * 1000, 3),
+                },
+            }
+
+
+webhook_dispatcher = WebhookDispatcher()
@@ -0,0 +1,223 @@
+from collections import deque
+import threading
+from sqlalchemy.orm import Session
+from app.config import settings
+import app.crud as crud
+import app.utils as utils
+
+
+class RollingWindow:
+    """
+    Last N trades of one account with running counters.
+
+    Pushing a trade evicts the oldest one once the window is full, and win count,
+    gross profit/loss, SL/TP usage and HFT count are updated in O(1). Drawdown
+    and layering are recomputed over the buffer when metrics are requested.
+    Trades must be pushed in closed_at order.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.trades = deque()  # oldest -> newest
+        self.hft_duration = settings.HFT_DURATION
+        self.wins = 0
+        self.gross_profit = 0.0
+        self.gross_loss = 0.0
+        self.sl_count = 0
+        self.tp_count = 0
+        self.hft_count = 0
+        self._evicted = 0
+
+    def _is_hft(self, trade):
+        return (trade.closed_at - trade.opened_at).total_seconds() < self.hft_duration
+
+    def _count(self, trade, sign: int):
+        if trade.profit > 0:
+            self.wins += sign
+            self.gross_profit += sign * trade.profit
+        elif trade.profit < 0:
+            self.gross_loss += sign * trade.profit
+        if trade.price_sl is not None:
+            self.sl_count += sign
+        if trade.price_tp is not None:
+            self.tp_count += sign
+        if self._is_hft(trade):
+            self.hft_count += sign
+
+    def _recount(self):
+        """Recompute every counter from the buffer"""
+        self.hft_duration = settings.HFT_DURATION
+        self.wins = self.sl_count = self.tp_count = self.hft_count = 0
+        self.gross_profit = self.gross_loss = 0.0
+        for trade in self.trades:
+            self._count(trade, 1)
+        self._evicted = 0
+
+    def _evict(self):
+        self._count(self.trades.popleft(), -1)
+        # Re-sum once per window turnover so float drift never accumulates
+        self._evicted += 1
+        if self._evicted >= self.size:
+            self._recount()
+
+    def push(self, trade):
+        """Add the newest trade, evicting the oldest when the window is full"""
+        if len(self.trades) >= self.size:
+            self._evict()
+        self.trades.append(trade)
+        self._count(trade, 1)
+
+    def shrink(self, size: int):
+        """Reduce the window size, dropping the oldest trades"""
+        self.size = size
+        while len(self.trades) > size:
+            self._evict()
+
+    def copy(self):
+        """Independent window with the same trades and counters; the trade rows themselves are shared"""
+        window = RollingWindow.__new__(RollingWindow)
+        window.__dict__.update(self.__dict__)
+        window.trades = deque(self.trades)
+        return window
+
+    def metrics(self):
+        """Return the same metrics as utils.calculate_metrics over the window"""
+        if not self.trades:
+            return {}
+        if self.hft_duration != settings.HFT_DURATION:
+            self._recount()
+
+        n = len(self.trades)
+        # calculate_metrics receives windows newest first
+        window = list(reversed(self.trades))
+        return {
+            'win_ratio': self.wins / n,
+            'profit_factor': self.gross_profit / abs(self.gross_loss) if self.gross_loss < 0 else float('inf'),
+            'max_drawdown': utils.calculate_max_drawdown(window),
+            'stop_loss_used': self.sl_count / n,
+            'take_profit_used': self.tp_count / n,
+            'hft_count': self.hft_count,
+            'max_layering': utils.calculate_max_layering(window),
+            'last_trade_at': self.trades[-1].closed_at
+        }
+
+
+class WindowStore:
+    """
+    Rolling windows of every account, kept in step with the trades table.
+
+    Trades are read by rowid, which SQLite hands out in commit order (a resent
+    trade is replaced and gets a new one), so each cycle sees every trade
+    committed since the last one exactly once. A trade newer than its
+    account's newest (closed_at, identifier) is pushed; an older or resent one
+    reloads that account's window from the table.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.windows = {}
+        self.newest = {}  # account_login -> (closed_at, identifier) of its newest trade
+        self.size = None
+        self.high_water = None  # rowid of the last trade committed before the windows were read
+
+    @property
+    def ready(self):
+        return self.size is not None
+
+    def copy(self):
+        """
+        Snapshot of the store that can be advanced and scored without moving
+        this one, e.g. for a profiling pass next to the scheduled cycles
+        """
+        with self._lock:
+            store = WindowStore()
+            store.windows = {login: window.copy() for login, window in self.windows.items()}
+            store.newest = dict(self.newest)
+            store.size = self.size
+            store.high_water = self.high_water
+            return store
+
+    def _load(self, db: Session, account_logins=None):
+        """Load windows from the table; return the highest rowid read"""
+        high_water = None
+        for login, rows in crud.fetch_trade_window_rows(db, self.size, settings.FETCH_CHUNK_SIZE, account_logins):
+            window = RollingWindow(self.size)
+            for row in reversed(rows):
+                window.push(row)
+            self.windows[login] = window
+            self.newest[login] = max((row.closed_at, row.identifier) for row in rows)
+            seq = max(row.seq for row in rows)
+            high_water = seq if high_water is None else max(high_water, seq)
+        return high_water
+
+    def rebuild(self, db: Session, size: int = None):
+        """Rebuild every window from the trades table"""
+        with self._lock:
+            self.size = size or settings.WINDOW_SIZE
+            self.windows = {}
+            self.newest = {}
+            # Taken from the rows loaded, so it belongs to the same snapshot. Newer
+            # trades outside every window are read again and reload their account
+            self.high_water = self._load(db)
+
+    def reload(self, db: Session, account_logins):
+        """Rebuild the windows of some accounts, e.g. after out-of-order trades"""
+        with self._lock:
+            for login in account_logins:
+                self.windows.pop(login, None)
+                self.newest.pop(login, None)
+            self._load(db, account_logins)
+
+    def resize(self, db: Session, size: int):
+        """Change the window size; growing needs older trades, so it reloads"""
+        with self._lock:
+            if self.size is not None and size <= self.size:
+                self.size = size
+                for window in self.windows.values():
+                    window.shrink(size)
+            else:
+                self.rebuild(db, size)
+
+    def advance(self, db: Session):
+        """
+        Push every trade committed since the last advance, and reload the
+        accounts that received trades older than their newest one or resent
+        trades. Return the touched logins.
+        """
+        with self._lock:
+            touched, stale = set(), set()
+            for row in crud.fetch_trades_committed_after(db, self.high_water):
+                login = row.trading_account_login
+                self.high_water = row.seq if self.high_water is None else max(self.high_water, row.seq)
+                touched.add(login)
+                if login in stale:
+                    continue
+                key = (row.closed_at, row.identifier)
+                newest = self.newest.get(login)
+                if newest is not None and key <= newest:
+                    # Rows come in closed_at order, so this account's later rows are skipped too
+                    stale.add(login)
+                    continue
+                window = self.windows.get(login)
+                if window is None:
+                    window = self.windows[login] = RollingWindow(self.size)
+                window.push(row)
+                self.newest[login] = key
+            if stale:
+                self.reload(db, stale)
+            return touched
+
+    def score(self, account_logins=None):
+        """Yield (account_login, metrics, risk_score, risk_signals) from the windows"""
+        with self._lock:
+            logins = list(self.windows) if account_logins is None else sorted(account_logins)
+            for login in logins:
+                window = self.windows.get(login)
+                if window is None or not window.trades:
+                    continue
+                metrics = window.metrics()
+                yield (login, metrics, utils.calculate_risk_score(metrics),
+                       utils.generate_risk_signals(metrics))
+
+
+window_store = WindowStore()
@@ -0,0 +1,212 @@
+"""
+Generate a synthetic accounts/trades database for benchmarking.
+
+    python -m benchmarks.generate --accounts 10000 --trades 1000000 --out bench.db
+
+Trades per account follow a Zipf-like distribution (--skew), so a few accounts
+hold most of the trades as in production. Each account also gets its own
+profitability, stop-loss/take-profit habits and share of short (HFT) trades,
+so every risk signal fires for some accounts. Trades are written in chunks,
+memory stays bounded at any scale.
+"""
+from datetime import datetime
+from sqlalchemy import create_engine
+from app.migrations import run_migrations
+import numpy as np
+import argparse
+import sqlite3
+import time
+
+START = np.datetime64(datetime(2024, 1, 1), "us")
+SYMBOLS = np.array(["EURUSD", "GBPUSD", "USDJPY", "XAUUSD", "US30", "BTCUSD"])
+ACCOUNT_SIZES = np.array([10000.0, 25000.0, 50000.0, 100000.0, 200000.0])
+
+TRADE_COLUMNS = ["identifier", "action", "reason", "open_price", "close_price", "commission", "lot_size",
+                 "opened_at", "closed_at", "pips", "price_sl", "price_tp", "profit", "swap", "symbol",
+                 "contract_size", "profit_rate", "platform", "trading_account_login"]
+
+
+def trade_counts(rng, accounts: int, trades: int, skew: float):
+    """Trades per account: Zipf weights over a random ranking of the accounts"""
+    weights = 1.0 / np.arange(1, accounts + 1) ** skew
+    rng.shuffle(weights)
+    return rng.multinomial(trades, weights / weights.sum())
+
+
+def account_columns(rng, logins):
+    n = len(logins)
+    return {
+        "login": logins,
+        "account_size": rng.choice(ACCOUNT_SIZES, n),
+        "platform": rng.integers(1, 3, n),
+        "phase": rng.integers(0, 4, n),
+        # Around three accounts per user and fifty per challenge
+        "user_id": logins // 3,
+        "challenge_id": rng.integers(0, max(n // 50, 1), n),
+    }
+
+
+def account_behaviour(rng, n: int):
+    """
+    Per-account trading habits, plus the clock (seconds after START) of each
+    account's last close, advanced as its trades are generated
+    """
+    return {
+        "skill": rng.normal(-0.1, 0.4, n),
+        "sl_rate": rng.beta(2, 2, n),
+        "tp_rate": rng.beta(1.5, 3, n),
+        "hft_rate": rng.beta(0.5, 4, n),
+        "clock": rng.integers(0, 86400 * 30, n),
+    }
+
+
+def trade_columns(rng, logins, counts, behaviour, first_id: int = 0):
+    """
+    Column arrays for counts[i] new trades of logins[i], whose habits are
+    behaviour[...][i]. closed_at keeps increasing within every account, and
+    behaviour["clock"] is advanced in place.
+    """
+    n = int(counts.sum())
+    owner = np.repeat(np.arange(len(logins)), counts)
+
+    hft = rng.random(n) < behaviour["hft_rate"][owner]
+    duration = np.where(hft, rng.integers(1, 60, n), rng.lognormal(7.5, 1.5, n).astype(np.int64) + 60)
+    gap = rng.exponential(1800, n).astype(np.int64) + 1
+
+    # Per-account cumulative sum of the gaps between closes
+    elapsed = np.cumsum(gap)
+    ends = np.cumsum(counts)
+    before = np.concatenate(([0], elapsed[ends[:-1] - 1])) if n else np.zeros(0, np.int64)
+    seconds = behaviour["clock"][owner] + elapsed - np.repeat(before, counts)
+    has_trades = counts > 0
+    behaviour["clock"][has_trades] = seconds[ends[has_trades] - 1]
+
+    closed_at = START + seconds * 1_000_000
+    opened_at = closed_at - duration * 1_000_000
+    open_price = rng.uniform(1.0, 2.0, n)
+    close_price = open_price * (1 + rng.normal(0, 0.002, n))
+    sl = rng.random(n) < behaviour["sl_rate"][owner]
+    tp = rng.random(n) < behaviour["tp_rate"][owner]
+
+    def timestamps(values):
+        return np.char.replace(np.datetime_as_string(values, unit="us"), "T", " ")
+
+    return {
+        "identifier": np.char.add("BT", np.arange(first_id, first_id + n).astype(str)),
+        "action": rng.integers(0, 2, n),
+        "reason": rng.integers(0, 3, n),
+        "open_price": open_price,
+        "close_price": close_price,
+        "commission": np.round(rng.uniform(-7, 0, n), 2),
+        "lot_size": np.round(rng.uniform(0.01, 5, n), 2),
+        "opened_at": timestamps(opened_at),
+        "closed_at": timestamps(closed_at),
+        "pips": np.round((close_price - open_price) * 10000, 1),
+        "price_sl": np.where(sl, open_price * 0.99, np.nan),
+        "price_tp": np.where(tp, open_price * 1.01, np.nan),
+        "profit": np.round(rng.normal(behaviour["skill"][owner] * 150, 400), 2),
+        "swap": np.round(rng.normal(0, 1, n), 2),
+        "symbol": rng.choice(SYMBOLS, n),
+        "contract_size": np.full(n, 100000.0),
+        "profit_rate": np.ones(n),
+        "platform": rng.integers(1, 3, n),
+        "trading_account_login": np.asarray(logins)[owner],
+    }
+
+
+def blocks(counts, chunk_size: int):
+    """
+    Split the trades to generate into (account indexes, trade counts) blocks of
+    at most chunk_size trades; an account with more trades spans several blocks
+    """
+    remaining = counts.copy()
+    account = 0
+    while account < len(counts):
+        indexes, sizes, budget = [], [], chunk_size
+        while account < len(counts) and budget:
+            take = min(int(remaining[account]), budget)
+            if take:
+                indexes.append(account)
+                sizes.append(take)
+                remaining[account] -= take
+                budget -= take
+            if not remaining[account]:
+                account += 1
+        if indexes:
+            yield np.array(indexes), np.array(sizes)
+
+
+def _rows(columns, names):
+    """Row tuples of plain python values, with NaN turned into NULL"""
+    values = []
+    for name in names:
+        column = columns[name].tolist()
+        if columns[name].dtype.kind == "f":
+            column = [None if v != v else v for v in column]
+        values.append(column)
+    return zip(*values)
+
+
+def trade_records(rng, logins, counts, first_id: int = 0):
+    """Trades as TradeCreate-shaped dicts, e.g. for ingestion requests"""
+    logins = np.asarray(logins)
+    columns = trade_columns(rng, logins, np.asarray(counts), account_behaviour(rng, len(logins)), first_id)
+    return [dict(zip(TRADE_COLUMNS, row)) for row in _rows(columns, TRADE_COLUMNS)]
+
+
+def generate(path: str, accounts: int, trades: int, skew: float = 1.1, seed: int = 0,
+             chunk_size: int = 500000, first_login: int = 100000, verbose: bool = True):
+    """Create the schema at `path` and fill it; return the number of trades written"""
+    engine = create_engine(f"sqlite:///{path}")
+    run_migrations(engine)
+    engine.dispose()
+
+    rng = np.random.default_rng(seed)
+    logins = np.arange(first_login, first_login + accounts)
+    counts = trade_counts(rng, accounts, trades, skew)
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    started = time.perf_counter()
+
+    account_names = ["login", "account_size", "platform", "phase", "user_id", "challenge_id"]
+    with conn:
+        conn.executemany(f"INSERT INTO accounts ({', '.join(account_names)}) VALUES "
+                         f"({', '.join('?' * len(account_names))})",
+                         _rows(account_columns(rng, logins), account_names))
+
+    insert = (f"INSERT INTO trades ({', '.join(TRADE_COLUMNS)}) VALUES "
+              f"({', '.join('?' * len(TRADE_COLUMNS))})")
+    behaviour = account_behaviour(rng, accounts)
+    written = 0
+    for indexes, sizes in blocks(counts, chunk_size):
+        block_behaviour = {name: values[indexes] for name, values in behaviour.items()}
+        columns = trade_columns(rng, logins[indexes], sizes, block_behaviour, written)
+        behaviour["clock"][indexes] = block_behaviour["clock"]
+        with conn:
+            conn.executemany(insert, _rows(columns, TRADE_COLUMNS))
+        written += int(sizes.sum())
+        if verbose:
+            print(f"{path}: {written}/{trades} trades ({written / (time.perf_counter() - started):.0f} rows/sec)")
+
+    conn.execute("ANALYZE")
+    conn.close()
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="bench.db", help="SQLite file to create")
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--trades", type=int, default=100000)
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of trades per account; 0 is uniform")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=500000, help="Trades per insert transaction")
+    args = parser.parse_args()
+
+    generate(args.out, args.accounts, args.trades, args.skew, args.seed, args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Compare query plans and latencies of the service's hot queries without and
+with the indexes declared on the models.
+
+    python -m benchmarks.query_plans --db risk_signal.db
+
+The database is copied to a temporary file first, the original is never modified.
+"""
+from sqlalchemy import create_engine, event, inspect, select, text
+from sqlalchemy.orm import Session
+import app.crud as crud
+import app.models as models
+from app.migrations import run_migrations
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+
+def _queries(db: Session, account_login: int, user_id: int):
+    """Name -> callable running one of the service's query shapes"""
+    return {
+        "trade_windows": lambda: sum(1 for _ in crud.fetch_compact_windows(db)),
+        "account_window": lambda: sum(1 for _ in crud.fetch_compact_windows(db, account_logins=[account_login])),
+        "stale_accounts": lambda: crud.find_stale_accounts(db),
+        "user_window": lambda: sum(1 for _ in crud.fetch_group_trade_windows(db, models.Account.user_id,
+                                                                            [user_id])),
+        "latest_risk_metric": lambda: db.execute(
+            select(models.RiskMetric)
+            .where(models.RiskMetric.account_login == account_login)
+            .order_by(models.RiskMetric.timestamp.desc())
+            .limit(1)).first(),
+    }
+
+
+def _capture_sql(engine, fn):
+    """Run fn and return the first SQL statement and parameters it executed"""
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        fn()
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+    return captured[0] if captured else (None, None)
+
+
+def _measure(engine, repeat: int, account_login: int, user_id: int):
+    results = {}
+    with Session(engine) as db:
+        for name, fn in _queries(db, account_login, user_id).items():
+            statement, parameters = _capture_sql(engine, fn)
+            with engine.connect() as conn:
+                plan = [row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)]
+
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                fn()
+                timings.append(time.perf_counter() - started)
+                db.rollback()
+            results[name] = {
+                "plan": plan,
+                "median_ms": round(statistics.median(timings) * 1000, 3),
+                "min_ms": round(min(timings) * 1000, 3),
+            }
+    return results
+
+
+def _drop_declared_indexes(engine):
+    existing = {t: {i["name"] for i in inspect(engine).get_indexes(t)} for t in inspect(engine).get_table_names()}
+    with engine.begin() as conn:
+        for table in models.Base.metadata.sorted_tables:
+            for index in table.indexes:
+                if index.name in existing.get(table.name, ()):
+                    conn.execute(text(f"DROP INDEX {index.name}"))
+        conn.execute(text("ANALYZE"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="risk_signal.db", help="SQLite database to benchmark (copied first)")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per query")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="risk-bench-")
+    path = os.path.join(workdir, "bench.db")
+    shutil.copyfile(args.db, path)
+    engine = create_engine(f"sqlite:///{path}")
+    try:
+        run_migrations(engine)
+        with engine.connect() as conn:
+            account_login = conn.execute(select(models.Trade.trading_account_login).limit(1)).scalar()
+            user_id = conn.execute(select(models.Account.user_id)
+                                   .where(models.Account.login == account_login)).scalar()
+
+        _drop_declared_indexes(engine)
+        before = _measure(engine, args.repeat, account_login, user_id)
+        created = run_migrations(engine)
+        after = _measure(engine, args.repeat, account_login, user_id)
+
+        report = {"database": os.path.abspath(args.db), "indexes": created,
+                  "queries": {name: {"before": before[name], "after": after[name]} for name in before}}
+        output = json.dumps(report, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(output)
+        else:
+            print(output)
+    finally:
+        engine.dispose()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,304 @@
+"""
+Benchmark the scoring pipeline on a synthetic (or copied) database and print
+a JSON report, so runs can be compared across releases, engines and storage
+settings.
+
+    python -m benchmarks.run --accounts 10000 --trades 1000000 --engines python,vectorized,rolling
+    python -m benchmarks.run --db risk_signal.db --suites cycle --output before.json
+    SQLITE_SYNCHRONOUS=FULL SCORING_WORKERS=4 python -m benchmarks.run --output sync_full.json
+
+Suites:
+    metrics    utils.calculate_metrics over fetched trade windows (ORM and compact)
+    cycle      calculate_risk_metrics: a cold full cycle, warm full cycles and an idle cycle, per engine
+    ingestion  POST /trades/batch and /trades/stream with new trades
+    reads      GET /risk-report, POST /risk-report/batch, GET /risk/user and /risk/challenge
+
+The database is generated (or copied) into a work directory, the original is
+never modified. Settings come from the environment as for the service and are
+recorded in the report. The ingestion and read suites need httpx (for
+FastAPI's TestClient).
+"""
+import numpy as np
+import argparse
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SUITES = ["metrics", "cycle", "ingestion", "reads"]
+
+
+def summarize(seconds):
+    """Latency summary in milliseconds"""
+    ordered = sorted(seconds)
+
+    def percentile(p):
+        return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)] * 1000, 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def test_client(app):
+    try:
+        from fastapi.testclient import TestClient
+    except ImportError:
+        raise SystemExit("The ingestion and read benchmarks need httpx: pip install httpx")
+    return TestClient(app)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_metrics(db, accounts: int):
+    """calculate_metrics per window, on ORM trade lists and on compact windows"""
+    import app.crud as crud
+    import app.utils as utils
+    from app.config import settings
+    from app.models import Account
+
+    logins = [login for login, in db.query(Account.login).order_by(Account.login).limit(accounts)]
+    results = {}
+    for name, fetch in [("orm", crud.fetch_trade_windows), ("compact", crud.fetch_compact_windows)]:
+        fetch_seconds, windows = timed(lambda: list(fetch(db, settings.WINDOW_SIZE, account_logins=logins)))
+        timings = [timed(utils.calculate_metrics, window)[0] for _, window in windows]
+        results[name] = {
+            "windows": len(windows),
+            "fetch_seconds": round(fetch_seconds, 3),
+            "windows_per_second": round(len(timings) / sum(timings), 1) if timings else None,
+            "calculate_metrics": summarize(timings) if timings else None,
+        }
+        db.rollback()
+    return results
+
+
+def bench_cycle(main, engines, repeat: int):
+    """Full and idle calculate_risk_metrics cycles with every metrics engine"""
+    from app.config import settings
+    from app.database import engine
+    from app.dirty import dirty_tracker
+    from sqlalchemy import text
+
+    def scored_at():
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT max(timestamp), count(*) FROM risk_latest")).first()
+
+    results = {}
+    for name in engines:
+        settings.METRICS_ENGINE = name
+        full = []
+        for _ in range(repeat + 1):
+            before = scored_at()
+            dirty_tracker.mark_all()
+            full.append(timed(main.calculate_risk_metrics)[0])
+            if scored_at() == before:
+                raise RuntimeError(f"{name} cycle did not persist any risk metric, see risk_service.log")
+        idle, _ = timed(main.calculate_risk_metrics)
+        results[name] = {
+            "accounts_scored": scored_at()[1],
+            "cold_full_seconds": round(full[0], 3),
+            "warm_full": summarize(full[1:]) if repeat else None,
+            "idle_seconds": round(idle, 3),
+        }
+    return results
+
+
+def bench_ingestion(client, logins, batches: int, batch_size: int, seed: int):
+    """Upsert new trades through the batch and NDJSON stream endpoints"""
+    from benchmarks.generate import trade_records
+
+    rng = np.random.default_rng(seed)
+    results = {}
+    first_id = 10 ** 12
+    for endpoint in ["/trades/batch", "/trades/stream"]:
+        timings = []
+        for _ in range(batches):
+            owners = rng.choice(logins, batch_size)
+            accounts, counts = np.unique(owners, return_counts=True)
+            records = trade_records(rng, accounts, counts, first_id)
+            first_id += batch_size
+            if endpoint == "/trades/batch":
+                seconds, response = timed(client.post, endpoint, json=records)
+            else:
+                body = "\n".join(json.dumps(record) for record in records)
+                seconds, response = timed(client.post, endpoint, content=body,
+                                          headers={"Content-Type": "application/x-ndjson"})
+            response.raise_for_status()
+            timings.append(seconds)
+        results[endpoint] = {
+            "batch_size": batch_size,
+            "rows_per_second": round(batches * batch_size / sum(timings), 1),
+            "latency": summarize(timings),
+        }
+    return results
+
+
+def bench_reads(client, db, requests: int, batch_size: int, seed: int):
+    """Latency of the read endpoints; risk reports both cold and from the cache"""
+    from app.cache import risk_report_cache
+    from app.models import Account
+
+    rnd = random.Random(seed)
+    rows = db.query(Account.login, Account.user_id, Account.challenge_id).all()
+    db.rollback()
+    logins = [row.login for row in rows]
+    users = sorted({row.user_id for row in rows})
+    challenges = sorted({row.challenge_id for row in rows})
+
+    def run(make_request, clear_cache=False):
+        timings = []
+        for _ in range(requests):
+            if clear_cache:
+                risk_report_cache.clear()
+            seconds, response = timed(make_request)
+            if response.status_code not in (200, 404):
+                response.raise_for_status()
+            timings.append(seconds)
+        return summarize(timings)
+
+    return {
+        "GET /risk-report/{login} (cold)": run(lambda: client.get(f"/risk-report/{rnd.choice(logins)}"),
+                                               clear_cache=True),
+        "GET /risk-report/{login} (cached)": run(lambda: client.get(f"/risk-report/{rnd.choice(logins[:100])}")),
+        f"POST /risk-report/batch ({batch_size} ids)": run(
+            lambda: client.post("/risk-report/batch", json={"ids": rnd.sample(logins, min(batch_size, len(logins)))})),
+        "GET /risk/user/{id}": run(lambda: client.get(f"/risk/user/{rnd.choice(users)}")),
+        "GET /risk/user/{id}?fresh=true": run(lambda: client.get(f"/risk/user/{rnd.choice(users)}?fresh=true")),
+        "GET /risk/challenge/{id}": run(lambda: client.get(f"/risk/challenge/{rnd.choice(challenges)}")),
+    }
+
+
+def run(args):
+    """Prepare the database in the work directory, run the suites and return the report"""
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="risk-bench-"))
+    os.makedirs(workdir, exist_ok=True)
+    path = os.path.join(workdir, "risk_signal.db")
+    if args.db:
+        shutil.copyfile(args.db, path)
+
+    # The service opens ./risk_signal.db, resolved when app.database is first
+    # imported, and writes its log to the working directory. Nothing from app
+    # may be imported before this point.
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        from benchmarks.generate import generate
+        import app.main as main
+        import app.parallel as parallel
+        from app.database import ReadSessionLocal, engine
+        from app.migrations import run_migrations
+        from app.webhooks import webhook_dispatcher
+
+        if args.db:
+            dataset = {"source": os.path.join(cwd, args.db)}
+        else:
+            started = time.perf_counter()
+            generate(path, args.accounts, args.trades, args.skew, args.seed, verbose=False)
+            dataset = {"accounts": args.accounts, "trades": args.trades, "skew": args.skew, "seed": args.seed,
+                       "generate_seconds": round(time.perf_counter() - started, 3)}
+        run_migrations(engine)
+        webhook_dispatcher.url = None  # never post alerts from a benchmark
+        report = {
+            "meta": {
+                "label": args.label,
+                "started_at": datetime.datetime.now().isoformat(),
+                "git_commit": _git_commit(),
+                "python": sys.version.split()[0],
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "dataset": dataset,
+                "settings": parallel.config_snapshot(),
+            },
+            "results": {},
+        }
+        results = report["results"]
+        default_engine = main.settings.METRICS_ENGINE
+        db = ReadSessionLocal()
+        try:
+            if "metrics" in args.suites:
+                results["metrics"] = bench_metrics(db, args.metrics_accounts)
+            if "cycle" in args.suites:
+                results["cycle"] = bench_cycle(main, args.engines, args.repeat)
+            main.settings.METRICS_ENGINE = default_engine
+
+            if "ingestion" in args.suites or "reads" in args.suites:
+                client = test_client(main.app)
+                if "cycle" not in args.suites:
+                    # Reads need scored accounts and aggregates
+                    main.dirty_tracker.mark_all()
+                    main.calculate_risk_metrics()
+                if "ingestion" in args.suites:
+                    logins = [login for login, in db.query(main.models.Account.login)]
+                    db.rollback()
+                    results["ingestion"] = bench_ingestion(client, logins, args.batches, args.batch_size, args.seed)
+                if "reads" in args.suites:
+                    results["reads"] = bench_reads(client, db, args.requests, args.lookup_size, args.seed)
+        finally:
+            db.close()
+            parallel.shutdown_pool()
+        return report
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="Benchmark a copy of this database instead of generating one")
+    parser.add_argument("--accounts", type=int, default=1000, help="Accounts to generate")
+    parser.add_argument("--trades", type=int, default=100000, help="Trades to generate")
+    parser.add_argument("--skew", type=float, default=1.1, help="Zipf exponent of trades per account")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma separated, from {', '.join(SUITES)}")
+    parser.add_argument("--engines", default="python,vectorized,rolling", help="Metrics engines for the cycle suite")
+    parser.add_argument("--repeat", type=int, default=3, help="Warm full cycles per engine")
+    parser.add_argument("--metrics-accounts", type=int, default=2000, help="Windows timed by the metrics suite")
+    parser.add_argument("--batches", type=int, default=10, help="Ingestion requests per endpoint")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Trades per ingestion request")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per read endpoint")
+    parser.add_argument("--lookup-size", type=int, default=100, help="Ids per batch lookup")
+    parser.add_argument("--label", help="Free text stored in the report, e.g. a release or config name")
+    parser.add_argument("--workdir", help="Keep the database and log in this directory")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    args = parser.parse_args()
+    args.suites = [s for s in args.suites.split(",") if s]
+    args.engines = [e for e in args.engines.split(",") if e]
+    unknown = set(args.suites) - set(SUITES)
+    if unknown:
+        parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+
+    output = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
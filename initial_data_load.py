@@ -1,7 +1,13 @@
-from app.models import Base, Account, Trade
+from app.models import Base, Account, Trade, LoadProgress
+from app.crud import upsert_accounts, upsert_trades
 from dotenv import load_dotenv
 from app.database import engine
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
 import pandas as pd
+import argparse
+import time
 import os
 
 load_dotenv(".env")
@@ -10,45 +16,146 @@ load_dotenv(".env")
 ACCOUNTS_CSV = os.getenv("ACCOUNTS_CSV_PATH")
 TRADES_CSV = os.getenv("TRADES_CSV_PATH")
 
+# Rows read from the CSV and written in one transaction
+DEFAULT_CHUNK_SIZE = 50000
 
-def load_data():
-    # Create tables
-    Base.metadata.create_all(bind=engine)
+# Pragmas trading durability for speed while the bulk load runs
+LOAD_PRAGMAS = [
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",  # 256 MB
+]
 
-    if not ACCOUNTS_CSV or not os.path.exists(ACCOUNTS_CSV):
-        raise FileNotFoundError(f"Accounts CSV path not found: {ACCOUNTS_CSV}")
 
-    # Load accounts
-    accounts_df = pd.read_csv(ACCOUNTS_CSV)
+def _signature(path):
+    stat = os.stat(path)
+    return f"{stat.st_size}:{int(stat.st_mtime)}"
 
-    accounts_df.to_sql('accounts', engine, if_exists='append', index=False)
-    print(" accounts loaded ")
 
-    if not TRADES_CSV or not os.path.exists(TRADES_CSV):
-        raise FileNotFoundError(f"Trades CSV path not found: {TRADES_CSV}")
+def _rows_done(conn, source, signature):
+    """Rows already loaded from this exact file, 0 if it is new or has changed"""
+    progress = conn.execute(select(LoadProgress).where(LoadProgress.source == source)).first()
+    if progress is None or progress.signature != signature:
+        return 0
+    return progress.rows_done
 
-    # Load trades
-    trades_df = pd.read_csv(TRADES_CSV)
 
-    # Handle index column
-    if 'Unnamed: 0' in trades_df.columns:
-        trades_df = trades_df.drop(columns=['Unnamed: 0'])
+def _save_progress(conn, source, signature, rows_done):
+    stmt = insert(LoadProgress.__table__).values(
+        source=source, signature=signature, rows_done=rows_done, updated_at=datetime.now())
+    conn.execute(stmt.on_conflict_do_update(
+        index_elements=["source"],
+        set_={"signature": signature, "rows_done": rows_done, "updated_at": datetime.now()}))
 
-    # Handle duplicates
-    trades_df = trades_df.drop_duplicates(subset='identifier', keep='first')
-    print(f"Loaded {len(trades_df)} trades after deduplication")
+
+def _prepare_trades(df):
+    # Handle index column
+    if 'Unnamed: 0' in df.columns:
+        df = df.drop(columns=['Unnamed: 0'])
 
     # Handle large integers in identifier
-    trades_df['identifier'] = trades_df['identifier'].astype(str)
+    df['identifier'] = df['identifier'].astype(str)
 
     # Convert datetime columns
     for col in ['opened_at', 'closed_at']:
-        trades_df[col] = pd.to_datetime(trades_df[col])
+        df[col] = pd.to_datetime(df[col])
+    return df
+
+
+def _records(df, model):
+    """Rows of the table's columns as dicts, with NaN turned into NULL"""
+    columns = [c.name for c in model.__table__.columns if c.name in df.columns]
+    df = df[columns].astype(object)
+    return df.where(df.notna(), None).to_dict('records')
+
+
+def load_csv(conn, path, model, upsert, prepare, chunk_size, restart=False):
+    """
+    Stream a CSV into `model` in chunks. Each chunk is upserted with executemany
+    and committed together with the loader's progress, so an interrupted load
+    resumes after the last committed chunk and re-runs never duplicate rows.
+    A key repeated in the file, a re-run or a delta file overwrites the stored
+    row: the last occurrence wins.
+    """
+    source = os.path.abspath(path)
+    signature = _signature(path)
+    with conn.begin():
+        done = 0 if restart else _rows_done(conn, source, signature)
+    if done:
+        print(f"Resuming {path} after {done} rows")
+
+    started = time.perf_counter()
+    loaded = 0
+    # Progress counts records, not lines: quoted fields may span lines, so
+    # loaded records are skipped after parsing rather than with skiprows
+    skip = done
+    for chunk in pd.read_csv(path, chunksize=chunk_size):
+        if skip:
+            if len(chunk) <= skip:
+                skip -= len(chunk)
+                continue
+            chunk, skip = chunk.iloc[skip:], 0
+        rows = _records(prepare(chunk) if prepare else chunk, model)
+        with conn.begin():
+            upsert(conn, rows, chunk_size)
+            loaded += len(chunk)
+            _save_progress(conn, source, signature, done + loaded)
+
+        elapsed = time.perf_counter() - started
+        print(f"{path}: {done + loaded} rows ({loaded / elapsed:.0f} rows/sec)")
+
+    print(f"{path}: loaded {loaded} rows in {time.perf_counter() - started:.1f}s")
+    return loaded
+
+
+def load_data(accounts_csv=ACCOUNTS_CSV, trades_csv=TRADES_CSV, chunk_size=DEFAULT_CHUNK_SIZE,
+              restart=False):
+    # Create tables
+    Base.metadata.create_all(bind=engine)
 
-    trades_df.to_sql('trades', engine, if_exists='append', index=False)
-    print(" data loaded ")
+    with engine.connect() as conn:
+        # Pragmas must run outside a transaction
+        for pragma in LOAD_PRAGMAS:
+            conn.connection.driver_connection.execute(pragma)
+
+        if accounts_csv:
+            if not os.path.exists(accounts_csv):
+                raise FileNotFoundError(f"Accounts CSV path not found: {accounts_csv}")
+            load_csv(conn, accounts_csv, Account, upsert_accounts, None, chunk_size, restart)
+            print(" accounts loaded ")
+
+        if trades_csv:
+            if not os.path.exists(trades_csv):
+                raise FileNotFoundError(f"Trades CSV path not found: {trades_csv}")
+            load_csv(conn, trades_csv, Trade, upsert_trades, _prepare_trades, chunk_size, restart)
+            print(" data loaded ")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load accounts and trades CSVs into the database. Rows are upserted on "
+                    "login/identifier, so full files, re-runs and incremental delta files are all safe.")
+    parser.add_argument("--accounts", default=None, help="Accounts CSV (default: ACCOUNTS_CSV_PATH)")
+    parser.add_argument("--trades", default=None, help="Trades CSV (default: TRADES_CSV_PATH)")
+    parser.add_argument("--delta", action="store_true",
+                        help="Only load the files given on the command line, e.g. a trades delta file")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Rows per transaction")
+    parser.add_argument("--restart", action="store_true", help="Ignore saved progress and load from the start")
+    args = parser.parse_args()
+
+    if args.delta:
+        accounts_csv, trades_csv = args.accounts, args.trades
+    else:
+        accounts_csv, trades_csv = args.accounts or ACCOUNTS_CSV, args.trades or TRADES_CSV
+        if not accounts_csv:
+            raise FileNotFoundError(f"Accounts CSV path not found: {accounts_csv}")
+        if not trades_csv:
+            raise FileNotFoundError(f"Trades CSV path not found: {trades_csv}")
+
+    load_data(accounts_csv, trades_csv, args.chunk_size, args.restart)
 
 
 if __name__ == "__main__":
-    load_data()
+    main()
     print("Initial data loaded successfully")
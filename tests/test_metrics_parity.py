@@ -0,0 +1,177 @@
+"""
+The python, compact, vectorized and rolling engines must produce the same
+metrics, score and signals for the same trade window.
+"""
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import random
+
+import pandas as pd
+import pytest
+
+from app.compact import TradeWindow
+from app.config import settings
+from app.crud import TRADE_WINDOW_COLUMNS
+from app.window import RollingWindow
+import app.utils as utils
+import app.vectorized as vectorized
+
+START = datetime(2024, 1, 1, 9, 0)
+
+
+def trade(login, opened_at, closed_at, profit, price_sl=1.0, price_tp=1.0):
+    return SimpleNamespace(trading_account_login=login, profit=profit, price_sl=price_sl, price_tp=price_tp,
+                           opened_at=opened_at, closed_at=closed_at)
+
+
+def newest_first(trades):
+    """Window order; sorted() is stable, so trades closing together keep their fixture order"""
+    return sorted(trades, key=lambda t: t.closed_at, reverse=True)
+
+
+def mixed_history(login, count, seed):
+    """More trades than the window holds, with wins, losses, missing SL/TP and some HFT trades"""
+    rng = random.Random(seed)
+    trades, at = [], START
+    for _ in range(count):
+        at += timedelta(seconds=rng.randint(1, 3600))
+        duration = timedelta(seconds=rng.choice([5, 30, 59, 60, 600, 7200]))
+        trades.append(trade(login, at - duration, at, round(rng.uniform(-900, 1000), 2),
+                            price_sl=None if rng.random() < 0.4 else 1.1,
+                            price_tp=None if rng.random() < 0.6 else 1.2))
+    return newest_first(trades)
+
+
+def tied_history(login):
+    """Trades closing (and opening) at the same instant, which drawdown and layering must order alike"""
+    close = START + timedelta(hours=2)
+    trades = [
+        trade(login, START, close, 500.0),
+        trade(login, START, close, -800.0, price_sl=None),
+        trade(login, START + timedelta(minutes=30), close, 300.0, price_tp=None),
+        trade(login, close, close + timedelta(hours=1), -200.0),
+        trade(login, close, close + timedelta(hours=1), 50.0),
+        trade(login, START + timedelta(hours=1), close + timedelta(hours=1), -900.0),
+    ]
+    return newest_first(trades)
+
+
+def winning_history(login):
+    """No losing trade: an infinite profit factor, and a zero-profit trade that is not a win"""
+    return newest_first([trade(login, START + timedelta(hours=i), START + timedelta(hours=i, minutes=30),
+                               0.0 if i == 2 else 100.0 * (i + 1)) for i in range(5)])
+
+
+def hft_pairs(login):
+    """Overlapping pairs of trades opened and closed seconds apart"""
+    trades = []
+    for i in range(6):
+        opened = START + timedelta(minutes=10 * i)
+        trades.append(trade(login, opened, opened + timedelta(seconds=20), 40.0, price_sl=None))
+        trades.append(trade(login, opened + timedelta(seconds=5), opened + timedelta(seconds=50), -25.0))
+    return newest_first(trades)
+
+
+def short_history(login):
+    """Fewer trades than WINDOW_SIZE"""
+    return newest_first([trade(login, START, START + timedelta(minutes=5), -120.0, price_tp=None),
+                         trade(login, START + timedelta(minutes=1), START + timedelta(minutes=2), 80.0)])
+
+
+HISTORIES = {
+    "mixed": mixed_history(1, 250, seed=7),
+    "mixed_exact_window": mixed_history(2, settings.WINDOW_SIZE, seed=11),
+    "ties": tied_history(3),
+    "no_losses": winning_history(4),
+    "hft_pairs": hft_pairs(5),
+    "short": short_history(6),
+    "single_trade": short_history(7)[:1],
+}
+
+
+def python_engine(history):
+    metrics = utils.calculate_metrics(history[:settings.WINDOW_SIZE])
+    return metrics, utils.calculate_risk_score(metrics), utils.generate_risk_signals(metrics)
+
+
+def compact_engine(history):
+    window = TradeWindow()
+    for t in history[:settings.WINDOW_SIZE]:
+        window.append(t.profit, t.price_sl, t.price_tp, t.opened_at, t.closed_at)
+    metrics = utils.calculate_metrics(window)
+    return metrics, utils.calculate_risk_score(metrics), utils.generate_risk_signals(metrics)
+
+
+def vectorized_engine(history):
+    frame = pd.DataFrame.from_records([tuple(getattr(t, name) for name in TRADE_WINDOW_COLUMNS)
+                                       for t in history[:settings.WINDOW_SIZE]], columns=TRADE_WINDOW_COLUMNS)
+    [(_, metrics, risk_score, risk_signals)] = vectorized.score_frame(frame)
+    return metrics, risk_score, risk_signals
+
+
+def rolling_engine(history):
+    # The whole history is pushed oldest first, so long histories also exercise eviction
+    window = RollingWindow(settings.WINDOW_SIZE)
+    for t in reversed(history):
+        window.push(t)
+    metrics = window.metrics()
+    return metrics, utils.calculate_risk_score(metrics), utils.generate_risk_signals(metrics)
+
+
+ENGINES = {"compact": compact_engine, "vectorized": vectorized_engine, "rolling": rolling_engine}
+
+
+def assert_same_result(expected, actual):
+    expected_metrics, expected_score, expected_signals = expected
+    metrics, risk_score, risk_signals = actual
+    assert set(metrics) == set(expected_metrics)
+    for name in ("win_ratio", "profit_factor", "max_drawdown", "stop_loss_used", "take_profit_used"):
+        assert metrics[name] == pytest.approx(expected_metrics[name], rel=1e-9, abs=1e-12), name
+    for name in ("hft_count", "max_layering", "last_trade_at"):
+        assert metrics[name] == expected_metrics[name], name
+    assert risk_score == pytest.approx(expected_score, rel=1e-9)
+    assert list(risk_signals) == list(expected_signals)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("history", HISTORIES)
+def test_engines_match_python_engine(engine, history):
+    assert_same_result(python_engine(HISTORIES[history]), ENGINES[engine](HISTORIES[history]))
+
+
+def test_vectorized_engine_scores_many_accounts_in_one_frame():
+    histories = list(HISTORIES.values())
+    rows = [tuple(getattr(t, name) for name in TRADE_WINDOW_COLUMNS)
+            for history in histories for t in history[:settings.WINDOW_SIZE]]
+    results = vectorized.score_frame(pd.DataFrame.from_records(rows, columns=TRADE_WINDOW_COLUMNS))
+
+    assert [login for login, *_ in results] == [history[0].trading_account_login for history in histories]
+    for (_, *result), history in zip(results, histories):
+        assert_same_result(python_engine(history), result)
+
+
+def test_no_losing_trades_give_an_infinite_profit_factor():
+    for engine in [python_engine, *ENGINES.values()]:
+        metrics, risk_score, _ = engine(HISTORIES["no_losses"])
+        assert metrics["profit_factor"] == float("inf")
+        assert metrics["win_ratio"] == pytest.approx(0.8)
+        assert risk_score <= 100
+
+
+def test_hft_pairs_are_counted_and_layered():
+    metrics, _, risk_signals = python_engine(HISTORIES["hft_pairs"])
+    assert metrics["hft_count"] == 12
+    assert metrics["max_layering"] == 2
+    assert "hft_signal" in risk_signals
+
+
+def test_rolling_window_matches_after_every_push():
+    history = HISTORIES["mixed"]
+    window = RollingWindow(settings.WINDOW_SIZE)
+    oldest_first = list(reversed(history))
+    for count, t in enumerate(oldest_first, start=1):
+        window.push(t)
+        if count % 25 == 0 or count < 5:
+            metrics = window.metrics()
+            assert_same_result(python_engine(newest_first(oldest_first[:count])),
+                               (metrics, utils.calculate_risk_score(metrics), utils.generate_risk_signals(metrics)))
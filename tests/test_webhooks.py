@@ -0,0 +1,196 @@
+"""WebhookDispatcher against a local stand-in receiver (http.server on a free port)"""
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+import pytest
+
+from app.webhooks import WebhookDispatcher
+
+LAST_TRADE = datetime(2024, 1, 1, 12, 0)
+
+
+class Receiver:
+    """Records every POST; replies with the queued statuses, then 200"""
+
+    def __init__(self):
+        self.requests = []  # (monotonic time, payload)
+        self.statuses = []
+        self.hold = None  # Event the next request waits on before replying
+        self.received = threading.Event()
+        self._lock = threading.Lock()
+
+    def handle(self, payload):
+        with self._lock:
+            self.requests.append((time.monotonic(), payload))
+            status = self.statuses.pop(0) if self.statuses else 200
+            hold, self.hold = self.hold, None
+        self.received.set()
+        if hold is not None:
+            hold.wait(5)
+        return status
+
+    def payloads(self):
+        with self._lock:
+            return [payload for _, payload in self.requests]
+
+    def wait_for(self, count: int, timeout: float = 5):
+        deadline = time.monotonic() + timeout
+        while len(self.payloads()) < count:
+            assert time.monotonic() < deadline, f"expected {count} requests, got {len(self.payloads())}"
+            time.sleep(0.01)
+
+
+@pytest.fixture
+def receiver():
+    state = Receiver()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.send_response(state.handle(payload))
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    state.url = f"http://127.0.0.1:{server.server_port}/hook"
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def make_dispatcher(receiver):
+    dispatchers = []
+
+    def make(**options):
+        options = {"url": receiver.url, "workers": 1, "max_retries": 3, "backoff": 0.05, "timeout": 2,
+                   "batch_size": 1, **options}
+        dispatcher = WebhookDispatcher(**options)
+        dispatchers.append(dispatcher)
+        return dispatcher
+
+    yield make
+    for dispatcher in dispatchers:
+        dispatcher.stop(timeout=1)
+
+
+def wait_idle(dispatcher, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while dispatcher.queue.unfinished_tasks:
+        assert time.monotonic() < deadline, "dispatcher did not drain"
+        time.sleep(0.01)
+
+
+def test_retries_5xx_with_exponential_backoff(receiver, make_dispatcher):
+    receiver.statuses = [503, 500]
+    dispatcher = make_dispatcher()
+
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    receiver.wait_for(3)
+    wait_idle(dispatcher)
+
+    times = [at for at, _ in receiver.requests]
+    assert times[1] - times[0] >= 0.05
+    assert times[2] - times[1] >= 0.1
+    assert [payload["trading_account_login"] for payload in receiver.payloads()] == [1, 1, 1]
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (1, 2, 0)
+
+
+def test_gives_up_after_max_retries_and_allows_the_alert_again(receiver, make_dispatcher):
+    receiver.statuses = [502] * 3
+    dispatcher = make_dispatcher(max_retries=2)
+
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    receiver.wait_for(3)
+    wait_idle(dispatcher)
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["retried"], stats["failed"]) == (0, 2, 1)
+
+    # A failed alert is not remembered, so the next cycle can send it again
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    receiver.wait_for(4)
+    wait_idle(dispatcher)
+    assert dispatcher.stats()["sent"] == 1
+
+
+def test_4xx_is_not_retried(receiver, make_dispatcher):
+    receiver.statuses = [400]
+    dispatcher = make_dispatcher()
+
+    dispatcher.submit(1, 90.0, [], LAST_TRADE)
+    receiver.wait_for(1)
+    wait_idle(dispatcher)
+    time.sleep(0.2)
+    assert len(receiver.payloads()) == 1
+    assert dispatcher.stats()["failed"] == 1
+
+
+def test_batch_mode_sends_queued_alerts_together(receiver, make_dispatcher):
+    dispatcher = make_dispatcher(batch_size=3)
+    # Hold the first delivery so the next alerts queue up behind it
+    release = receiver.hold = threading.Event()
+
+    dispatcher.submit(1, 81.0, ["hft_signal"], LAST_TRADE)
+    assert receiver.received.wait(5)
+    for login in (2, 3, 4, 5):
+        dispatcher.submit(login, 85.0, ["low_win_ratio"], None)
+    release.set()
+    receiver.wait_for(3)
+    wait_idle(dispatcher)
+
+    batches = [[alert["trading_account_login"] for alert in payload["alerts"]] for payload in receiver.payloads()]
+    assert batches == [[1], [2, 3, 4], [5]]
+    first = receiver.payloads()[0]["alerts"][0]
+    assert first == {"trading_account_login": 1, "risk_signals": ["hft_signal"], "risk_score": 81.0,
+                     "last_trade_at": LAST_TRADE.isoformat()}
+    assert dispatcher.stats()["sent"] == 5
+
+
+def test_repeated_alerts_are_suppressed(receiver, make_dispatcher):
+    dispatcher = make_dispatcher()
+
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    assert not dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    # A changed score or signal set is a new alert
+    assert dispatcher.submit(1, 92.5, ["hft_signal"], LAST_TRADE)
+    assert dispatcher.submit(1, 92.5, ["hft_signal", "high_drawdown"], LAST_TRADE)
+    # Other accounts are tracked separately
+    assert dispatcher.submit(2, 90.0, ["hft_signal"], LAST_TRADE)
+    receiver.wait_for(4)
+    wait_idle(dispatcher)
+
+    assert dispatcher.stats()["suppressed"] == 1
+    assert [(p["trading_account_login"], p["risk_score"]) for p in receiver.payloads()] == [
+        (1, 90.0), (1, 92.5), (1, 92.5), (2, 90.0)]
+
+
+def test_cleared_accounts_are_alerted_again(receiver, make_dispatcher):
+    dispatcher = make_dispatcher()
+
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    assert dispatcher.submit(2, 90.0, ["hft_signal"], LAST_TRADE)
+    # Account 1 scored under the threshold in between; account 2 stayed above it
+    dispatcher.clear([1])
+    assert dispatcher.submit(1, 90.0, ["hft_signal"], LAST_TRADE)
+    assert not dispatcher.submit(2, 90.0, ["hft_signal"], LAST_TRADE)
+
+    dispatcher.retain({1})
+    assert dispatcher.submit(2, 90.0, ["hft_signal"], LAST_TRADE)
+    receiver.wait_for(4)
+    wait_idle(dispatcher)
+    assert dispatcher.stats()["suppressed"] == 1
+
+
+def test_no_url_sends_nothing(make_dispatcher):
+    dispatcher = make_dispatcher(url="")
+    assert not dispatcher.submit(1, 90.0, [], LAST_TRADE)
+    assert dispatcher.stats()["enqueued"] == 0